@@ -6,10 +6,15 @@ Copyright (c) 2023 Regents of the University of Minnesota
 Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
 """
 
+from Sisyphus.Configuration import config
+
 import sys
 import argparse
+import atexit
 import json, json5
-from Sisyphus.HWDBUploader import Docket
+from Sisyphus.HWDBUploader import Docket, Ledger
+from Sisyphus.Utils.Metrics import metrics
+from Sisyphus.Utils.TaskGraph import DEFAULT_MAX_WORKERS
 
 def parse_args(argv):
 
@@ -20,9 +25,21 @@ def parse_args(argv):
         #(('--docket',), {"dest": "docket", "required": True, "metavar": "filename"}),
         (('--submit',), {"dest": "submit", "action": "store_true"}),
         #(('--ignore-warnings',), {"dest": "ignore", "action": "store_true"}),
+        (('--workers',), {"dest": "workers", "type": int, "default": DEFAULT_MAX_WORKERS,
+                "help": "the number of requests to send to the HWDB at the same time"}),
+        (('--incremental',), {"dest": "incremental", "action": "store_true",
+                "help": "skip rows that haven't changed since they were last submitted "
+                        "(remembered in a ledger for each server)"}),
+        (('--verify',), {"dest": "verify", "type": float, "default": 0.0, "metavar": "fraction",
+                "help": "with --incremental, check this fraction of the skipped rows "
+                        "against the HWDB anyway"}),
+        (('--metrics',), {"dest": "metrics", "metavar": "filename", "default": None,
+                "help": "write request statistics to this file on exit "
+                        "(Prometheus text for .prom/.txt, JSON otherwise)"}),
     ]
 
-    parser = argparse.ArgumentParser(description=description, add_help=True)
+    parser = argparse.ArgumentParser(description=description, add_help=True,
+                                     parents=[config.arg_parser])
 
     for args, kwargs in arg_table:
         parser.add_argument(*args, **kwargs)
@@ -30,6 +47,10 @@ def parse_args(argv):
     # THIS IS BROKEN... I want to pass argv to it, but it just doesn't behave the same.
     # but I don't need to fix this right now.
     args = parser.parse_args()
+
+    if args.metrics:
+        atexit.register(metrics.write, args.metrics)
+
     return args
 
 
@@ -54,10 +75,17 @@ def main(argv):
         docket_def = _locals["contents"]
     
     docket = Docket(docket_def)
+    if args.incremental:
+        docket.ledger = Ledger.from_config()
+        docket.ledger_verify = args.verify
 
     docket.process_sources()
+    if args.incremental:
+        stats = docket.ledger_stats
+        print(f"{stats['skipped']} unchanged rows skipped, {stats['verified']} checked "
+              f"against the HWDB ({stats['mismatched']} didn't match)")
     if args.submit:
-        docket.update_hwdb()
+        docket.update_hwdb(max_workers=args.workers)
     else:
         docket.display_plan()
 
@@ -39,10 +39,10 @@ def parse(command_line_args=sys.argv):
 def check_server(config):
     # we wait until here to import because we want to process arguments and 
     # update the configuration before accessing the HWDB.
-    from Sisyphus.RestApiV1 import session, whoami
+    from Sisyphus.RestApiV1 import get_session, whoami
 
-    # if the config is invalid or incomplete, "session" will be None
-    if session is None:
+    # if the config is invalid or incomplete, there won't be a session
+    if get_session() is None:
         msg = "Server check not attempted"
         config.logger.info(msg)
     else:
@@ -92,6 +92,11 @@ def show_summary(config):
         else:
             print(f"cert status:  Expires in {config.cert_days_left} days")
     
+    if config.response_cache:
+        print(f"cache:        on, in {config.cache_root}")
+    else:
+        print( "cache:        off (use '--cache' to turn it on)")
+
     #print(f"server check: {check_server(config)}")
     sys.stdout.write("server check: (please wait)")
     sys.stdout.flush()
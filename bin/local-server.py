@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+bin/local-server.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.Utils.Terminal import Style
+import sys
+import argparse
+
+style_notice = Style.fg("royalblue")
+
+def parse(command_line_args=sys.argv):
+    parser = argparse.ArgumentParser(
+        add_help=True,
+        description='Runs an in-memory stand-in for the HWDB REST API, '
+                    'for testing and benchmarking')
+
+    group = parser.add_argument_group(
+                'Server Options',
+                'The fault options make the server behave like a slow or '
+                'unreliable network.')
+
+    group.add_argument('--host',
+                        dest='host',
+                        metavar='<address>',
+                        default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    group.add_argument('--port',
+                        dest='port',
+                        metavar='<port>',
+                        type=int,
+                        default=8443,
+                        help='port to listen on (default: 8443)')
+    group.add_argument('--latency',
+                        dest='latency',
+                        metavar='<seconds>',
+                        type=float,
+                        default=0.0,
+                        help='wait this long before answering each request')
+    group.add_argument('--latency-jitter',
+                        dest='latency_jitter',
+                        metavar='<seconds>',
+                        type=float,
+                        default=0.0,
+                        help='wait up to this much longer, chosen at random')
+    group.add_argument('--error-rate',
+                        dest='error_rate',
+                        metavar='<fraction>',
+                        type=float,
+                        default=0.0,
+                        help='fraction of requests that fail with --error-status')
+    group.add_argument('--error-status',
+                        dest='error_status',
+                        metavar='<code>',
+                        type=int,
+                        default=503,
+                        help='HTTP status code for injected errors (default: 503)')
+    group.add_argument('--seed',
+                        dest='seed',
+                        metavar='<n>',
+                        type=int,
+                        default=None,
+                        help='random seed, to repeat a run exactly')
+
+    args, unknowns = parser.parse_known_args(command_line_args[1:])
+    return args
+
+def main():
+    args = parse()
+
+    server = LocalServer(args.host, args.port,
+                         latency=args.latency,
+                         latency_jitter=args.latency_jitter,
+                         error_rate=args.error_rate,
+                         error_status=args.error_status,
+                         seed=args.seed)
+    server.start()
+
+    print(style_notice(f"Local HWDB server listening at https://{server.rest_api}"))
+    print("To use it, run scripts with:")
+    print(f"    --rest-api {server.rest_api} --cert-type pem --cert {server.certificate}")
+    print("and trust its certificate with:")
+    print(f"    export REQUESTS_CA_BUNDLE={server.certificate}")
+    print("Press Ctrl-C to stop.")
+
+    server.serve_forever()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,8 +11,10 @@ import json5 as json
 import json as classic_json
 import os
 import socket
-import pandas as pd
 import argparse
+import atexit
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from copy import copy, deepcopy
 from glob import glob
 import ast
@@ -25,10 +27,14 @@ from Sisyphus.Configuration import config
 logger = config.getLogger()
 
 from Sisyphus import RestApi as api
-from Sisyphus.RestApi.Multi import ItemList
+import Sisyphus.RestApiV1.Utilities as ut
 
 from Sisyphus.RestApi import Lookup
 from Sisyphus.Utils.Terminal import Style
+from Sisyphus.Utils.Metrics import metrics
+from Sisyphus.Utils.ChunkSize import AdaptiveChunkSize
+import Sisyphus.Utils.SheetReader as SheetReader
+from contextlib import closing
 
 def dj(colorfn, obj):
     print(colorfn(classic_json.dumps(obj, indent=4)))
@@ -64,6 +70,57 @@ style_error = Style.fg("red")
 style_success = Style.fg("green")
 style_debug = Style.fg("magenta")
 
+# New items that share an institution, manufacturer, and country are created
+# with bulk-add when there are at least this many of them. Their serial numbers
+# and specifications are then set with up to UPLOAD_WORKERS patches at once.
+BULK_THRESHOLD = 3
+UPLOAD_WORKERS = 10
+
+# Number of processes for checking and reading source files when a docket
+# has several of them (None means one per CPU). See SheetReader.map_files.
+PARSE_PROCESSES = None
+
+def _iter_source_rows(filename, sheet, file_type):
+    # Read the sheet a batch at a time rather than all at once, so that
+    # only one batch of rows is in memory. Row numbers keep counting across
+    # batches.
+    #
+    # convert_dtypes() only sees one batch, so a column of numbers can come
+    # out Int64 in one batch and Float64 in another, and its values would
+    # be written as 1 in one and 1.0 in the other. A column that is Float64
+    # in the first batch is kept Float64 in the rest. (A column that only
+    # turns out to have fractions after the first batch can't be changed
+    # back, so its whole numbers in the first batch stay as 1.)
+    from pandas.api.types import is_float_dtype, is_integer_dtype
+    dtypes = None
+    for data in SheetReader.iter_batches(filename, sheet, file_type=file_type):
+        data = data.convert_dtypes()
+        if dtypes is None:
+            dtypes = data.dtypes
+        for column, dtype in dtypes.items():
+            if (column in data.columns and is_float_dtype(dtype)
+                    and is_integer_dtype(data[column].dtype)):
+                data[column] = data[column].astype(dtype)
+        yield from classic_json.loads(data.transpose().to_json()).values()
+
+def _read_source_rows(filename, sheet, file_type):
+    # Read a whole source in a worker process, and hand back the column names
+    # and a list of values for each row rather than a dict for each row
+    columns = None
+    rows = []
+    for row in _iter_source_rows(filename, sheet, file_type):
+        if columns is None:
+            columns = list(row.keys())
+        rows.append(list(row.values()))
+    return columns, rows
+
+def _check_source_file(filename, sheet, file_type):
+    # Make sure the file (and sheet) can be read, by reading the first row
+    with closing(SheetReader.iter_batches(filename, sheet, 
+                    batch_size=1, file_type=file_type)) as batches:
+        next(batches, None)
+    return filename
+
 
 class Docket:
     def __init__(self, filename=None):
@@ -177,17 +234,38 @@ class Docket:
                 
         #print(style_debug(set(self.hwitems.keys())))
         
-        hwitem_list = ItemList(self.type_id, block=False, serial_numbers = set(self.hwitems.keys()))
-        try:
-            hwitem_list.wait()
-        except ItemList.Abandon:
-            print(style_error("There was an error fetching existing items of the given type. If this occurs on DEV,"
-                              "it may indicate that older items may have been added in the past that have become "
-                              "incompatible with more recent REST API changes. It may be possible to ignore this error."))
+        # Find the part IDs for just the serial numbers in the docket (rather 
+        # than crawling every item of the type), then get their details
+        def get_details(part_id):
+            resp = api.get_component(part_id)
+            if resp["status"] != "OK":
+                raise RuntimeError(f"Error getting {part_id}")
+            return resp["data"]
+
+        # The docket's serial numbers may be numbers rather than strings, so
+        # the items found are filed under the docket's own keys
+        docket_keys = {}
+
+        # Each item is compared with the manifest as soon as it (and the ones
+        # before it) have arrived, rather than after all of them are in
+        def fetch_hwitems():
+            try:
+                part_ids = ut.resolve_serial_numbers(self.type_id, self.hwitems.keys(),
+                                                     max_workers=UPLOAD_WORKERS)
+                docket_keys.update({part_id: hwitem_id for hwitem_id, part_id in part_ids.items()
+                                        if part_id is not None})
+                with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+                    yield from executor.map(get_details,
+                            [part_id for part_id in part_ids.values() if part_id is not None])
+            except (RuntimeError, ValueError) as exc:
+                logger.error(f"Error fetching existing items: {exc}")
+                print(style_error("There was an error fetching existing items of the given type. If this occurs on DEV,"
+                                  "it may indicate that older items may have been added in the past that have become "
+                                  "incompatible with more recent REST API changes. It may be possible to ignore this error."))
 
-        #print(style_debug(hwitem_list.results))
         hwitems_found = 0
-        for hwitem in hwitem_list.results:
+        result_ids = set()
+        for hwitem in fetch_hwitems():
             hwitem_record = {}
             hwitem_record[_IN_DATABASE] = True
             external_id = hwitem_record["External ID"] = hwitem["part_id"] 
@@ -203,19 +281,20 @@ class Docket:
             else:
                 hwitem_record["Manufacturer"] = None
             
-            hwitem_record["Serial Number"] = hwitem["serial_number"]
+            hwitem_record["Serial Number"] = docket_keys.get(hwitem["part_id"], hwitem["serial_number"])
             hwitem_record["Batch ID"] = hwitem["batch"]
             hwitem_record["Specifications"] = hwitem["specifications"][0]
             #print(cyan(classic_json.dumps(hwitem_record, indent=4)))
 
             hwitem_id = hwitem_record["Serial Number"] 
+            result_ids.add(hwitem_id)
             
             if hwitem_id in self.hwitems.keys():
                 print(style_info(f"    found {self.hwitem_key} \"{hwitem_id}\" (External ID = {external_id})"))
                 hwitems_found += 1
                 
             if hwitem_id in self.hwitems.keys() and self.hwitems[hwitem_id][_IN_MANIFEST]:
-                dumptofile(os.path.join(self.docketdir, hwitem_id.replace("/","_")+".json"), self.hwitems[hwitem_id])
+                dumptofile(os.path.join(self.docketdir, str(hwitem_id).replace("/","_")+".json"), self.hwitems[hwitem_id])
                 self.hwitems[hwitem_id][_IN_DATABASE] = True
                 self.hwitems[hwitem_id]["External ID"] = external_id 
                 #print(self.hwitems[hwitem_id])
@@ -264,7 +343,6 @@ class Docket:
             #print(style_debug(f"{external_id}"))
             self.hwitems[hwitem_id]["External ID"] = external_id
             self.hwitems[hwitem_id][_IN_DATABASE] = True
-        result_ids = [x["serial_number"] for x in hwitem_list.results]
         
         #print(style_debug(self.hwitems.items()))
         for hwitem_id, hwitem in self.hwitems.items():
@@ -296,53 +374,19 @@ class Docket:
         #print(style_notice("self.hwitems just before upload:"))
         #dj(style_warning, self.hwitems)
         
+        if SIMULATE_ONLY:
+            created = {hwitem_id: "<simulated>" for hwitem_id in self._new_components()}
+        else:
+            created = self._create_new_hwitems()
+
         for hwitem_id, hwitem in self.hwitems.items():
             
             external_id = None
             
             if hwitem.get(_IN_MANIFEST, False) and not hwitem.get(_IN_DATABASE, False):
-            
-                new_component = \
-                    {
-                        "component_type": 
-                        {
-                            "part_type_id": self.type_id,
-                        },
-                        "country_code": Lookup.Country(hwitem["Country"]),
-                        "institution": 
-                        {
-                            "id": Lookup.Institution(hwitem["Institution"])
-                        },
-                        "manufacturer": 
-                        {
-                            "id": Lookup.Manufacturer(hwitem["Manufacturer"])
-                        },
-                        "serial_number": hwitem.get("Serial Number", None),
-                        "batch_id": hwitem.get("Batch ID", None),
-                        "specifications": hwitem["Specifications"]
-                    }
-                       
-                
-                if SIMULATE_ONLY:
-                    resp = {"part_id": "<simulated>"}
-                    success = True
-                else:
-                    resp = api.post_component(self.type_id, new_component)
-                    success = resp["status"] == "OK"
-    
-    
-                if success:
-                    external_id = resp["part_id"]
-                    print(style_success(f"Item {hwitem_id} was added successfully and assigned external id {external_id}"))
-                else:
-                    print(style_error(f"Item {hwitem_id} failed to upload."))
-                    
-                    print(style_error("The message from the REST API is as follows:"))
-                    print(style_error(classic_json.dumps(resp, indent=4)))
-                    
-                    
-                    #print(classic_json.dumps(resp, indent=4))
-                    external_id = None
+
+                external_id = created.get(hwitem_id, None)
+                if external_id is None:
                     continue
             
             else:
@@ -385,7 +429,145 @@ class Docket:
                     
         print()        
         
-    def _process_source(self, source, scan_only=False, tests_only=False):
+    def _new_components(self):
+        new_components = {}
+        for hwitem_id, hwitem in self.hwitems.items():
+            if hwitem.get(_IN_MANIFEST, False) and not hwitem.get(_IN_DATABASE, False):
+                new_components[hwitem_id] = \
+                    {
+                        "component_type": 
+                        {
+                            "part_type_id": self.type_id,
+                        },
+                        "country_code": Lookup.Country(hwitem["Country"]),
+                        "institution": 
+                        {
+                            "id": Lookup.Institution(hwitem["Institution"])
+                        },
+                        "manufacturer": 
+                        {
+                            "id": Lookup.Manufacturer(hwitem["Manufacturer"])
+                        },
+                        "serial_number": hwitem.get("Serial Number", None),
+                        "batch_id": hwitem.get("Batch ID", None),
+                        "specifications": hwitem["Specifications"]
+                    }
+        return new_components
+
+    def _create_new_hwitems(self):
+        '''Add the new items to the HWDB and return {hwitem_id: external_id}
+
+        Items that share an institution, manufacturer, and country are
+        created together with bulk-add, in chunks whose size adapts to how
+        quickly the server responds, and then get their serial numbers and
+        specifications from patches that are sent in parallel. Items in
+        smaller groups, or with a Batch ID (which bulk-add can't set), are
+        posted one at a time as before, and so are items whose
+        specifications the HWDB would refuse, so that they are refused
+        cleanly. Items that fail are left out of the result. Bulk-added
+        items whose patch fails exist without a serial number, so they are
+        listed at the end to be fixed by hand.
+        '''
+        new_components = self._new_components()
+
+        groups = {}
+        for hwitem_id, new_component in new_components.items():
+            problems = ut.check_specifications(new_component["specifications"],
+                                               self.hwitem_datasheet)
+            if len(problems) > 0:
+                logger.warning(f"Item {hwitem_id} will be posted by itself, since its "
+                               f"specifications are invalid: {'; '.join(problems)}")
+                groups.setdefault(None, []).append(hwitem_id)
+                continue
+            group_key = (new_component["country_code"],
+                         new_component["institution"]["id"],
+                         new_component["manufacturer"]["id"],
+                         new_component["batch_id"])
+            groups.setdefault(group_key, []).append(hwitem_id)
+
+        def set_up(part_id, new_component):
+            data = {
+                "part_id": part_id,
+                "serial_number": new_component["serial_number"],
+                "specifications": new_component["specifications"],
+                "manufacturer": new_component["manufacturer"],
+            }
+            resp = api.patch_component(part_id, data)
+            resp["part_id"] = part_id
+            return resp
+
+        chunk_size = AdaptiveChunkSize()
+        created = {}
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = {}
+            for group_key, hwitem_ids in groups.items():
+                country_code, institution_id, manufacturer_id, batch_id = group_key or (None,) * 4
+                if group_key is None or len(hwitem_ids) < BULK_THRESHOLD or batch_id is not None:
+                    for hwitem_id in hwitem_ids:
+                        future = executor.submit(api.post_component, self.type_id,
+                                                 new_components[hwitem_id])
+                        futures[future] = (hwitem_id, None)
+                    continue
+
+                print(style_info(f"Bulk adding {len(hwitem_ids)} items"))
+                remaining = list(hwitem_ids)
+                for count in chunk_size.chunks(len(hwitem_ids)):
+                    chunk, remaining = remaining[:count], remaining[count:]
+                    data = {
+                        "component_type": {"part_type_id": self.type_id},
+                        "country_code": country_code,
+                        "institution": {"id": institution_id},
+                        "manufacturer": {"id": manufacturer_id},
+                        "count": count,
+                    }
+                    start = time.perf_counter()
+                    resp = api.post_bulk_components(self.type_id, data)
+                    if resp["status"] != "OK":
+                        chunk_size.failed()
+                        for hwitem_id in chunk:
+                            print(style_error(f"Item {hwitem_id} failed to upload."))
+                        print(style_error("The message from the REST API is as follows:"))
+                        print(style_error(classic_json.dumps(resp, indent=4)))
+                        continue
+                    chunk_size.record(count, time.perf_counter() - start)
+
+                    for hwitem_id, node in zip(chunk, resp["data"]):
+                        future = executor.submit(set_up, node["part_id"],
+                                                 new_components[hwitem_id])
+                        futures[future] = (hwitem_id, node["part_id"])
+
+            orphans = []
+            for future in as_completed(futures):
+                hwitem_id, bulk_part_id = futures[future]
+                try:
+                    resp = future.result()
+                except Exception as exc:
+                    resp = {"status": "ERROR", "data": str(exc)}
+                if resp["status"] != "OK" and bulk_part_id is not None:
+                    orphans.append((hwitem_id, bulk_part_id))
+                if resp["status"] == "OK":
+                    external_id = created[hwitem_id] = resp["part_id"]
+                    print(style_success(f"Item {hwitem_id} was added successfully and assigned external id {external_id}"))
+                else:
+                    print(style_error(f"Item {hwitem_id} failed to upload."))
+                    
+                    print(style_error("The message from the REST API is as follows:"))
+                    print(style_error(classic_json.dumps(resp, indent=4)))
+
+        if orphans:
+            print(style_error("These items were created, but could not be given their "
+                              "serial numbers, so they must be fixed by hand:"))
+            for hwitem_id, part_id in orphans:
+                serial_number = new_components[hwitem_id]["serial_number"]
+                print(style_error(f"    {part_id} should have serial number {serial_number}"))
+            logger.error(f"bulk-added items without serial numbers: {orphans}")
+
+        return created
+
+    def _process_source(self, source, scan_only=False, tests_only=False, rows=None):
+        # 'rows' is what _read_source_rows returned for this source, if it
+        # was already read by a worker process. Otherwise, the rows are read
+        # from the file here.
        
         empty_hwitem = {
             _IN_MANIFEST: False,
@@ -398,8 +580,6 @@ class Docket:
             "Specifications": {}
         }
         
-        data = source["data"]
-        data = data.convert_dtypes()
         encoder = source["encoder"]
         
         if DKW_TEST_NAME in encoder.keys():
@@ -436,10 +616,11 @@ class Docket:
             
         hwitems = self.hwitems = getattr(self, "hwitems", {})
 
-        columns = list(data.columns)
-        
-        df1 = json.loads(data.transpose().to_json())
-        df = list(df1.values())
+        if rows is None:
+            df = _iter_source_rows(source["file"], source["sheet"], source["file_type"])
+        else:
+            columns, values = rows
+            df = (dict(zip(columns, row_values)) for row_values in values)
         
         #print(classic_json.dumps(df, indent=4))
         self.hwitem_key = hwitem_key = encoder[DKW_ITEM_IDENTIFIER]
@@ -485,7 +666,7 @@ class Docket:
                 if row[hwitem_key] is not None:
                     #print(cyan(f"row {row_index} has an item key"))
                     for k in hwitem.keys():
-                        if k in columns:
+                        if k in row:
                             hwitem[k] = row[k]
                 root_node = hwitem["Specifications"] = hwitem.get("Specifications", {})
             else:
@@ -625,8 +806,23 @@ class Docket:
         self.hwitems = getattr(self, "hwitems", {})
         #self.tests = {}
         
-        for source in self.sources:
-            self._process_source(source, scan_only, tests_only)
+        sources = [source for source in self.sources
+                        if not tests_only or DKW_TEST_NAME in source["encoder"].keys()]
+        
+        # With enough sources (e.g., a glob matching many files), read them
+        # in a pool of processes. They're still processed here, one at a time
+        # and in order. With only a few, each is read a batch at a time as
+        # it's processed.
+        if len(sources) >= SheetReader.POOL_MIN_JOBS:
+            source_rows = SheetReader.map_files(_read_source_rows,
+                        [(source["file"], source["sheet"], source["file_type"]) 
+                            for source in sources],
+                        max_workers=PARSE_PROCESSES)
+        else:
+            source_rows = (None for source in sources)
+        
+        for source, rows in zip(sources, source_rows):
+            self._process_source(source, scan_only, tests_only, rows)
          
          
         if scan_only:
@@ -779,7 +975,8 @@ class Docket:
 
 
             # TBD: should we validate the datasheet?
-            #self.hwitem_datasheet = resp["data"]["properties"]["specifications"][0]["datasheet"]
+            # (it's used to keep items that would be refused out of bulk-add)
+            self.hwitem_datasheet = resp["data"]["properties"]["specifications"][0]["datasheet"]
             self.available_manufacturers = resp["data"]["manufacturers"]
         
         def validate_sources():
@@ -814,7 +1011,7 @@ class Docket:
                     ]
                 fileresults = []
                 for name in candidates:
-                    globbed = glob(name)
+                    globbed = sorted(glob(name))
                     for globname in globbed:
                         if os.path.isfile(globname):
                             fileresults.append(globname)
@@ -828,19 +1025,13 @@ class Docket:
                 #print(cyan(fileresults))
                 
                 for fullname in fileresults:
-                    # Try to read the file
-                    data = None
-                    try:
-                        if fullname.endswith(".xlsx") or fullname.endswith(".ods"):
-                            sheet = source_node.get("Sheet", 0)
-                            data = pd.read_excel(fullname, sheet_name=sheet)
-                        else: # assume it's a csv file
-                            data = pd.read_csv(fullname)
-                    except Exception:
-                        msg = f"Could not read {fullname}"
-                        logger.error(msg)
-                        print(style_error(msg))
-                        raise Exception(msg)
+                    # The file is checked below, once all the files are known
+                    if fullname.endswith(".xlsx") or fullname.endswith(".ods"):
+                        file_type = SheetReader.EXCEL
+                        sheet = source_node.get("Sheet", 0)
+                    else: # assume it's a csv file
+                        file_type = SheetReader.CSV
+                        sheet = None
     
                     # Locate the encoding
                     # TBD: future: default encoding?
@@ -915,10 +1106,27 @@ class Docket:
                         {
                             "definition": source_node,
                             "file": fullname,
-                            "data": data,
+                            "file_type": file_type,
+                            "sheet": sheet,
                             "encoder": encoder
                         })
                     
+            # Make sure each file (and sheet) can be read. Only the first row
+            # is read here. The rest is read when the source is processed. If
+            # there are a lot of files, they're checked by a pool of processes.
+            checks = SheetReader.map_files(_check_source_file,
+                        [(source["file"], source["sheet"], source["file_type"]) 
+                            for source in self.sources],
+                        max_workers=PARSE_PROCESSES)
+            for source in self.sources:
+                try:
+                    next(checks)
+                except Exception:
+                    msg = f"Could not read {source['file']}"
+                    logger.error(msg)
+                    print(style_error(msg))
+                    raise Exception(msg)
+
             #print(list(self.sources[0].keys()))
             #sys.exit()
 
@@ -955,13 +1163,20 @@ def parse_args():
         #(('--docket',), {"dest": "docket", "required": True, "metavar": "filename"}),
         (('--submit',), {"dest": "submit", "action": "store_true"}),
         (('--ignore-warnings',), {"dest": "ignore", "action": "store_true"}),
+        (('--metrics',), {"dest": "metrics", "metavar": "filename", "default": None,
+                "help": "write request statistics to this file on exit "
+                        "(Prometheus text for .prom/.txt, JSON otherwise)"}),
     ]
     
-    parser = argparse.ArgumentParser(description=description)
+    parser = argparse.ArgumentParser(description=description, parents=[config.arg_parser])
     
     for args, kwargs in arg_table:
         parser.add_argument(*args, **kwargs)
     args = parser.parse_args()
+
+    if args.metrics:
+        atexit.register(metrics.write, args.metrics)
+
     return args
 
 def main():
@@ -17,7 +17,7 @@ import argparse
 import subprocess
 import tempfile
 import re
-import OpenSSL
+import threading
 from datetime import datetime
 
 import logging
@@ -36,6 +36,7 @@ APPLICATION_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), "../
 CONFIG_ROOT = os.path.normpath(os.path.expanduser("~/.sisyphus"))
 CONFIG_BASENAME = "config.json"
 LOGGING_BASENAME = "logging.json"
+CACHE_DIRNAME = "cache"
 
 KW_DEFAULT_PROFILE = "default profile"
 KW_PROFILES = "profiles"
@@ -50,6 +51,7 @@ KW_COUNTRY_CODE = "country code"
 KW_ID = "id"
 KW_LOGGING = "logging"
 KW_LOGLEVEL = "loglevel"
+KW_RESPONSE_CACHE = "response cache"
 
 class Config:
     def __init__(self, *, 
@@ -142,6 +144,14 @@ class Config:
     def default_profile(self):
         return self.config_data[KW_DEFAULT_PROFILE]
 
+    @property
+    def response_cache(self):
+        return self.active_profile[KW_RESPONSE_CACHE]
+
+    @property
+    def cache_root(self):
+        return os.path.join(self.config_root, CACHE_DIRNAME)
+
     def _extract_cert_info(self):
         self.logger.debug("Extracting certificate information")
             
@@ -159,6 +169,8 @@ class Config:
             return 
 
  
+        # OpenSSL is slow to import, so don't do it until there's a certificate
+        import OpenSSL.crypto
         with open(self.active_profile[KW_CERTIFICATE], "r") as fp:
             ce = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, fp.read())
         
@@ -374,6 +386,22 @@ class Config:
             active_profile[KW_REST_API] = active_profile.get(KW_REST_API, DEFAULT_API)
 
         self.logger.debug(f"using rest api '{active_profile[KW_REST_API]}'")
+
+        # should responses from the REST API be cached on disk?
+        if self.args.cache and self.args.no_cache:
+            err_msg = "Error: --cache and --no-cache are mutually exclusive"
+            self.logger.error(err_msg)
+            raise ValueError(err_msg)
+
+        if self.args.cache:
+            active_profile[KW_RESPONSE_CACHE] = True
+        elif self.args.no_cache:
+            active_profile[KW_RESPONSE_CACHE] = False
+        else:
+            active_profile[KW_RESPONSE_CACHE] = active_profile.get(KW_RESPONSE_CACHE, False)
+
+        # this one is never saved to the profile
+        self.refresh_cache = self.args.refresh_cache
         
         # let's figure out the certificate situation...
         # 0) if --cert is provided without --cert-type, it will guess based on the
@@ -549,6 +577,24 @@ class Config:
                                   'any country to the configuration')
         '''
         
+        group.add_argument('--cache',
+                            dest='cache',
+                            action='store_true',
+                            required=False,
+                            help='cache rarely-changing data from the REST API (component '
+                                 'and test type definitions, institutions, etc.) in '
+                                 f'{os.path.join(CONFIG_ROOT, CACHE_DIRNAME)}')
+        group.add_argument('--no-cache',
+                            dest='no_cache',
+                            action='store_true',
+                            required=False,
+                            help='do not use the REST API cache')
+        group.add_argument('--refresh-cache',
+                            dest='refresh_cache',
+                            action='store_true',
+                            required=False,
+                            help='ignore anything already in the REST API cache and '
+                                 'fetch it again')
         group.add_argument('--profile',
                             dest='profile',
                             metavar='<profile-name>',
@@ -642,6 +688,61 @@ class Config:
         }
         return logging_data
     
+class _LazyConfig:
+    '''A stand-in for the Config object that creates it on first use
+
+    Creating a Config parses the command line, reads the configuration and
+    logging files, and examines the certificate, which is too much to do 
+    just because a module was imported. Modules get this object as
+    'config' instead, and the real Config is created the first time
+    anything other than getLogger() is used.
+    '''
+
+    def __init__(self):
+        object.__setattr__(self, "_config", None)
+        object.__setattr__(self, "_lock", threading.RLock())
+        object.__setattr__(self, "_logger_names", set())
+
+    def _load(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    cfg = Config()
+                    object.__setattr__(self, "_config", cfg)
+                    
+                    # Loggers handed out earlier were created before logging
+                    # was configured, so they need the profile's log level, 
+                    # and must not be left disabled by dictConfig.
+                    for name in self._logger_names:
+                        cfg.getLogger(name).disabled = False
+        return self._config
+
+    def getLogger(self, name="config"):
+        if self._config is not None:
+            return self._config.getLogger(name)
+        with self._lock:
+            self._logger_names.add(name)
+        return logging.getLogger(name)
+
+    @property
+    def loaded(self):
+        '''True if the real Config has been created'''
+        return self._config is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __repr__(self):
+        if self._config is None:
+            return "<Config (not loaded)>"
+        return repr(self._config)
+
 def run_tests():
     #test_path = os.path.join(APPLICATION_PATH, "test/Sisyphus/Config/test_Config.py")
     #print(APPLICATION_PATH)
@@ -652,7 +753,7 @@ def run_tests():
 if __name__ == '__main__':
     run_tests()
 else:
-    config = Config()
+    config = _LazyConfig()
 
 #logger.info("exiting module")
 
@@ -12,15 +12,20 @@ logger = config.getLogger()
 
 import Sisyphus.RestApiV1 as ra
 import Sisyphus.RestApiV1.Utilities as ut
+from Sisyphus.Utils.TaskGraph import TaskGraph, DEFAULT_MAX_WORKERS
+from Sisyphus.Utils.ChunkSize import AdaptiveChunkSize
+import Sisyphus.Utils.SheetReader as SheetReader
+from Sisyphus.HWDBUploader._Ledger import Ledger
 
 import json
 import sys
-import numpy as np
-import pandas as pd
 from glob import glob
 import os
 from copy import deepcopy
 import re
+import threading
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Dictionary keys for Docket files
 DKT_DOCKET_NAME = "Docket Name"
@@ -99,32 +104,38 @@ class _SN_Lookup:
     def __call__(cls, part_type_id, serial_number):
         logger.debug(f"looking up {part_type_id}:{serial_number}")
         if (part_type_id, serial_number) not in cls._cache.keys():
-            resp = ra.get_hwitems(part_type_id, serial_number=serial_number)
-            if resp[RA_STATUS] != RA_STATUS_OK:
-                msg = f"Error looking up serial number '{serial_number}' for " \
-                            "part type '{part_type_id}'"
-                logger.error(msg)
-                raise ValueError(msg)
-            if len(resp[RA_DATA]) == 1:
-                part_id = resp[RA_DATA][0][RA_PART_ID]
+            part_id = ut.resolve_serial_numbers(part_type_id, [serial_number])[serial_number]
+            if part_id is not None:
                 data = get_hwitem_complete(part_id)  
                 cls._cache[part_type_id, serial_number] = part_id, data
-
-            elif len(resp[RA_DATA]) == 0:
+            else:
                 cls._cache[part_type_id, serial_number] = None
-            elif len(resp[RA_DATA]) > 1:
-                msg = f"Serial number '{serial_number}' for part type '{part_type_id}' " \
-                            "is assigned to {len(resp[RA_DATA])} parts."
-                logger.error(msg)
-                raise ValueError(msg)
         return cls._cache[part_type_id, serial_number]
     @classmethod
+    def prefetch(cls, part_type_id, serial_numbers, max_workers=DEFAULT_MAX_WORKERS):
+        # Look up many serial numbers at once, so that later calls don't
+        # need to make any requests
+        serial_numbers = [serial_number for serial_number in serial_numbers
+                            if (part_type_id, serial_number) not in cls._cache.keys()]
+        part_ids = ut.resolve_serial_numbers(part_type_id, serial_numbers,
+                                             max_workers=max_workers)
+        found = {serial_number: part_id for serial_number, part_id in part_ids.items()
+                    if part_id is not None}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (serial_number, part_id), data in zip(found.items(),
+                            executor.map(get_hwitem_complete, found.values())):
+                cls._cache[part_type_id, serial_number] = part_id, data
+        for serial_number, part_id in part_ids.items():
+            if part_id is None:
+                cls._cache[part_type_id, serial_number] = None
+    @classmethod
     def update(cls, part_type_id, serial_number, data):
         cls._cache[(part_type_id, serial_number)] = (data[RA_PART_TYPE_ID], data)
     @classmethod
     def delete(cls, part_type_id, serial_number):
         if (part_type_id, serial_number) in cls._cache.keys():
             del cls._cache[(part_type_id, serial_number)]
+        ut.forget_serial_number(part_type_id, serial_number)
 
 SN_Lookup = _SN_Lookup()
 
@@ -135,6 +146,17 @@ class Docket:
 
         self.terminate_on_error = True
 
+        # New items that share a type, institution, manufacturer, and country
+        # are created with bulk-add when there are at least this many of them
+        # (None to always post them one at a time). The chunk size is shared by
+        # all the bulk-adds, so that they adapt to the server together.
+        self.bulk_threshold = 3
+        self.bulk_chunk_size = AdaptiveChunkSize()
+        # Items that bulk-add created but that couldn't be given their
+        # serial numbers, as (part_id, "TYPEID:SN"). A later run can't find
+        # them, so they have to be fixed by hand.
+        self.orphaned_hwitems = []
+
         # Global values for docket
         self.values = {}
 
@@ -153,10 +175,48 @@ class Docket:
         self.attach_hwitem_images = []     
         self.new_tests = []
         self.attach_test_images = []     
+
+        # Where each provisional ID ("TYPEID:SN") for a new item is used in
+        # the operations above, as (dict, key) pairs, so that it can be
+        # replaced quickly once the item has a part ID
+        self._references = {}
  
-        # Cache of Excel/CSV files
+        # File type and sheet names of each Excel/CSV file
         self._file_cache = {}
 
+        # Sheets are read self.batch_size rows at a time, by up to 
+        # self.max_processes processes (None means one per CPU) when there
+        # are several files. See SheetReader.
+        self.batch_size = SheetReader.DEFAULT_BATCH_SIZE
+        self.max_processes = None
+
+        # Things looked up while processing sources. These are filled all at
+        # once by _prefetch before the sheets are processed.
+        self.max_workers = DEFAULT_MAX_WORKERS
+        self._type_id_cache = {}    # type name -> (full name, type ID)
+        self._type_defs_cache = {}  # type ID -> lookup_component_type_defs()
+        self._hwitem_cache = {}     # part ID -> get_hwitem_complete()
+        self._planned_hwitems = {}  # part ID -> the item as the plan leaves it
+
+        # A Ledger of the rows that were last sent for each item, if any.
+        # Rows that haven't changed since then are skipped without asking
+        # the HWDB about them. A fraction 'ledger_verify' of those rows are
+        # checked against the HWDB anyway, and are updated if they don't
+        # match. Rows that are sent are recorded as soon as the last request
+        # for their item succeeds.
+        self.ledger = None
+        self.ledger_verify = 0.0
+        self.ledger_stats = {"skipped": 0, "verified": 0, "mismatched": 0}
+        self._ledger_decisions = {}  # (part ID, hash) -> True to skip the row
+        self._ledger_repeated = set()  # part IDs of items with more than one row
+        self._ledger_pending = {}    # item ID -> (hash, "TYPEID:SN")
+
+        # The operations run by the last call to update_hwdb(), and locks
+        # for the threads running them
+        self.task_graph = None
+        self._plan_lock = threading.RLock()
+        self._print_lock = threading.Lock()
+
         # Multiple Dockets can be aggregated and sometimes need to be assigned
         # names, if they are unnamed. The docket counter is used to assign them
         # a name.
@@ -187,8 +247,62 @@ class Docket:
         self._parse_encoder(dkt)
 
 
+    @classmethod
+    def df_columns(cls, df, col_names, context={}):
+        # Same as calling df_coalesce (see below) for every row, but a column
+        # at a time. Returns {col_name: [value for each row]}.
+        columns = {}
+        for col_name in dict.fromkeys(col_names):
+            if col_name in df.columns:
+                column = df[col_name]
+                # Converting to object first turns numpy scalars into plain
+                # Python values, so there's no need to check for np.int64
+                columns[col_name] = column.astype(object).where(column.notna(), "").tolist()
+            else:
+                columns[col_name] = [context.get(col_name, None)] * len(df)
+        return columns
+
+    @staticmethod
+    def _parse_enabled(column):
+        # Turn the values from the "Enabled" column into True/False. Each
+        # distinct value only needs to be parsed once.
+        def parse(value):
+            if value is None:
+                # if it's None, then default to Enable being true.
+                return True
+            if str(value).lower() in ['0', 'false', 'no', '']:
+                return False
+            elif str(value).lower() in ['1', 'true', 'yes']:
+                return True
+            else:
+                raise ValueError("Enabled could not be cast as a boolean value")
+
+        parsed = {}
+        result = []
+        for value in column:
+            key = (type(value), value)
+            if key not in parsed:
+                parsed[key] = parse(value)
+            result.append(parsed[key])
+        return result
+
+    @staticmethod
+    def _parse_subcomponents(column, subcomp_type_id):
+        # Subcomponents may be given as a part ID, or as a serial number of
+        # the type that the connector takes, which becomes "TYPEID:SN".
+        # Empty cells mean there's no subcomponent.
+        import pandas as pd
+        series = pd.Series(column, dtype=object)
+        empty = series.isna() | (series == "")
+        is_part_id = series.astype(str).str.match(r"^[A-Za-z][0-9]{11}-[0-9]{5}$")
+        return [None if is_empty else (value if is_pid else f"{subcomp_type_id}:{value}")
+                    for value, is_empty, is_pid in zip(column, empty.tolist(), is_part_id.tolist())]
+
     @classmethod
     def df_coalesce_generator(cls, df, row_index, context={}):
+        import numpy as np
+        import pandas as pd
+
         def df_coalesce(col_name):
             # If the column col_name exists, return the value in that column.
             # If the cell is empty, return an empty string.
@@ -204,7 +318,7 @@ class Docket:
                 else:
                     result = ""
             if result is None and col_name in context.keys():
-                result = values[col_name]
+                result = context[col_name]
             if type(result) is np.int64:
                 result = int(result)
             return result
@@ -260,7 +374,7 @@ class Docket:
         )
 
         # Generate request for updating enabled status
-        self.enable_hwitems.append(
+        self._add_operation(self.enable_hwitems,
             {
                 "operation": "enable_hwitem",
                 "kwargs":
@@ -273,7 +387,7 @@ class Docket:
     
         # Generate request for attaching subcomponents
         if len(new_data[RA_SUBCOMPONENTS]) > 0:
-            self.attach_subcomponents.append(
+            self._add_operation(self.attach_subcomponents,
                 {
                     "operation": "set_subcomponents",
                     "kwargs":
@@ -287,6 +401,21 @@ class Docket:
 
 
 
+    def _add_operation(self, operations, op_node):
+        # Add op_node to the list of operations, and index any provisional 
+        # IDs in it
+        operations.append(op_node)
+        kwargs = op_node["kwargs"]
+        self._add_reference(kwargs, RA_PART_ID)
+        subcomponents = kwargs.get(RA_SUBCOMPONENTS, None) or {}
+        for funcpos in subcomponents.keys():
+            self._add_reference(subcomponents, funcpos)
+
+    def _add_reference(self, node, key):
+        value = node[key]
+        if isinstance(value, str) and ":" in value:
+            self._references.setdefault(value, []).append((node, key))
+
     def _generate_update_hwitem(self, old_data, new_data):
         # Test the things that MUST NOT be changed and raise an error if this is attempted
         # If they are None, interpret it as not trying to change it
@@ -407,6 +536,17 @@ class Docket:
                 }
             )
 
+        # Another row for this item is compared with what this one leaves,
+        # so that the item ends up the way its last row says
+        planned = {
+            **old_data,
+            RA_SERIAL_NUMBER: data[RA_SERIAL_NUMBER],
+            RA_COMMENTS: data[RA_COMMENTS],
+            RA_MANUFACTURER: data[RA_MANUFACTURER],
+            RA_ENABLED: enabled if enabled_has_changed else old_data[RA_ENABLED],
+            RA_SPECIFICATIONS: [data[RA_SPECIFICATIONS], *old_data[RA_SPECIFICATIONS]],
+        }
+
         # Test for changes in subcomponents
         # This is a little more complicated than just comparing "old" and "new" because
         # "old" is only going to contain the functional positions that have been filled,
@@ -428,6 +568,9 @@ class Docket:
                 if old_data.get(funcpos, None) is not None:
                     drops[funcpos] = None
 
+        planned[RA_SUBCOMPONENTS] = {**old_data[RA_SUBCOMPONENTS], **adds}
+        self._planned_hwitems[old_data[RA_PART_ID]] = planned
+
         if len(drops) > 0:
             self.remove_subcomponents.append(
                 {
@@ -440,7 +583,7 @@ class Docket:
                 }
             )
         if len(adds) > 0:
-            self.attach_subcomponents.append(
+            self._add_operation(self.attach_subcomponents,
                 {
                     "operation": "set_subcomponents",
                     "kwargs":
@@ -494,7 +637,7 @@ class Docket:
         for filename in filenames:
             #globbed = [ os.path.abspath(fn) 
             #                for fn in glob(os.path.expanduser(filename)) ]
-            globbed = glob(os.path.expanduser(filename))
+            globbed = sorted(glob(os.path.expanduser(filename)))
             files.extend(globbed)
         if len(files) == 0:
             msg = (f"Warning: file patterns in source '{src[DKT_SOURCE_NAME]}' in "
@@ -520,28 +663,26 @@ class Docket:
         # operation we're trying to do on it into a manifest
         manifest = []
         
+        # Only the file type and sheet names are read here. The rows are read
+        # a batch at a time when the sheet is processed. If there are a lot of
+        # files, they're opened in parallel by a pool of processes.
+        new_files = [filename for filename in dict.fromkeys(files)
+                            if filename not in self._file_cache.keys()]
+        for filename, (file_type, sheet_names) in zip(new_files, 
+                    SheetReader.map_files(SheetReader.file_info, 
+                            [(filename,) for filename in new_files],
+                            max_workers=self.max_processes)):
+            if file_type == SheetReader.CSV:
+                self._file_cache[filename] = {
+                    DKT_FILE_TYPE: DKT_CSV,
+                }
+            else:
+                self._file_cache[filename] = {
+                    DKT_FILE_TYPE: DKT_EXCEL,
+                    DKT_SHEET_NAME: sheet_names,
+                }
+
         for filename in files:
-            if filename not in self._file_cache.keys():
-                try:
-                    excel_file = pd.ExcelFile(filename)
-                    self._file_cache[filename] = {
-                        DKT_FILE_TYPE: DKT_EXCEL,
-                        DKT_FILE_HANDLE: excel_file,
-                        DKT_SHEET_NAME: excel_file.sheet_names,
-                    }
-                except ValueError as err1:
-                    try:
-                        csv_file = pd.read_csv(filename)
-                        self._file_cache[filename] = {
-                            DKT_FILE_TYPE: DKT_CSV,
-                            DKT_FILE_HANDLE: csv_file,
-                        }
-                    except ValueError as err2:
-                        msg = f"Could not parse '{filename}' as Excel or CSV."
-                        logger.error(msg)
-                        logger.info(f"As Excel: {err1}")
-                        logger.info(f"As CSV: {err2}")
-                        raise err2
             file_info = self._file_cache[filename]
 
             # Handle CSV files
@@ -657,7 +798,7 @@ class Docket:
       
         # First, let's get the Type ID 
         if DKT_TYPE_NAME in sheet_node[DKT_VALUES]: 
-            type_info = ut.lookup_part_type_id_by_fullname(sheet_node[DKT_VALUES][DKT_TYPE_NAME])
+            type_info = self._lookup_type_id(sheet_node[DKT_VALUES][DKT_TYPE_NAME])
             if DKT_TYPE_ID in sheet_node[DKT_VALUES]:
                 # If both Type ID and Type Name are given, they must match!
                 if sheet_node[DKT_VALUES][DKT_TYPE_ID] != type_info[1]:
@@ -672,23 +813,40 @@ class Docket:
         # Now let's go to the HWDB and see what fields we're going to need, 
         # i.e, what fields are in the Specs and Subcomponents
         
-        comp_type_info = ut.lookup_component_type_defs(part_type_id)
+        comp_type_info = self._lookup_type_defs(part_type_id)
         #print(comp_type_info)
 
-        # Get the data from the sheet    
-        file_info = self._file_cache[sheet_node[DKT_FILE_NAME]]
-        if file_info[DKT_FILE_TYPE] == DKT_EXCEL:
-            df = pd.read_excel(file_info[DKT_FILE_HANDLE], sheet_node[DKT_SHEET_NAME])
-        else:
-            df = file_info[DKT_FILE_HANDLE]
-        #print(df)
-
+        # Pull out the columns we need all at once, rather than a cell at a
+        # time, since indexing a DataFrame one cell at a time is slow. The
+        # sheet is read a batch of rows at a time, so only one batch has to
+        # be in memory.
+        spec_names = list(comp_type_info['spec_def'].keys())
+        subcomp_names = list(comp_type_info[RA_SUBCOMPONENTS].keys())
+        country_codes = {}
+
+        for df in self._iter_sheet(sheet_node):
+            self._process_auto_batch(df, sheet_node, part_type_id, comp_type_info,
+                                     spec_names, subcomp_names, country_codes)
+
+    def _process_auto_batch(self, df, sheet_node, part_type_id, comp_type_info,
+                            spec_names, subcomp_names, country_codes):
+        columns = self.df_columns(df, 
+                [DKT_EXTERNAL_ID, DKT_SERIAL_NUMBER, DKT_INST_ID, DKT_COUNTRY_CODE,
+                 DKT_MANU_ID, DKT_COMMENTS, DKT_ENABLED, *spec_names, *subcomp_names],
+                sheet_node[DKT_VALUES])
+        enabled_column = self._parse_enabled(columns[DKT_ENABLED])
+        subcomp_columns = {
+            subcomp: self._parse_subcomponents(columns[subcomp], 
+                            comp_type_info[RA_SUBCOMPONENTS][subcomp])
+                for subcomp in subcomp_names
+        }
+        if self.ledger is not None:
+            row_hashes = _row_hashes(df, sheet_node[DKT_VALUES])
 
         # Let's start putting together some items to add to the HWDB        
         for row_index in range(len(df)):
             
-            # Create a coalesce "helper" to speed lookups of data
-            df_coalesce = self.df_coalesce_generator(df, row_index, sheet_node[DKT_VALUES]) 
+            row = {name: column[row_index] for name, column in columns.items()}
 
             #method = None
             #has_changed = None
@@ -697,8 +855,20 @@ class Docket:
 
             # Examine External ID and Serial Number to determine if we're adding a new item or
             # updating an existing item
-            part_id = df_coalesce(DKT_EXTERNAL_ID)
-            serial_number = df_coalesce(DKT_SERIAL_NUMBER)
+            part_id = row[DKT_EXTERNAL_ID]
+            serial_number = row[DKT_SERIAL_NUMBER]
+
+            # Skip the row if it's what was sent last time, before anything
+            # is looked up for it
+            digest = None
+            if self.ledger is not None:
+                digest = row_hashes[row_index]
+                ledger_id = part_id
+                if part_id is None or part_id == '':
+                    ledger_id = self.ledger.part_id(f"{part_type_id}:{serial_number}")
+                if self._ledger_skip(ledger_id, digest):
+                    continue
+                verifying = self._ledger_decisions.get((ledger_id, digest), None) is False
 
             if part_id is None or part_id=='':
                 if serial_number is None:
@@ -711,69 +881,85 @@ class Docket:
                         part_id, old_data = SN_Lookup(part_type_id, serial_number)
                         new_data[RA_PART_ID] = part_id
             else:
-                old_data =  get_hwitem_complete(part_id)
+                old_data =  self._get_hwitem_complete(part_id)
                 new_data[RA_SERIAL_NUMBER] = serial_number
+            if old_data is not None:
+                old_data = self._planned_hwitems.get(old_data[RA_PART_ID], old_data)
 
-            inst_id = df_coalesce(DKT_INST_ID)
+            inst_id = row[DKT_INST_ID]
             if inst_id is not None:
-                new_data[RA_INSTITUTION] = df_coalesce(DKT_INST_ID)
-                new_data[RA_COUNTRY_CODE] = ut.lookup_institution_by_id(
-                        new_data[RA_INSTITUTION])[RA_COUNTRY][RA_CODE]
+                new_data[RA_INSTITUTION] = inst_id
+                if inst_id not in country_codes:
+                    country_codes[inst_id] = ut.lookup_institution_by_id(
+                            inst_id)[RA_COUNTRY][RA_CODE]
+                new_data[RA_COUNTRY_CODE] = country_codes[inst_id]
 
             # User can "override" the country code associated with the institution,
             # though I can't think of why they'd do that.
-            if df_coalesce(DKT_COUNTRY_CODE) is not None:
-                new_data[RA_COUNTRY_CODE] = df_coalesce(DKT_COUNTRY_CODE)
+            if row[DKT_COUNTRY_CODE] is not None:
+                new_data[RA_COUNTRY_CODE] = row[DKT_COUNTRY_CODE]
 
-            if df_coalesce(DKT_MANU_ID) is not None:
-                new_data[RA_MANUFACTURER] = df_coalesce(DKT_MANU_ID)
+            if row[DKT_MANU_ID] is not None:
+                new_data[RA_MANUFACTURER] = row[DKT_MANU_ID]
             
-            if df_coalesce(DKT_COMMENTS) is not None:
-                new_data[RA_COMMENTS] = str(df_coalesce(DKT_COMMENTS))
+            if row[DKT_COMMENTS] is not None:
+                new_data[RA_COMMENTS] = str(row[DKT_COMMENTS])
             
-            #print(f"ENABLED: {df_coalesce(DKT_ENABLED)}")
-            if df_coalesce(DKT_ENABLED) is not None:
-                new_data[RA_ENABLED] = df_coalesce(DKT_ENABLED)
-                if str(new_data[RA_ENABLED]).lower() in ['0', 'false', 'no', '']:
-                    new_data[RA_ENABLED] = False
-                elif str(new_data[RA_ENABLED]).lower() in ['1', 'true', 'yes']:
-                    new_data[RA_ENABLED] = True
-                else:
-                    raise ValueError("Enabled could not be cast as a boolean value")
-            else:
-                # if it's None, then default to Enable being true.
-                new_data[RA_ENABLED] = True 
+            new_data[RA_ENABLED] = enabled_column[row_index]
 
-            specs = {}
-            for spec_item in comp_type_info['spec_def'].keys():
-                specs[spec_item] = df_coalesce(spec_item)
-            new_data[RA_SPECIFICATIONS] = specs
+            new_data[RA_SPECIFICATIONS] = {spec_item: row[spec_item] for spec_item in spec_names}
 
-            subcomponents = {}
-            for subcomp in comp_type_info[RA_SUBCOMPONENTS].keys():
-                raw_subcomp = df_coalesce(subcomp)
-                    
-                if re.match("^[A-Za-z][0-9]{11}-[0-9]{5}$", raw_subcomp) is None:
-                    subcomponents[subcomp] = \
-                            f"{comp_type_info[RA_SUBCOMPONENTS][subcomp]}:{raw_subcomp}"
-                else:
-                    subcomponents[subcomp] = raw_subcomp
-            new_data[RA_SUBCOMPONENTS] = subcomponents
+            new_data[RA_SUBCOMPONENTS] = {subcomp: subcomp_columns[subcomp][row_index]
+                                            for subcomp in subcomp_names}
+
+            if digest is None:
+                self._generate_hwitem_requests(old_data, new_data)
+                continue
 
+            marks = self._operation_marks() if verifying else None
             self._generate_hwitem_requests(old_data, new_data)
+            alt_id = None if serial_number in (None, '') else f"{part_type_id}:{serial_number}"
+            item_id = alt_id if old_data is None else old_data[RA_PART_ID]
+            if verifying and self._count_operations(marks) > 0:
+                self.ledger_stats["mismatched"] += 1
+                logger.warning(f"{ledger_id} doesn't match the ledger, so it will be updated")
+                self.ledger.forget(ledger_id)
+            if item_id is not None:
+                self._ledger_pending[item_id] = (digest, alt_id)
+
+    def _iter_sheet(self, sheet_node):
+        # Yield the rows of a sheet as DataFrames of up to self.batch_size
+        # rows, so that large sheets don't have to be in memory all at once
+        filename, sheet_name, file_type = self._sheet_args(sheet_node)
+        yield from SheetReader.iter_batches(filename, sheet_name, 
+                batch_size=self.batch_size, file_type=file_type)
+
+    def _sheet_args(self, sheet_node):
+        # (file name, sheet name, file type) for SheetReader
+        file_info = self._file_cache[sheet_node[DKT_FILE_NAME]]
+        file_type = SheetReader.CSV if file_info[DKT_FILE_TYPE] == DKT_CSV else SheetReader.EXCEL
+        return sheet_node[DKT_FILE_NAME], sheet_node.get(DKT_SHEET_NAME, None), file_type
+
+    def _lookup_type_id(self, type_name):
+        if type_name not in self._type_id_cache.keys():
+            self._type_id_cache[type_name] = ut.lookup_part_type_id_by_fullname(type_name)
+        return self._type_id_cache[type_name]
+
+    def _lookup_type_defs(self, part_type_id):
+        if part_type_id not in self._type_defs_cache.keys():
+            self._type_defs_cache[part_type_id] = ut.lookup_component_type_defs(part_type_id)
+        return self._type_defs_cache[part_type_id]
+
+    def _get_hwitem_complete(self, part_id):
+        if part_id not in self._hwitem_cache.keys():
+            self._hwitem_cache[part_id] = get_hwitem_complete(part_id)
+        return self._hwitem_cache[part_id]
 
     def _resolve_serial_number(self, alt_id, part_id):
-        for op_node in self.enable_hwitems:
-            if op_node["operation"] == "enable_hwitem":
-                if op_node["kwargs"][RA_PART_ID] == alt_id:
-                    op_node["kwargs"][RA_PART_ID] = part_id
-        for op_node in self.attach_subcomponents:
-            if op_node["operation"] == "set_subcomponents":
-                if op_node["kwargs"][RA_PART_ID] == alt_id: 
-                    op_node["kwargs"][RA_PART_ID] = part_id
-                for funcpos, subcomp in op_node["kwargs"]["subcomponents"].items():
-                    if subcomp == alt_id:
-                        op_node["kwargs"]["subcomponents"][funcpos] = part_id
+        # Replace alt_id with part_id everywhere it was used in the plan
+        for node, key in self._references.pop(alt_id, []):
+            if node[key] == alt_id:
+                node[key] = part_id
         part_type_id, serial_number = alt_id[:12], alt_id[13:]
         SN_Lookup.delete(part_type_id, serial_number)
 
@@ -789,86 +975,278 @@ class Docket:
         print("===== Attach Subcomponents =====")
         pp(self.attach_subcomponents)
 
-    def update_hwdb(self):
+    def update_hwdb(self, max_workers=DEFAULT_MAX_WORKERS):
+        '''Send the plan to the HWDB
+
+        The operations are run as a TaskGraph, so that requests that don't
+        depend on each other are sent at the same time, up to 'max_workers'
+        at once. See _build_task_graph for the dependencies. Afterwards,
+        self.task_graph has the status of each operation.
+
+        If an operation fails, anything that depends on it is skipped. If
+        self.terminate_on_error is set, nothing new is started after the
+        first failure, and a RuntimeError is raised once the operations
+        already running have finished.
+
+        Items created by bulk-add are always given their serial numbers,
+        even after a failure elsewhere. Any that can't be are listed in
+        self.orphaned_hwitems and printed at the end.
+
+        Returns the number of operations in each state.
+        '''
+        self.orphaned_hwitems = []
+        self.task_graph = self._build_task_graph()
+        logger.info(f"running {len(self.task_graph)} operations with "
+                    f"{max_workers} workers")
+
+        summary = self.task_graph.run(max_workers, stop_on_error=self.terminate_on_error)
+        logger.info(f"update_hwdb finished: {summary}")
+        self._report_orphans()
+
+        failures = self.task_graph.failures()
+        if failures and self.terminate_on_error:
+            task = failures[0]
+            raise RuntimeError(f"{task.name} failed: {task.exception}")
+        return summary
+
+    def _build_task_graph(self):
+        # The operations for an item run in the same order as the lists in the
+        # plan (post, patch, enable, remove subcomponents, attach subcomponents),
+        # but operations on different items run in parallel, except that:
+        #   * new items in a large enough group are created by one bulk-add
+        #     task, and each one's serial number and specifications are then
+        #     set by its own patch (see _group_new_hwitems)
+        #   * anything that refers to a new item by "TYPEID:SN" waits for the
+        #     post that creates it (or the patch that gives it that SN)
+        #   * attaching subcomponents waits for every removal, since the
+        #     subcomponent might be coming from a parent that's dropping it
+        graph = TaskGraph()
+
+        providers = {}
+        last_task = {}
+
+        def chain(task, item_id, *refs):
+            for ref in refs:
+                graph.add_dependency(task, providers.get(ref, None))
+            graph.add_dependency(task, last_task.get(item_id, None))
+            last_task[item_id] = task
+
+        for group_key, op_nodes in self._group_new_hwitems().items():
+            bulk_task = None
+            if (group_key is not None and self.bulk_threshold is not None
+                    and len(op_nodes) >= self.bulk_threshold):
+                bulk_task = graph.add(f"bulk add {len(op_nodes)} {group_key[0]}",
+                                      self._bulk_add_hwitems, group_key, len(op_nodes))
+            for index, op_node in enumerate(op_nodes):
+                alt_id = (f'{op_node["kwargs"]["part_type_id"]}:'
+                          f'{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}')
+                if bulk_task is None:
+                    task = graph.add(f"post {alt_id}", self._post_hwitem, op_node)
+                else:
+                    # (the item exists once the bulk-add is done, so it has
+                    # to get its serial number, even if something else failed)
+                    task = graph.add(f"set up {alt_id}", self._set_up_hwitem,
+                                     op_node, bulk_task, index, depends_on=[bulk_task],
+                                     run_on_stop=True)
+                providers[alt_id] = task
+                chain(task, alt_id)
 
-        # Add the new items
-        for op_node in self.new_hwitems:
-            if op_node["operation"] == "post_hwitem":
-                print("== posting item ==")
-                pp(op_node)
-                resp = ra.post_hwitem(**op_node["kwargs"])
-                if resp[RA_STATUS] != RA_STATUS_OK:
-                    raise RuntimeError("Failed to post hwitem")
-                
-                # Update any future operations that are still referring to the serial number instead of part_id
-                part_id = resp[RA_PART_ID]
-                alt_id = f'{op_node["kwargs"]["part_type_id"]}:{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}'
-                #SN_Lookup.delete(*alt_id)
-                self._resolve_serial_number(alt_id, part_id)
-        
-        # Update items
         for op_node in self.update_hwitems:
             if op_node["operation"] == "patch_hwitem":
-                print("== updating item ==")
-                pp(op_node)
-                resp = ra.patch_hwitem(**op_node["kwargs"])
-                if resp[RA_STATUS] != RA_STATUS_OK:
-                    raise RuntimeError("Failed to patch hwitem")
-                
-                # Update any future operations that are still referring to the serial number instead of part_id
-                # This should be less likely for an update, but it's still possible 
-                part_id = resp[RA_PART_ID]
-                
-                # HACK HACK HACK
-                part_type_id = part_id[:12]
-                alt_id = f'{part_type_id}:{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}'
-                #SN_Lookup.delete(*alt_id)
-                self._resolve_serial_number(alt_id, part_id)
-        
-        # Update the enabled status
+                part_id = op_node["kwargs"]["part_id"]
+                task = graph.add(f"patch {part_id}", self._patch_hwitem, op_node)
+                chain(task, part_id)
+                alt_id = f'{part_id[:12]}:{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}'
+                providers.setdefault(alt_id, task)
+
         for op_node in self.enable_hwitems:
             if op_node["operation"] == "enable_hwitem":
-                print("== updating enable status ==")
-                pp(op_node)
-                alt_id = op_node["kwargs"]["part_id"]
-                if ":" in alt_id:
-                    part_type_id, serial_number = alt_id[:12], alt_id[13:]
-                    part_id, data = SN_Lookup(part_type_id, serial_number)
-                    op_node["kwargs"]["part_id"] = part_id
-                resp = ut.enable_hwitem(**op_node["kwargs"])
-                if resp[RA_STATUS] != RA_STATUS_OK:
-                    raise RuntimeError("Failed to update enable status")
-
-        # Update subcomponents                
+                part_id = op_node["kwargs"]["part_id"]
+                task = graph.add(f"enable {part_id}", self._enable_hwitem, op_node)
+                chain(task, part_id, part_id)
+
+        removals = []
         for op_node in self.remove_subcomponents:
             if op_node["operation"] == "set_subcomponents":
-                print("== removing subcomponents ==")
-                pp(op_node)
-                for funcpos, subcomp in op_node["kwargs"]["subcomponents"].items():
-                    if ":" in subcomp:
-                        part_type_id, serial_number = subcomp[:12], subcomp[13:]
-                        part_id, data = SN_Lookup(part_type_id, serial_number)
-                        op_node["kwargs"]["subcomponents"][funcpos] = part_id
-                resp = ut.set_subcomponents(**kwargs)
-                if resp[RA_STATUS] != RA_STATUS_OK:
-                    raise RuntimeError("Failed to remove subcomponents")
+                part_id = op_node["kwargs"]["part_id"]
+                task = graph.add(f"remove subcomponents {part_id}",
+                                 self._set_subcomponents, op_node, "removing")
+                chain(task, part_id, part_id)
+                removals.append(task)
+
         for op_node in self.attach_subcomponents:
             if op_node["operation"] == "set_subcomponents":
-                print("== attaching subcomponents ==")
-                pp(op_node)
-                for funcpos, subcomp in op_node["kwargs"]["subcomponents"].items():
-                    if ":" in subcomp:
-                        part_type_id, serial_number = subcomp[:12], subcomp[13:]
-                        part_id, data = SN_Lookup(part_type_id, serial_number)
-                        op_node["kwargs"]["subcomponents"][funcpos] = part_id
-                resp = ut.set_subcomponents(**op_node["kwargs"])
-                if resp[RA_STATUS] != RA_STATUS_OK:
-                    raise RuntimeError("Failed to remove subcomponents")
-
-
-
-
-
+                part_id = op_node["kwargs"]["part_id"]
+                task = graph.add(f"attach subcomponents {part_id}",
+                                 self._set_subcomponents, op_node, "attaching",
+                                 depends_on=removals)
+                children = [subcomp for subcomp in op_node["kwargs"]["subcomponents"].values()
+                                if isinstance(subcomp, str)]
+                chain(task, part_id, part_id, *children)
+
+        # Record each row in the ledger once the last request for its item
+        # has succeeded
+        for item_id, (digest, alt_id) in self._ledger_pending.items():
+            last = last_task.get(item_id, None)
+            graph.add(f"record {item_id}", self._record_ledger, 
+                      item_id, digest, alt_id, providers.get(item_id, None),
+                      depends_on=[last] if last is not None else [])
+
+        return graph
+
+    def _group_new_hwitems(self):
+        # Group the new items by what bulk-add needs to be the same for all
+        # the items it creates, keeping the order of the plan. Items whose
+        # specifications the HWDB would refuse go in the None group, to be
+        # posted one at a time: posting refuses the whole item, but a
+        # bulk-added one would be left without a serial number.
+        groups = {}
+        for op_node in self.new_hwitems:
+            if op_node["operation"] != "post_hwitem":
+                continue
+            data = op_node["kwargs"]["data"]
+            part_type_id = op_node["kwargs"]["part_type_id"]
+            problems = ut.check_specifications(data[RA_SPECIFICATIONS],
+                                self._lookup_type_defs(part_type_id)["spec_def"])
+            if len(problems) > 0:
+                logger.warning(f"{part_type_id}:{data[RA_SERIAL_NUMBER]} will be posted by "
+                               f"itself, since its specifications are invalid: "
+                               f"{'; '.join(problems)}")
+                groups.setdefault(None, []).append(op_node)
+                continue
+            group_key = (
+                op_node["kwargs"]["part_type_id"],
+                data[RA_INSTITUTION][RA_ID],
+                (data.get(RA_MANUFACTURER) or {}).get(RA_ID, None),
+                data[RA_COUNTRY_CODE],
+            )
+            groups.setdefault(group_key, []).append(op_node)
+        return groups
+
+    def _show_operation(self, title, op_node):
+        # Keep output from different threads from getting mixed together
+        with self._print_lock:
+            print(f"== {title} ==\n{json.dumps(op_node, indent=4)}")
+
+    def _lookup_part_id(self, alt_id):
+        # Turn a "TYPEID:SN" into a part ID, if it isn't one already
+        if not isinstance(alt_id, str) or ":" not in alt_id:
+            return alt_id
+        part_type_id, serial_number = alt_id[:12], alt_id[13:]
+        part_id, data = SN_Lookup(part_type_id, serial_number)
+        return part_id
+
+    def _post_hwitem(self, op_node):
+        self._show_operation("posting item", op_node)
+        resp = ra.post_hwitem(**op_node["kwargs"])
+        if resp[RA_STATUS] != RA_STATUS_OK:
+            raise RuntimeError("Failed to post hwitem")
+
+        # Update any future operations that are still referring to the serial number instead of part_id
+        part_id = resp[RA_PART_ID]
+        alt_id = f'{op_node["kwargs"]["part_type_id"]}:{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}'
+        with self._plan_lock:
+            self._resolve_serial_number(alt_id, part_id)
+        return part_id
+
+    def _bulk_add_hwitems(self, group_key, count):
+        part_type_id, institution_id, manufacturer_id, country_code = group_key
+        with self._print_lock:
+            print(f"== bulk adding {count} items of type {part_type_id} ==")
+        try:
+            return ut.bulk_create_hwitems(part_type_id, count,
+                            institution_id=institution_id,
+                            country_code=country_code,
+                            manufacturer_id=manufacturer_id,
+                            chunk_size=self.bulk_chunk_size)
+        except ut.BulkAddError as exc:
+            if not exc.part_ids:
+                raise
+            # Set up the items that were created. The rest fail in
+            # _set_up_hwitem.
+            logger.error(f"{exc}, so only {len(exc.part_ids)} of {count} items were created")
+            return exc.part_ids
+
+    def _set_up_hwitem(self, op_node, bulk_task, index):
+        # Give an item created by _bulk_add_hwitems the serial number,
+        # specifications, and comments that post_hwitem would have
+        data = op_node["kwargs"]["data"]
+        alt_id = f'{op_node["kwargs"]["part_type_id"]}:{data[RA_SERIAL_NUMBER]}'
+        if index >= len(bulk_task.result):
+            raise RuntimeError(f"Bulk add failed before creating {alt_id}")
+        part_id = bulk_task.result[index]
+        patch = {
+            RA_PART_ID: part_id,
+            RA_SERIAL_NUMBER: data[RA_SERIAL_NUMBER],
+            RA_SPECIFICATIONS: data[RA_SPECIFICATIONS],
+            RA_COMMENTS: data[RA_COMMENTS],
+            RA_MANUFACTURER: data[RA_MANUFACTURER],
+        }
+        self._show_operation(f"setting up bulk-added item {part_id}", op_node)
+        try:
+            resp = ra.patch_hwitem(part_id, patch)
+            if resp[RA_STATUS] != RA_STATUS_OK:
+                raise RuntimeError(f"Failed to set up bulk-added hwitem {part_id}")
+        except Exception:
+            with self._plan_lock:
+                self.orphaned_hwitems.append((part_id, alt_id))
+            raise
+
+        with self._plan_lock:
+            self._resolve_serial_number(alt_id, part_id)
+        return part_id
+
+    def _report_orphans(self):
+        if not self.orphaned_hwitems:
+            return
+        logger.error(f"{len(self.orphaned_hwitems)} bulk-added items have no serial "
+                     f"number: {self.orphaned_hwitems}")
+        with self._print_lock:
+            print("== these items were created, but could not be given their serial "
+                  "numbers, so they must be fixed by hand ==")
+            for part_id, alt_id in self.orphaned_hwitems:
+                print(f"    {part_id} should be {alt_id}")
+
+    def _patch_hwitem(self, op_node):
+        self._show_operation("updating item", op_node)
+        resp = ra.patch_hwitem(**op_node["kwargs"])
+        if resp[RA_STATUS] != RA_STATUS_OK:
+            raise RuntimeError("Failed to patch hwitem")
+
+        # Update any future operations that are still referring to the serial number instead of part_id
+        # This should be less likely for an update, but it's still possible 
+        part_id = resp[RA_PART_ID]
+
+        # HACK HACK HACK
+        part_type_id = part_id[:12]
+        alt_id = f'{part_type_id}:{op_node["kwargs"]["data"][RA_SERIAL_NUMBER]}'
+        with self._plan_lock:
+            self._resolve_serial_number(alt_id, part_id)
+        return part_id
+
+    def _enable_hwitem(self, op_node):
+        part_id = self._lookup_part_id(op_node["kwargs"]["part_id"])
+        with self._plan_lock:
+            op_node["kwargs"]["part_id"] = part_id
+        self._show_operation("updating enable status", op_node)
+        resp = ut.enable_hwitem(**op_node["kwargs"])
+        if resp[RA_STATUS] != RA_STATUS_OK:
+            raise RuntimeError("Failed to update enable status")
+        return resp
+
+    def _set_subcomponents(self, op_node, action):
+        kwargs = op_node["kwargs"]
+        part_id = self._lookup_part_id(kwargs["part_id"])
+        subcomponents = {funcpos: self._lookup_part_id(subcomp)
+                            for funcpos, subcomp in list(kwargs["subcomponents"].items())}
+        with self._plan_lock:
+            kwargs["part_id"] = part_id
+            kwargs["subcomponents"].update(subcomponents)
+        self._show_operation(f"{action} subcomponents", op_node)
+        resp = ut.set_subcomponents(**op_node["kwargs"])
+        if resp[RA_STATUS] != RA_STATUS_OK:
+            raise RuntimeError(f"Failed {action} subcomponents")
+        return resp
 
     def _process_auto_test(self, source_node, sheet_node):
         print("skipping test node")
@@ -889,7 +1267,175 @@ class Docket:
 
 
     def process_sources(self):
-
+        # Processing the item sheets needs a lot from the HWDB: the component
+        # type definitions, and the current state of every item that's being
+        # updated. Rather than look these up one at a time as each sheet and
+        # row comes up, the sheets are scanned first for what they'll need,
+        # and it's all fetched at once. After that, the plan is made from what
+        # is already in memory.
+        self._prefetch(self._scan_sources())
+        self._plan_sources()
+
+    def _item_sheets(self):
+        for source_node in self.sources:
+            for sheet_node in source_node["Manifest"]:
+                if (sheet_node[DKT_ENCODER] == DKT_AUTO
+                        and sheet_node[DKT_DATA_TYPE] == DKT_ITEM):
+                    yield source_node, sheet_node
+
+    def _scan_sources(self):
+        # Collect the type names, type IDs, external IDs, and serial numbers
+        # used in the item sheets, without looking anything up yet
+        scan = {
+            "sheets": [],
+            "part_ids": set(),
+            "institutions": set(),
+            "hashes": [],
+        }
+        # Each sheet is read by a separate process (if there are enough of
+        # them), which hands back just the IDs it found (and the hash of 
+        # each row, if there's a ledger)
+        sheet_nodes = [sheet_node for source_node, sheet_node in self._item_sheets()]
+        scans = SheetReader.map_files(_scan_sheet, 
+                    [(*self._sheet_args(sheet_node), sheet_node[DKT_VALUES], self.batch_size,
+                            self.ledger is not None)
+                        for sheet_node in sheet_nodes],
+                    max_workers=self.max_processes)
+        for sheet_node, (part_ids, serial_numbers, institutions, hashes) in zip(sheet_nodes, scans):
+            values = sheet_node[DKT_VALUES]
+            scan["part_ids"].update(part_ids)
+            scan["institutions"].update(institutions)
+            scan["sheets"].append(
+                (values.get(DKT_TYPE_NAME, None), values.get(DKT_TYPE_ID, None), serial_numbers))
+            scan["hashes"].append(hashes)
+        return scan
+
+    def _ledger_skip(self, part_id, digest):
+        # Whether to skip a row because it's the same as what the ledger says
+        # was last sent for the item. Rows picked for verification aren't
+        # skipped. The decision is remembered, so that the scan and the plan
+        # agree.
+        if self.ledger is None or part_id is None or part_id == '':
+            return False
+        if part_id in self._ledger_repeated:
+            return False
+        key = (part_id, digest)
+        if key not in self._ledger_decisions:
+            if not self.ledger.unchanged(part_id, digest):
+                return False
+            if self.ledger_verify > 0 and random.random() < self.ledger_verify:
+                self._ledger_decisions[key] = False
+                self.ledger_stats["verified"] += 1
+            else:
+                self._ledger_decisions[key] = True
+                self.ledger_stats["skipped"] += 1
+        return self._ledger_decisions[key]
+
+    def _find_repeated_items(self, sheet_type_ids, sheet_hashes):
+        # An item with more than one row (in one sheet or across several)
+        # is never skipped. Its rows are sent one after another, but the
+        # ledger only keeps the last, so skipping by row would leave the
+        # HWDB with whichever row happened not to match.
+        rows = {}
+        for type_id, hashes in zip(sheet_type_ids, sheet_hashes):
+            for (key_type, value), digest in hashes.items():
+                if key_type == DKT_EXTERNAL_ID:
+                    part_id = value
+                elif type_id is not None:
+                    part_id = self.ledger.part_id(f"{type_id}:{value}")
+                else:
+                    continue
+                if part_id is None:
+                    continue
+                # (the scan gives None for an item with more than one row)
+                rows[part_id] = rows.get(part_id, 0) + (1 if digest is not None else 2)
+        self._ledger_repeated.update(part_id for part_id, count in rows.items() if count > 1)
+
+    def _record_ledger(self, item_id, digest, alt_id, provider):
+        # Runs after the last request for an item has succeeded. New items
+        # get their part ID from the task that created them.
+        part_id = item_id if ":" not in item_id else provider.result
+        self.ledger.record(part_id, digest, alt_id)
+        return part_id
+
+    def _hwitem_operations(self):
+        return (self.new_hwitems, self.update_hwitems, self.enable_hwitems,
+                    self.remove_subcomponents, self.attach_subcomponents)
+
+    def _operation_marks(self):
+        # How many operations of each kind have been planned so far
+        return tuple(len(operations) for operations in self._hwitem_operations())
+
+    def _count_operations(self, marks):
+        # Count the operations planned since _operation_marks() returned
+        # 'marks', looking only at the ones added after it
+        return sum(1 for operations, mark in zip(self._hwitem_operations(), marks)
+                     for op_node in operations[mark:] if op_node["operation"] != "no action")
+
+    def _prefetch(self, scan):
+        # Fetch everything in the scan in parallel. Errors are ignored here,
+        # since the same lookup will be tried again (and fail with a proper
+        # message) when the sheet is processed.
+        def quietly(fn, *args):
+            try:
+                fn(*args)
+            except Exception as exc:
+                logger.warning(f"prefetch: {fn.__name__}{args} failed: {exc}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Type names have to be turned into type IDs before anything else
+            type_names = {type_name for type_name, type_id, serial_numbers in scan["sheets"]
+                                if type_name is not None}
+            wait([executor.submit(quietly, self._lookup_type_id, type_name)
+                        for type_name in type_names])
+
+            sheet_type_ids = []
+            for type_name, type_id, sheet_serial_numbers in scan["sheets"]:
+                if type_name is not None:
+                    type_id = self._type_id_cache.get(type_name, (None, None))[1]
+                sheet_type_ids.append(type_id)
+
+            part_ids = scan["part_ids"]
+            if self.ledger is not None:
+                self._find_repeated_items(sheet_type_ids, scan["hashes"])
+                # Items whose rows are in the ledger don't need to be fetched
+                digests = {value: digest for hashes in scan["hashes"]
+                                for (key_type, value), digest in hashes.items()
+                                if key_type == DKT_EXTERNAL_ID}
+                part_ids = {part_id for part_id in part_ids
+                                if not self._ledger_skip(part_id, digests[part_id])}
+
+            serial_numbers = {}
+            for type_id, (type_name, _, sheet_serial_numbers), hashes in zip(
+                                sheet_type_ids, scan["sheets"], scan["hashes"]):
+                if type_id is not None:
+                    if self.ledger is not None:
+                        sheet_serial_numbers = {serial_number 
+                                for serial_number in sheet_serial_numbers
+                                if not self._ledger_skip(
+                                    self.ledger.part_id(f"{type_id}:{serial_number}"),
+                                    hashes.get((DKT_SERIAL_NUMBER, serial_number)))}
+                    serial_numbers.setdefault(type_id, set()).update(sheet_serial_numbers)
+
+            futures = []
+            for type_id, type_serial_numbers in serial_numbers.items():
+                futures.append(executor.submit(quietly, self._lookup_type_defs, type_id))
+                if len(type_serial_numbers) > 0:
+                    futures.append(executor.submit(quietly, SN_Lookup.prefetch, type_id,
+                                                   type_serial_numbers, self.max_workers))
+            for part_id in part_ids:
+                futures.append(executor.submit(quietly, self._get_hwitem_complete, part_id))
+            if len(scan["institutions"]) > 0:
+                # This gets the whole list at once
+                futures.append(executor.submit(quietly, ut.lookup_institution_by_id,
+                                               next(iter(scan["institutions"]))))
+            wait(futures)
+
+        logger.info(f"prefetched {len(self._type_defs_cache)} component types and "
+                    f"{len(part_ids)} items by external ID")
+
+    def _plan_sources(self):
+        self._planned_hwitems = {}
         for source_node in self.sources:
             for sheet_node in source_node["Manifest"]:
 
@@ -908,23 +1454,44 @@ class Docket:
                     raise ValueError("Custom encoders not implemented (yet)")
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def _scan_sheet(filename, sheet_name, file_type, values, batch_size, with_hashes=False):
+    # Find the external IDs, serial numbers (of rows without an external
+    # ID), and institutions used in a sheet. This runs in a worker process
+    # (see Docket._scan_sources), so it returns sets rather than the sheet.
+    # With 'with_hashes', it also returns the hash of each row (see 
+    # _row_hashes), by (DKT_EXTERNAL_ID, part ID) or (DKT_SERIAL_NUMBER, SN).
+    part_ids, serial_numbers, institutions = set(), set(), set()
+    hashes = {}
+    for df in SheetReader.iter_batches(filename, sheet_name, 
+                                       batch_size=batch_size, file_type=file_type):
+        columns = Docket.df_columns(df, 
+                [DKT_EXTERNAL_ID, DKT_SERIAL_NUMBER, DKT_INST_ID], values)
+        row_hashes = _row_hashes(df, values) if with_hashes else [None] * len(df)
+        for part_id, serial_number, digest in zip(columns[DKT_EXTERNAL_ID], 
+                                    columns[DKT_SERIAL_NUMBER], row_hashes):
+            if part_id is None or part_id == '':
+                if serial_number is not None:
+                    serial_numbers.add(serial_number)
+                    key = (DKT_SERIAL_NUMBER, serial_number)
+                else:
+                    continue
+            else:
+                part_ids.add(part_id)
+                key = (DKT_EXTERNAL_ID, part_id)
+            if with_hashes:
+                # (an item in more than one row is never skipped)
+                hashes[key] = digest if key not in hashes else None
+        institutions.update(inst_id for inst_id in set(columns[DKT_INST_ID])
+                                if inst_id is not None and inst_id != '')
+    return part_ids, serial_numbers, institutions, hashes
+
+def _row_hashes(df, values):
+    # A hash for each row of the sheet, of everything that goes into making
+    # its requests: every cell, plus the values given in the docket. This
+    # doesn't need anything from the HWDB, so that unchanged rows can be
+    # found without asking the HWDB about them.
+    columns = Docket.df_columns(df, sorted(df.columns, key=str))
+    names = [str(name) for name in columns.keys()]
+    context = sorted((str(key), value) for key, value in values.items())
+    return [Ledger.content_hash([context, names, row])
+                for row in zip(*columns.values())]
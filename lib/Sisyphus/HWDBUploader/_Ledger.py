@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/HWDBUploader/_Ledger.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Remembers what was last sent to the HWDB for each item, as a hash of the
+row it came from, so that a docket can skip rows that haven't changed
+since the last time it was submitted. See Docket.ledger.
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+LEDGER_DIRNAME = "ledger"
+
+# Change this if the way rows are hashed changes, so that entries made the
+# old way never match
+HASH_VERSION = 1
+
+class Ledger:
+    '''The content hash last sent to the HWDB for each part ID
+
+    The ledger is a JSON Lines file that gets a line every time an item is
+    recorded, so a run that's interrupted keeps whatever it had already
+    finished. The last line for a part ID is the one that counts. Items
+    can also be found by "TYPEID:SN", for rows that only give a serial
+    number. Safe to share between threads.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._entries = {}  # part ID -> (hash, "TYPEID:SN")
+        self._alt_ids = {}  # "TYPEID:SN" -> part ID
+        self._lines = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), mode=0o700, exist_ok=True)
+        self._load()
+        # Rewrite the file if it's mostly lines that have been superseded
+        if self._lines > 2 * len(self._entries) + 1000:
+            self.compact()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<Ledger {self.filename!r} with {len(self)} items>"
+
+    @classmethod
+    def from_config(cls, cfg=None):
+        '''The ledger for the active profile and REST API server
+
+        Each server has its own ledger, so a docket submitted to the
+        development server won't be skipped when it's submitted to
+        production.
+        '''
+        cfg = cfg or config
+        key_info = [cfg.profile_name, cfg.rest_api]
+        key = hashlib.sha256(json.dumps(key_info).encode("utf-8")).hexdigest()
+        return cls(os.path.join(cfg.cache_root, LEDGER_DIRNAME, f"{key}.jsonl"))
+
+    @staticmethod
+    def content_hash(content):
+        '''A hash of anything JSON can hold (dictionaries in any key order)'''
+        data = json.dumps([HASH_VERSION, content], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        try:
+            f = open(self.filename, "r")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                    self._apply(entry["part_id"], entry["hash"], entry.get("alt_id", None))
+                except (ValueError, KeyError, TypeError):
+                    # (e.g., the last line of a run that was killed)
+                    logger.warning(f"Ignoring bad line {self._lines} in {self.filename}")
+
+    def _apply(self, part_id, digest, alt_id):
+        old_hash, old_alt_id = self._entries.pop(part_id, (None, None))
+        if old_alt_id is not None and self._alt_ids.get(old_alt_id, None) == part_id:
+            del self._alt_ids[old_alt_id]
+        if digest is not None:
+            self._entries[part_id] = (digest, alt_id)
+            if alt_id is not None:
+                self._alt_ids[alt_id] = part_id
+
+    def _append(self, entry):
+        try:
+            with open(self.filename, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._lines += 1
+        except OSError as exc:
+            logger.warning(f"Unable to write to the ledger: {exc}")
+
+    def part_id(self, alt_id):
+        '''The part ID recorded for "TYPEID:SN", or None'''
+        with self._lock:
+            return self._alt_ids.get(alt_id, None)
+
+    def get(self, part_id):
+        '''The hash recorded for this part ID, or None'''
+        with self._lock:
+            return self._entries.get(part_id, (None, None))[0]
+
+    def unchanged(self, part_id, digest):
+        '''True if 'digest' is what was last recorded for this part ID'''
+        return digest is not None and self.get(part_id) == digest
+
+    def record(self, part_id, digest, alt_id=None):
+        '''Record that the row with this hash was sent for this part ID'''
+        with self._lock:
+            self._apply(part_id, digest, alt_id)
+            self._append({"part_id": part_id, "hash": digest, "alt_id": alt_id,
+                          "time": time.time()})
+
+    def forget(self, part_id):
+        '''Drop the entry for this part ID, so its row won't be skipped'''
+        with self._lock:
+            if part_id in self._entries:
+                self._apply(part_id, None, None)
+                self._append({"part_id": part_id, "hash": None, "time": time.time()})
+
+    def compact(self):
+        '''Rewrite the file with only the current entry for each item'''
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+                with os.fdopen(fd, "w") as f:
+                    for part_id, (digest, alt_id) in self._entries.items():
+                        f.write(json.dumps({"part_id": part_id, "hash": digest,
+                                            "alt_id": alt_id}) + "\n")
+                os.replace(tmp_path, self.filename)
+            except OSError as exc:
+                logger.warning(f"Unable to compact the ledger: {exc}")
+                return
+            self._lines = len(self._entries)
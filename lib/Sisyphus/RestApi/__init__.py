@@ -19,18 +19,33 @@ logger = config.getLogger()
 
 
 import json
-from requests import Session
-import requests.adapters
-
-# Get API and certificate information from config
-_api = config.rest_api
-_pem_filename = config.certificate
-
-_session = Session()
-
-adapter = requests.adapters.HTTPAdapter(pool_connections=100, pool_maxsize=100)
-_session.mount(f'https://{_api}', adapter)
-_session.cert = _pem_filename
+import threading
+from Sisyphus.Utils.Metrics import metrics, body_size, response_size
+from Sisyphus.Utils.Concurrency import get_shared_limit, limited
+from Sisyphus.Utils.Download import download, DownloadError, ChecksumError
+
+# The session is created by the first request, so that importing this
+# module doesn't load the configuration or 'requests'.
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    if _session is not None:
+        return _session
+    with _session_lock:
+        if _session is not None:
+            return _session
+        from requests import Session
+        import requests.adapters
+
+        session = Session()
+        # (at least the maximum of the shared AdaptiveLimit; see _send)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=100, pool_maxsize=100)
+        session.mount(f'https://{config.rest_api}', adapter)
+        session.cert = config.certificate
+        _session = session
+        return _session
 
 # def set_api(path):
 #     auth._api = path
@@ -45,8 +60,8 @@ def _raw_get(path):
     if path.startswith("https://"):
         url = path
     else:
-        url = f'https://{_api}/{path}'
-    resp = _session.get(url) 
+        url = f'https://{config.rest_api}/{path}'
+    resp = _get_session().get(url) 
     return resp.text
 
 
@@ -56,6 +71,18 @@ def _raw_get(path):
 #
 #######################################################################    
 
+def _send(method, url, *args, **kwargs):
+    # Send a request with the session, recording it in metrics, once
+    # the shared concurrency limit has room for it
+    with limited(get_shared_limit(), method, url) as slot, \
+            metrics.track(method, url) as tracked:
+        resp = getattr(_get_session(), method.lower())(url, *args, **kwargs)
+        slot.finish(resp.status_code)
+        tracked.finish(resp.status_code,
+                       response_bytes=response_size(resp, kwargs.get("stream", False)),
+                       request_bytes=body_size(resp.request.body))
+    return resp
+
 # @log_execution_time(logger)
 def _get(*args, **kwargs):
     kwargs["timeout"]=10
@@ -64,7 +91,7 @@ def _get(*args, **kwargs):
         # resp = p12get(*args, **kwargs, 
         #               pkcs12_data=_p12_data,
         #               pkcs12_password=_p12_password)
-        resp = _session.get(*args, **kwargs)
+        resp = _send("GET", *args, **kwargs)
     except Exception as exc:
         logger.error("An exception occurred while attempting to retrieve data from "
                      f"the REST API. Exception details: {exc}")
@@ -117,7 +144,7 @@ def _post(*args, **kwargs):
         # resp = p12post(*args, **kwargs, 
         #               pkcs12_data=_p12_data,
         #               pkcs12_password=_p12_password)       
-        resp = _session.post(*args, **kwargs)
+        resp = _send("POST", *args, **kwargs)
     except Exception as exc:
         logger.error("An exception occurred while attempting to post data to "
                      f"the REST API. Exception details: {exc}")
@@ -163,29 +190,36 @@ def _post(*args, **kwargs):
 # @log_execution_time(logger)    
 def _get_binary(*args, **kwargs):
     kwargs["timeout"]=10
+    write_to_file = kwargs.pop("write_to_file")
+    options = {key: kwargs.pop(key) for key in
+                    ("chunk_size", "resume", "checksum", "hash_algorithm") if key in kwargs}
+    url, args = args[0], args[1:]
+
+    def send(url, **send_kwargs):
+        return _send("GET", url, *args, **send_kwargs)
+
     try:
-        # resp = p12get(*args, **kwargs, 
-        #               pkcs12_data=_p12_data,
-        #               pkcs12_password=_p12_password)
-        resp = _session.get(*args, **kwargs)
+        result = download(send, url, write_to_file, **options, **kwargs)
+    except ChecksumError as exc:
+        logger.error(f"The file downloaded from {url} did not match the checksum: "
+                     f"expected {exc.expected}, received {exc.actual}")
+        raise RuntimeError("the file did not match the checksum")
+    except DownloadError as exc:
+        logger.error("The request to the REST API failed. HTTP status code "
+                     f"{exc.status_code}")
+        raise RuntimeError("the request failed: status code %d" 
+                                 % exc.status_code)
     except Exception as exc:
+        import requests.exceptions
+        if isinstance(exc, OSError) and not isinstance(exc, requests.exceptions.RequestException):
+            logger.error("An exception occurred while attempting to write binary "
+                         f"data to {write_to_file}. Exception details: {exc}")
+            return None
         logger.error("An exception occurred while attempting to get binary "
                      f"data from the REST API. Exception details: {exc}")
         raise RuntimeError(f"the request failed: {exc}")
-      
-    write_to_file = kwargs.pop("write_to_file")
-    if resp.status_code in (200, 201):
-        try:
-            with open(write_to_file, "wb") as f:
-                    f.write(resp.content)
-        except Exception as exc:
-            logger.error("An exception occurred while attempting to write binary "
-                         f"data to {write_to_file}. Exception details: {exc}")
-    else:
-        logger.error("The request to the REST API failed. HTTP status code "
-                     f"{resp.status_code}")
-        raise RuntimeError("the request failed: status code %d" 
-                                 % resp.status_code)
+
+    return result
 
 #######################################################################    
 
@@ -196,7 +230,7 @@ def _patch(*args, **kwargs):
         # resp = p12patch(*args, **kwargs, 
         #               pkcs12_data=_p12_data,
         #               pkcs12_password=_p12_password)
-        resp = _session.patch(*args, **kwargs)
+        resp = _send("PATCH", *args, **kwargs)
     except Exception as exc:
         logger.error("An exception occurred while attempting to patch data to "
                      f"the REST API. Exception details: {exc}")
@@ -257,7 +291,9 @@ def _patch(*args, **kwargs):
 # ==========
 # GET       /component-types/<name>/components[?[page=<int>][&term=<pattern>]]
 # POST      /component-types/<name>/components
+# POST      /component-types/<name>/bulk-add
 # GET       /components/<external-id>[?history=true]
+# PATCH     /components/<external-id>
 # GET       /components/<external-id>/container[?history=true]
 # GET       /components/<external-id>/subcomponents[?history=true]
 #
@@ -294,7 +330,7 @@ def _patch(*args, **kwargs):
 
 def get_attributes(attribute_id, **kwargs):
     path = f"cdbdev/api/attributes/{attribute_id}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
 
     resp = _get(url, **kwargs)
 
@@ -318,7 +354,7 @@ def get_component_types(page=None, term=None, **kwargs):
     #
 
     path = "cdbdev/api/component-types"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if page is not None:
@@ -338,7 +374,7 @@ def get_component_types(page=None, term=None, **kwargs):
 # @log_execution_time(logger)
 def get_component_type(part_type_id, history=False, **kwargs):
     path = f"cdbdev/api/component-types/{part_type_id}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if history is True:
@@ -361,7 +397,7 @@ def patch_component_type():
 
 #def post_component(type_id, data, **kwargs):
 #    path = f"cdbdev/api/component-types/{type_id}/components"
-#    url = f"https://{_api}/{path}" 
+#    url = f"https://{config.rest_api}/{path}" 
 #   
 #    logger.info(f"calling post_component (V0) with url='{url}'")
 # 
@@ -373,30 +409,30 @@ def patch_component_type():
 
 def get_component_type_connectors(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/connectors"
-    url = f"https://{_api}/{path}" 
+    url = f"https://{config.rest_api}/{path}" 
     return _get(url, **kwargs)
   
 def patch_component_type_connectors(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}>/connectors"    
-    url = f"https://{_api}/{path}"  
+    url = f"https://{config.rest_api}/{path}"  
 
 def get_component_type_images(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/images"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     return _get(url, **kwargs)
 
 def post_component_type_images(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/images"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
 def get_component_type_specifications(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/specifications"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     return _get(url)
 
 def patch_component_type_specifications(type_id, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/specifications"  
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
 
 #######################################################################
 # 
@@ -407,7 +443,7 @@ def patch_component_type_specifications(type_id, **kwargs):
 # @log_execution_time(logger) 
 def get_components(part_type_id, page=None, term=None, **kwargs):
     path = f"cdbdev/api/component-types/{part_type_id}/components"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if page is not None:
@@ -427,7 +463,7 @@ def get_components(part_type_id, page=None, term=None, **kwargs):
 # @log_execution_time(logger)
 def post_component(type_id, data, **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/components"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
 
     logger.info(f"calling post_component (V0) with url='{url}'")
 
@@ -441,10 +477,36 @@ def post_component(type_id, data, **kwargs):
 
 #######################################################################
 
+# @log_execution_time(logger)
+def post_bulk_components(type_id, data, **kwargs):
+    path = f"cdbdev/api/component-types/{type_id}/bulk-add"
+    url = f"https://{config.rest_api}/{path}"
+
+    logger.info(f"calling post_bulk_components (V0) with url='{url}'")
+
+    resp = _post(url, json=data, **kwargs)
+        
+    return resp
+
+#######################################################################
+
+# @log_execution_time(logger)
+def patch_component(part_id, data, **kwargs):
+    path = f"cdbdev/api/components/{part_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    logger.info(f"calling patch_component (V0) with url='{url}'")
+
+    resp = _patch(url, json=data, **kwargs)
+        
+    return resp
+
+#######################################################################
+
 # @log_execution_time(logger)
 def get_component(part_id, history=False, **kwargs):
     path = f"cdbdev/api/components/{part_id}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     # A LITTLE WARNING...
     # 1) If you append the parameter "history" with ANY value (even
@@ -471,7 +533,7 @@ def get_component(part_id, history=False, **kwargs):
 # @log_execution_time(logger)
 def get_component_container(part_id, history=False, **kwargs):
     path = f"cdbdev/api/components/{part_id}/container"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if history is True:
@@ -495,7 +557,7 @@ def get_component_container(part_id, history=False, **kwargs):
 # @log_execution_time(logger)
 def get_component_subcomponents(part_id, history=False, **kwargs):
     path = f"cdbdev/api/components/{part_id}/subcomponents"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if history is True:
@@ -514,7 +576,7 @@ def get_component_subcomponents(part_id, history=False, **kwargs):
 # @log_execution_time(logger)
 def get_test_types(part_type_id, **kwargs):
     path = f"cdbdev/api/component-types/{part_type_id}/test-types"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     resp = _get(url, **kwargs)
 
     # The "data" node will contain a list of "test type" objects, but these
@@ -537,13 +599,13 @@ def get_test_types(part_type_id, **kwargs):
 # @log_execution_time(logger)
 def get_test_type(test_type_id, **kwargs):
     path = f"cdbdev/api/component-test-types/{test_type_id}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     return _get(url, **kwargs)
 
 # @log_execution_time(logger)    
 def post_test_type(part_type_id, data,  **kwargs):
     path = f"cdbdev/api/component-types/{part_type_id}/test-types"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
 
     resp = _post(url, json=data, **kwargs)
     return resp
@@ -551,7 +613,7 @@ def post_test_type(part_type_id, data,  **kwargs):
 # @log_execution_time(logger)
 def get_test_type_by_name(type_id, test_type_name, history=False,  **kwargs):
     path = f"cdbdev/api/component-types/{type_id}/test-types/{test_type_name}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
 
     resp = _get(url, **kwargs)
 
@@ -574,7 +636,7 @@ def get_test_type_by_name(type_id, test_type_name, history=False,  **kwargs):
 # @log_execution_time(logger)
 def get_tests(eid, history=False, **kwargs):    
     path = f"cdbdev/api/components/{eid}/tests"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if history is True:
@@ -587,7 +649,7 @@ def get_tests(eid, history=False, **kwargs):
 # @log_execution_time(logger)
 def get_test(eid, name, history=False, **kwargs):    
     path = f"cdbdev/api/components/{eid}/tests/{name}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     params = []
     if history is True:
@@ -599,7 +661,7 @@ def get_test(eid, name, history=False, **kwargs):
 
 def post_test(eid, test_data, **kwargs):
     path = f"cdbdev/api/components/{eid}/tests"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     
     resp = _post(url, json=test_data, **kwargs)
     return resp
@@ -617,7 +679,7 @@ def post_test(eid, test_data, **kwargs):
 # @log_execution_time(logger)
 def get_component_images(external_id, **kwargs):
     path = f"cdbdev/api/components/{external_id}/images"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     return _get(url, **kwargs)
 
 # @log_execution_time(logger)
@@ -631,7 +693,7 @@ def get_component_test_images(*args, **kwargs):
 # @log_execution_time(logger)    
 def get_image(image_id, write_to_file=None, **kwargs):
     path = f"cdbdev/api/img/{image_id}"
-    url = f"https://{_api}/{path}"
+    url = f"https://{config.rest_api}/{path}"
     return _get_binary(url, write_to_file=write_to_file, **kwargs)
  
 # =====================================================================
@@ -1,7 +1,601 @@
-#!/usr/bin/env python3
+#!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-Created on Thu Feb  9 11:18:30 2023
+Sisyphus/RestApiV1/Asynchronous.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
 
-@author: alexwagner
+Coroutine versions of the functions in Sisyphus.RestApiV1. They take the
+same arguments and return the same dictionaries (including the error
+dictionaries built by _get/_post/_patch), but must be awaited, e.g.,
+
+    import asyncio
+    import Sisyphus.RestApiV1.Asynchronous as ara
+
+    async def main(part_ids):
+        try:
+            return await ara.gather(*[ara.get_hwitem(p) for p in part_ids], limit=200)
+        finally:
+            await ara.close_session()
+
+    results = asyncio.run(main(part_ids))
+
+Requires the 'aiohttp' package.
 """
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import Sisyphus.Configuration as Config
+from Sisyphus.RestApiV1._RestApiV1 import sanitize, ServerError
+from Sisyphus.RestApiV1._RestApiV1 import KW_ERROR, KW_SERVER_ERROR
+import asyncio
+import json
+import ssl
+import aiohttp
+
+raise_server_errors = False
+
+# Extra keyword arguments passed to every aiohttp request
+session_kwargs = {}
+
+# The maximum number of simultaneous connections the session will open.
+# Requests beyond this number wait inside aiohttp for a free connection.
+max_connections = 100
+
+# The default number of coroutines that gather() will allow to run at
+# the same time.
+DEFAULT_GATHER_LIMIT = 100
+
+session = None
+_session_loop = None
+
+def start_session():
+    '''Create an aiohttp session for the current event loop
+
+    This must be called from within a running event loop. It is normally
+    not necessary to call this directly, since the first request will
+    create a session if there isn't one.
+    '''
+    global session, _session_loop
+    if config.cert_type != Config.KW_PEM:
+        logger.warning("Unable to start session because a certificate was not available.")
+        session = None
+        return session
+
+    ssl_context = ssl.create_default_context()
+    ssl_context.load_cert_chain(config.certificate)
+    connector = aiohttp.TCPConnector(limit=max_connections, ssl=ssl_context)
+    session = aiohttp.ClientSession(connector=connector)
+    _session_loop = asyncio.get_running_loop()
+    return session
+
+async def close_session():
+    '''Close the aiohttp session, if one is open
+
+    Call this before the event loop that created the session ends.
+    '''
+    global session
+    if session is not None:
+        await session.close()
+        session = None
+
+async def _close_stale_session():
+    # Close a session that was left open by an earlier event loop. If that
+    # loop has been closed, its connections went with it and this only marks
+    # the session closed. If not, the connections are closed, but can't be
+    # waited for from this loop.
+    global session
+    stale, session = session, None
+    try:
+        await stale.close()
+    except RuntimeError as exc:
+        logger.debug(f"Closed a session from another event loop: {exc}")
+
+async def _get_session():
+    # An aiohttp session belongs to the event loop it was created in, so
+    # if we're running in a different loop (e.g., a second asyncio.run()),
+    # we need a new one, and the old one has to be closed.
+    loop = asyncio.get_running_loop()
+    if session is not None and _session_loop is not loop:
+        await _close_stale_session()
+    if session is None or session.closed:
+        start_session()
+    if session is None:
+        msg = "No session available"
+        logger.error(msg)
+        raise RuntimeError(msg)
+    return session
+
+def _request_kwargs(kwargs):
+    # Allow the same "timeout=<seconds>" argument that the synchronous
+    # functions accept.
+    kwargs = {**kwargs, **session_kwargs}
+    timeout = kwargs.get("timeout", None)
+    if isinstance(timeout, (int, float)):
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+    return kwargs
+
+#######################################################################
+
+async def gather(*aws, limit=DEFAULT_GATHER_LIMIT, return_exceptions=False):
+    '''Like asyncio.gather, but with at most 'limit' awaitables running at once
+
+    Results are returned in the same order as the awaitables were given.
+    '''
+    if limit is None or limit <= 0:
+        return await asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[bounded(aw) for aw in aws],
+                                return_exceptions=return_exceptions)
+
+#######################################################################
+
+async def _get(url, *args, **kwargs):
+
+    logger.debug(f"<_get> Calling REST API with url='{url}'")
+
+    client = await _get_session()
+
+    #
+    #  Send the "get" request.
+    #  If an error occurs, create a JSON response explaining the problem
+    #  and return it.
+    #
+    try:
+        async with client.get(url, *args, **_request_kwargs(kwargs)) as resp:
+            status_code = resp.status
+            text = await resp.text()
+    except Exception as exc:
+        msg = ("An exception occurred while attempting to retrieve data from "
+                     f"the REST API. Exception details: {exc}")
+        logger.error(msg)
+        logger.info(f"The exception type was {type(exc)}")
+
+        if raise_server_errors:
+            raise ServerError(msg)
+        resp_data = {
+            "status": KW_SERVER_ERROR,
+            "addl_info": {
+                "msg": msg,
+            }
+        }
+        return resp_data
+
+    #
+    #  Convert the response to JSON and return.
+    #  If the response cannot be converted to JSON, construct an alternate
+    #  JSON response stating the problem and return that instead.
+    #
+    try:
+        resp_data = json.loads(text)
+
+        if type(resp_data) != dict:
+            err = {
+                "status": "Server Error",
+                "addl_info": {
+                    "msg": "The server returned invalid data",
+                    "response": f"{resp_data}",
+                }
+            }
+            return err
+        else:
+            return resp_data
+
+    except json.JSONDecodeError:
+        logger.error("The server returned content that was not valid JSON")
+        err = {
+            "status": "Server Error",
+            "addl_info":
+            {
+                "msg": "The server returned content that was not valid JSON",
+                "http_response_code": status_code,
+                "url" : url,
+                "response": text,
+            },
+        }
+        logger.info(f"response: {text}")
+        return err
+
+#######################################################################
+
+async def _get_binary(url, write_to_file, *args, **kwargs):
+
+    logger.debug(f"<_get_binary> Calling API with url='{url}'")
+
+    client = await _get_session()
+
+    try:
+        async with client.get(url, *args, **_request_kwargs(kwargs)) as resp:
+            if resp.status in (200, 201):
+                try:
+                    with open(write_to_file, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(0x10000):
+                            f.write(chunk)
+                except OSError as exc:
+                    logger.error("An exception occurred while attempting to write binary "
+                                 f"data to {write_to_file}. Exception details: {exc}")
+            else:
+                logger.error("The request to the REST API failed. HTTP status code "
+                             f"{resp.status}")
+                raise RuntimeError("the request failed: status code %d"
+                                         % resp.status)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        logger.error("An exception occurred while attempting to retrieve data from "
+                     f"the REST API. Exception details: {exc}")
+        resp_data = {
+            "status": KW_SERVER_ERROR,
+            "addl_info": {
+                "msg": "An exception occurred while retrieving data",
+                "exception_details": f"{exc}",
+            }
+        }
+        return resp_data
+
+#######################################################################
+
+async def _send(method, url, data, *args, **kwargs):
+    # Shared implementation for _post and _patch, which only differ in
+    # the HTTP method and the wording of their messages.
+    verb = {"POST": "post", "PATCH": "patch"}[method]
+
+    logger.debug(f"<_{verb}> Calling REST API with url='{url}'")
+
+    client = await _get_session()
+
+    try:
+        async with client.request(method, url, json=data, *args,
+                                    **_request_kwargs(kwargs)) as resp:
+            status_code = resp.status
+            text = await resp.text()
+    except Exception as exc:
+        logger.error(f"An exception occurred while attempting to {verb} data to "
+                     f"the REST API. Exception details: {exc}")
+        resp_data = {
+            "status": KW_ERROR,
+            "addl_info": {
+                "msg": f"An exception occurred while {verb}ing data",
+                "exception_details": f"{exc}",
+            }
+        }
+        return resp_data
+
+    if status_code not in (200, 201):
+        logger.warning(f"RestApiV1.Asynchronous._{verb} method returned "
+                       f"status code {status_code}")
+        logger.info(f"The response was: {text}")
+
+    try:
+        resp_data = json.loads(text)
+        return resp_data
+    except json.JSONDecodeError:
+        logger.error("The server returned content that was not valid JSON")
+        if method == "POST":
+            err = {
+                "status": "Server Error",
+                "addl_info":
+                {
+                    "msg": "The server returned content that was not valid JSON",
+                    "http_response_code": status_code,
+                    "url" : url,
+                    "response": text,
+                },
+            }
+        else:
+            err = {
+                "status": KW_ERROR,
+                "addl_info":
+                {
+                    "msg": "The server returned an error.",
+                    "http_response_code": status_code,
+                    "url" : url,
+                    "response": text,
+                },
+            }
+        logger.info(f"response: {text}")
+        return err
+
+async def _post(url, data, *args, **kwargs):
+    return await _send("POST", url, data, *args, **kwargs)
+
+async def _patch(url, data, *args, **kwargs):
+    return await _send("PATCH", url, data, *args, **kwargs)
+
+#######################################################################
+
+async def get_component_image(part_id, **kwargs):
+    logger.debug(f"<get_image_by_part_id>")
+    path = f"api/v1/components/{sanitize(part_id)}/images"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_component_type_image_list(part_type_id, **kwargs):
+    logger.debug(f"<get_component_images>")
+    path = f"api/v1/component-types/{part_type_id}/images"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_image(image_id, write_to_file, **kwargs):
+    logger.debug(f"<get_image>")
+    path = f"api/v1/img/{image_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get_binary(url, write_to_file, **kwargs)
+
+##############################################################################
+#
+#  HW ITEMS
+#
+##############################################################################
+
+async def get_hwitem(part_id, **kwargs):
+    logger.debug(f"<get_hwitem> part_id={part_id}")
+    path = f"api/v1/components/{sanitize(part_id)}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_hwitems(part_type_id, *,
+                page=None, size=None, fields=None,
+                serial_number=None,
+                part_id=None,
+                **kwargs):
+
+    logger.debug(f"<get_hwitems> part_type_id={part_type_id},"
+                f"page={page}, size={size}, fields={fields}, "
+                f"serial_number={serial_number}, part_id={part_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}/components"
+    url = f"https://{config.rest_api}/{path}"
+
+    params = []
+    if page is not None:
+        params.append(("page", page))
+    if size is not None:
+        params.append(("size", size))
+    if serial_number is not None:
+        params.append(("serial_number", serial_number))
+    if part_id is not None:
+        params.append(("part_id", part_id))
+    if fields is not None:
+        params.append(("fields", ",".join(fields)))
+
+    return await _get(url, params=params, **kwargs)
+
+async def post_hwitem(part_type_id, data, **kwargs):
+    logger.debug(f"<post_hwitem> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}/components"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _post(url, data=data, **kwargs)
+
+async def patch_hwitem(part_id, data, **kwargs):
+    logger.debug(f"<patch_hwitem> part_id={part_id}")
+    path = f"api/v1/components/{sanitize(part_id)}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _patch(url, data=data, **kwargs)
+
+async def post_bulk_hwitems(part_type_id, data, **kwargs):
+    logger.debug(f"<post_bulk_hwitems> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}/bulk-add"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _post(url, data=data, **kwargs)
+
+async def patch_part_id_enable(part_id, data, **kwargs):
+    logger.debug(f"<patch_part_id_enable> part_id={part_id}")
+    path = f"api/v1/components/{sanitize(part_id)}/enable"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _patch(url, data=data, **kwargs)
+
+async def get_subcomponents(part_id, **kwargs):
+    logger.debug(f"<get_subcomponents> part_id={part_id}")
+    path = f"api/v1/components/{sanitize(part_id)}/subcomponents"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def patch_subcomponents(part_id, data, **kwargs):
+    logger.debug(f"<patch_subcomponents> part_id={part_id}")
+    path = f"api/v1/components/{sanitize(part_id)}/subcomponents"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _patch(url, data=data, **kwargs)
+
+##############################################################################
+#
+#  COMPONENT TYPES
+#
+##############################################################################
+
+async def get_component_type(part_type_id, **kwargs):
+    logger.debug(f"<get_component_type> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_component_type_connectors(part_type_id, **kwargs):
+    logger.debug(f"<get_component_type_connectors> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}/connectors"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_component_type_specifications(part_type_id, **kwargs):
+    logger.debug(f"<get_component_type_specifications> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{sanitize(part_type_id)}/specifications"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_component_types(project_id, system_id, subsystem_id=None, *,
+                        full_name=None, comments=None,
+                        page=None, size=None, fields=None, **kwargs):
+    logger.debug(f"<get_component_types> project_id={project_id}, "
+                    f"system_id={system_id}, subsystem_id={subsystem_id}")
+
+    # See the note in the synchronous version about the two REST API
+    # methods this uses.
+    if subsystem_id is None:
+        path = (f"api/v1/component-types/{sanitize(project_id)}/"
+                f"{sanitize(system_id)}")
+    else:
+        path = (f"api/v1/component-types/{sanitize(project_id)}/"
+                f"{sanitize(system_id)}/{sanitize(subsystem_id)}")
+    url = f"https://{config.rest_api}/{path}"
+
+    params = []
+    if page is not None:
+        params.append(("page", page))
+    if size is not None:
+        params.append(("size", size))
+    if full_name is not None:
+        params.append(("full_name", full_name))
+    if comments is not None:
+        params.append(("comments", comments))
+    if fields is not None:
+        params.append(("fields", ",".join(fields)))
+
+    return await _get(url, params=params, **kwargs)
+
+##############################################################################
+#
+#  TESTS
+#
+##############################################################################
+
+async def get_test_types(part_type_id, **kwargs):
+    logger.debug(f"<get_test_types> part_type_id={part_type_id}")
+    path = f"api/v1/component-types/{part_type_id}/test-types"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_test_type(part_type_id, test_type_id, **kwargs):
+    logger.debug(f"<get_test_type> part_type_id={part_type_id}, "
+                f"test_type_id={test_type_id}")
+    path = f"api/v1/component-types/{part_type_id}/test-types/{test_type_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_test_type_by_oid(oid, **kwargs):
+    logger.debug(f"<get_test_type_by_oid> oid={oid}")
+    path = f"api/v1/component-test-types/{oid}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+##############################################################################
+#
+#  MISCELLANEOUS
+#
+##############################################################################
+
+async def whoami(**kwargs):
+    logger.debug(f"<whoami>")
+    path = "api/v1/users/whoami"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_countries(**kwargs):
+    logger.debug(f"<get_countries>")
+    path = "api/v1/countries"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_institutions(**kwargs):
+    logger.debug(f"<get_institutions>")
+    path = "api/v1/institutions"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_manufacturers(**kwargs):
+    logger.debug(f"<get_manufacturers>")
+    path = "api/v1/manufacturers"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_projects(**kwargs):
+    logger.debug(f"<get_projects>")
+    path = "api/v1/projects"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_roles(**kwargs):
+    logger.debug(f"<get_roles>")
+    path = "api/v1/roles"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_users(**kwargs):
+    logger.debug(f"<get_users>")
+    path = "api/v1/users"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_user(user_id, **kwargs):
+    logger.debug(f"<get_user> user_id={user_id}")
+    path = f"api/v1/users/{user_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_role(role_id, **kwargs):
+    logger.debug(f"<get_role> role_id={role_id}")
+    path = f"api/v1/roles/{role_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_subsystems(project_id, system_id, **kwargs):
+    logger.debug(f"<get_subsystems> project_id={project_id}, system_id={system_id}")
+    path = f"api/v1/subsystems/{project_id}/{system_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_subsystem(project_id, system_id, subsystem_id, **kwargs):
+    logger.debug(f"<get_subsystem> project_id={project_id}, "
+                    f"system_id={system_id}, subsystem_id={subsystem_id}")
+    path = f"api/v1/subsystems/{project_id}/{system_id}/{subsystem_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_systems(project_id, **kwargs):
+    logger.debug(f"<get_systems> project_id={project_id}")
+    path = f"api/v1/systems/{project_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+async def get_system(project_id, system_id, **kwargs):
+    logger.debug(f"<get_system> project_id={project_id}, system_id={system_id}")
+    path = f"api/v1/systems/{project_id}/{system_id}"
+    url = f"https://{config.rest_api}/{path}"
+
+    return await _get(url, **kwargs)
+
+##############################################################################
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,1286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/LocalServer.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+An in-memory stand-in for the HWDB REST API, for running tests and
+benchmarks without the DEV server. It implements the V1 routes used in
+Sisyphus.RestApiV1, returning the same structures (including pagination
+and "status"/"data" error responses) as the real server.
+
+    from Sisyphus.RestApiV1.LocalServer import LocalServer
+    import Sisyphus.RestApiV1 as ra
+
+    with LocalServer(latency=0.05, error_rate=0.01) as server:
+        server.connect()       # point Sisyphus.RestApiV1 at this server
+        resp = ra.get_hwitem("Z00100300001-00001")
+
+The server uses HTTPS with a self-signed certificate that it generates
+when it starts. The same file is used as the client certificate by
+connect(), since the server doesn't check who the client is.
+
+To run it from the command line, use bin/local-server.py.
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import Sisyphus.Configuration as Config
+import os
+import re
+import ssl
+import json
+import time
+import uuid
+import random
+import hashlib
+import tempfile
+import threading
+import mimetypes
+import ipaddress
+import datetime
+import urllib.parse
+from copy import deepcopy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+DEFAULT_PREFIX = "/cdbdev"
+DEFAULT_PAGE_SIZE = 100
+
+class NotFound(Exception):
+    """raised by a route when the thing it's looking for doesn't exist"""
+
+class BadRequest(Exception):
+    """raised by a route when the request data is invalid"""
+
+def _now():
+    return datetime.datetime.now().astimezone().isoformat()
+
+def _wildcard(pattern):
+    # The REST API filters use postgres wildcards
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c)
+                        for c in pattern)
+    return re.compile(f"^{regex}$", re.IGNORECASE)
+
+
+##############################################################################
+#
+#  DATA STORE
+#
+##############################################################################
+
+class HWDBStore:
+    '''The data behind a LocalServer
+
+    Everything is kept in dictionaries guarded by a single lock. The
+    add_* methods are for setting up a test; the REST routes in
+    LocalServer are the only other things that change the data.
+    '''
+
+    def __init__(self, *, user=None):
+        self.lock = threading.RLock()
+
+        self.user = user or {
+            "active": True,
+            "administrator": False,
+            "affiliation": "University of Minnesota",
+            "architect": False,
+            "email": "localuser@example.com",
+            "full_name": "Local User",
+            "roles": [],
+            "user_id": 1,
+            "username": "localuser",
+        }
+
+        self.countries = {}
+        self.institutions = {}
+        self.manufacturers = {}
+        self.roles = {}
+        self.users = {self.user["user_id"]: self.user}
+
+        self.projects = {}
+        self.systems = {}
+        self.subsystems = {}
+        self.component_types = {}
+        self.test_types = {}
+        self.components = {}
+        self.subcomponents = {}
+        self.tests = {}
+        self.images = {}
+
+        self._next_component_id = 1
+        self._next_test_type_id = 1
+        self._next_test_id = 1
+        self._next_serial = {}
+
+    @property
+    def creator(self):
+        return {
+            "id": self.user["user_id"],
+            "name": self.user["full_name"],
+            "username": self.user["username"],
+        }
+
+    #-----------------------------------------------------------------------------
+
+    def add_country(self, code, name):
+        with self.lock:
+            self.countries[code] = {"code": code, "name": name}
+
+    def add_institution(self, inst_id, name, country_code):
+        with self.lock:
+            self.institutions[inst_id] = {
+                "country": deepcopy(self.countries[country_code]),
+                "id": inst_id,
+                "name": name,
+            }
+
+    def add_manufacturer(self, mfr_id, name):
+        with self.lock:
+            self.manufacturers[mfr_id] = {"id": mfr_id, "name": name}
+
+    def add_role(self, role_id, name):
+        with self.lock:
+            self.roles[role_id] = {"component_types": [], "id": role_id, "name": name}
+
+    def add_project(self, project_id, name, comments=None):
+        with self.lock:
+            self.projects[project_id] = {
+                "comments": comments,
+                "created": _now(),
+                "creator": self.creator,
+                "id": project_id,
+                "name": name,
+            }
+
+    def add_system(self, project_id, system_id, name, comments=None):
+        with self.lock:
+            self.systems[project_id, system_id] = {
+                "comments": comments,
+                "created": _now(),
+                "creator": self.creator,
+                "id": system_id,
+                "name": name,
+                "project_id": project_id,
+            }
+
+    def add_subsystem(self, project_id, system_id, subsystem_id, name, comments=None):
+        with self.lock:
+            self.subsystems[project_id, system_id, subsystem_id] = {
+                "comments": comments,
+                "created": _now(),
+                "creator": self.creator,
+                "project_id": project_id,
+                "subsystem_id": subsystem_id,
+                "subsystem_name": name,
+                "system_id": system_id,
+            }
+
+    def add_component_type(self, project_id, system_id, subsystem_id, name, *,
+                           part_type_id=None,
+                           specifications=None,
+                           connectors=None,
+                           comments=None,
+                           manufacturer_ids=(),
+                           role_ids=()):
+        '''Add a component type and return its part_type_id
+
+        If 'part_type_id' isn't given, the next one available for the
+        subsystem is used.
+        '''
+        with self.lock:
+            if part_type_id is None:
+                prefix = f"{project_id}{system_id:03d}{subsystem_id:03d}"
+                count = sum(1 for k in self.component_types if k.startswith(prefix))
+                part_type_id = f"{prefix}{count+1:05d}"
+
+            system = self.systems[project_id, system_id]
+            subsystem = self.subsystems[project_id, system_id, subsystem_id]
+
+            self.component_types[part_type_id] = {
+                "category": "generic",
+                "comments": comments,
+                "connectors": dict(connectors or {}),
+                "created": _now(),
+                "creator": self.creator,
+                "full_name": (f"{project_id}.{system['name']}."
+                              f"{subsystem['subsystem_name']}.{name}"),
+                "id": len(self.component_types) + 1,
+                "manufacturers": [deepcopy(self.manufacturers[m]) for m in manufacturer_ids],
+                "name": name,
+                "part_type_id": part_type_id,
+                "project_id": project_id,
+                "properties": {
+                    "specifications": [
+                        {
+                            "created": _now(),
+                            "creator": self.user["full_name"],
+                            "datasheet": deepcopy(specifications or {}),
+                            "version": 0,
+                        }
+                    ]
+                },
+                "roles": [{"id": r, "name": self.roles[r]["name"]} for r in role_ids],
+                "subsystem": {
+                    "id": subsystem_id,
+                    "name": subsystem["subsystem_name"],
+                },
+                "subsystem_id": subsystem_id,
+                "system_id": system_id,
+            }
+            for r in role_ids:
+                self.roles[r]["component_types"].append(
+                        {"name": name, "part_type_id": part_type_id})
+            return part_type_id
+
+    def add_test_type(self, part_type_id, name, specifications=None, comments=None):
+        '''Add a test type and return its id'''
+        with self.lock:
+            test_type_id = self._next_test_type_id
+            self._next_test_type_id += 1
+            self.test_types[test_type_id] = {
+                "comments": comments,
+                "created": _now(),
+                "creator": self.creator,
+                "id": test_type_id,
+                "name": name,
+                "part_type_id": part_type_id,
+                "properties": {
+                    "specifications": [
+                        {
+                            "created": _now(),
+                            "creator": self.user["full_name"],
+                            "datasheet": deepcopy(specifications or {}),
+                            "version": 0,
+                        }
+                    ]
+                },
+            }
+            return test_type_id
+
+    def add_test(self, part_id, test_type_id, test_data, comments=None):
+        '''Record a test result for a component and return its record'''
+        with self.lock:
+            self.get_hwitem(part_id)
+            test_type = self.test_types[test_type_id]
+            test_id = self._next_test_id
+            self._next_test_id += 1
+            test = {
+                "comments": comments,
+                "created": _now(),
+                "creator": self.creator,
+                "id": test_id,
+                "test_data": deepcopy(test_data),
+                "test_type": {"id": test_type_id, "name": test_type["name"]},
+            }
+            self.tests.setdefault(part_id, []).append(test)
+            return test
+
+    def add_image(self, content, image_name, *, part_id=None, part_type_id=None,
+                  comments=None):
+        '''Attach an image to a component or component type and return its id'''
+        with self.lock:
+            image_id = str(uuid.uuid1())
+            self.images[image_id] = {
+                "comments": comments,
+                "content": content,
+                "created": _now(),
+                "creator": self.creator,
+                "image_id": image_id,
+                "image_name": image_name,
+                "library": "comp" if part_id is not None else "type",
+                "part_id": part_id,
+                "part_type_id": part_type_id,
+            }
+            return image_id
+
+    def _check_specifications(self, part_type_id, specifications):
+        # The HWDB refuses fields that aren't in the type's datasheet
+        if specifications is None:
+            return
+        if not isinstance(specifications, dict):
+            raise BadRequest("Invalid specifications: expected a JSON object")
+        datasheet = self.component_types[part_type_id]["properties"]["specifications"][0]["datasheet"]
+        unknown = [key for key in specifications if key not in datasheet and key != "_meta"]
+        if len(unknown) > 0:
+            raise BadRequest(f"Invalid specifications: {', '.join(unknown)} not in the datasheet")
+
+    def add_hwitem(self, part_type_id, data):
+        '''Create a component from the same data that post_hwitem() sends
+
+        Returns the new component's record. Raises BadRequest if the
+        data is not acceptable.
+        '''
+        with self.lock:
+            if part_type_id not in self.component_types:
+                raise NotFound(f"Component type {part_type_id} does not exist")
+
+            country_code = data.get("country_code", None)
+            if country_code not in self.countries:
+                raise BadRequest(f"Invalid country code: {country_code}")
+
+            inst_id = (data.get("institution", None) or {}).get("id", None)
+            if inst_id not in self.institutions:
+                raise BadRequest(f"Invalid institution: {inst_id}")
+
+            mfr_id = (data.get("manufacturer", None) or {}).get("id", None)
+            if mfr_id is not None and mfr_id not in self.manufacturers:
+                raise BadRequest(f"Invalid manufacturer: {mfr_id}")
+
+            serial_number = data.get("serial_number", None)
+            if serial_number is not None:
+                for item in self.components.values():
+                    if (item["component_type"]["part_type_id"] == part_type_id
+                            and item["serial_number"] == serial_number):
+                        raise BadRequest(f"Serial number {serial_number} already "
+                                         f"exists for component type {part_type_id}")
+
+            self._check_specifications(part_type_id, data.get("specifications", None))
+
+            serial = self._next_serial.get(part_type_id, 1)
+            self._next_serial[part_type_id] = serial + 1
+            part_id = f"{part_type_id}-{serial:05d}"
+
+            component_id = self._next_component_id
+            self._next_component_id += 1
+
+            comp_type = self.component_types[part_type_id]
+            specs = data.get("specifications", None)
+
+            item = {
+                "batch": None,
+                "comments": data.get("comments", None),
+                "component_id": component_id,
+                "component_type": {
+                    "name": comp_type["name"],
+                    "part_type_id": part_type_id,
+                },
+                "country_code": country_code,
+                "created": _now(),
+                "creator": self.creator,
+                "enabled": data.get("enabled", False),
+                "institution": {
+                    "id": inst_id,
+                    "name": self.institutions[inst_id]["name"],
+                },
+                "manufacturer": deepcopy(self.manufacturers.get(mfr_id, None)),
+                "part_id": part_id,
+                "serial_number": serial_number,
+                "specifications": [deepcopy(specs)] if specs is not None else [],
+                "specs_version": None,
+            }
+            self.components[part_id] = item
+            self.subcomponents[part_id] = {
+                    pos: None for pos in comp_type["connectors"].keys()}
+            return item
+
+    def get_hwitem(self, part_id):
+        with self.lock:
+            if part_id not in self.components:
+                raise NotFound(f"Component {part_id} does not exist")
+            return self.components[part_id]
+
+
+##############################################################################
+#
+#  SAMPLE DATA
+#
+##############################################################################
+
+def populate(store):
+    '''Fill a store with a small, self-consistent set of sample data
+
+    The IDs match the ones used in the tests in test/RestApiV1 where
+    possible.
+    '''
+    store.add_country("US", "United States")
+    store.add_country("CH", "Switzerland")
+    store.add_country("GB", "United Kingdom")
+
+    store.add_institution(186, "University of Minnesota Twin Cities", "US")
+    store.add_institution(1, "CERN", "CH")
+    store.add_institution(2, "University of Cambridge", "GB")
+
+    store.add_manufacturer(7, "Hajime Inc")
+    store.add_manufacturer(26, "Kansas State University")
+    store.add_manufacturer(27, "CERN")
+
+    store.add_role(4, "tester")
+    store.add_role(3, "type-manager")
+    store.user["roles"] = [{"id": 4, "name": "tester"}, {"id": 3, "name": "type-manager"}]
+
+    store.add_project("D", "DUNE")
+    store.add_system("D", 1, "FD1-HD Complete Detector")
+    store.add_subsystem("D", 1, 1, "FD1")
+    store.add_system("D", 5, "FD1-HD HVS")
+    store.add_subsystem("D", 5, 13, "TPC HV Assembly")
+    store.add_project("Z", "Dummy Z")
+    store.add_system("Z", 1, "Sisyphus Test")
+    store.add_subsystem("Z", 1, 3, "Widgets")
+
+    store.add_component_type("D", 1, 1, "FD1 Complete Detector",
+                             part_type_id="D00100100001")
+
+    for n, name in enumerate(["CPA Plane", "FC Top SS", "FC Top NJ"], 1):
+        store.add_component_type("D", 5, 13, name, part_type_id=f"D0050130000{n}",
+                                 specifications={"Drawing Number": None})
+    store.add_component_type("D", 5, 13, "CPA/FC Assembly US",
+            part_type_id="D00501341001",
+            specifications={"Drawing Number": "DFD-13-5100", "Name": "CPA/FC Assembly US"},
+            connectors={
+                "CPA Plane PID": "D00501300001",
+                "FC Top SS PID": "D00501300002",
+                "FC Top NJ PID": "D00501300003",
+            },
+            comments="Setting up this Type",
+            manufacturer_ids=(26, 27),
+            role_ids=(4,))
+    store.add_test_type("D00501341001", "CPAFC assembly US QC check",
+                        specifications={"Gap Top": -1, "Gap Bot": -1})
+
+    store.add_component_type("Z", 1, 3, "Test Type 001",
+            part_type_id="Z00100300001",
+            specifications={"Widget ID": None, "Color": None, "Comment": None},
+            manufacturer_ids=(7,),
+            role_ids=(4,))
+    store.add_test_type("Z00100300001", "Test Test 001",
+                        specifications={"Widget ID": None, "Result": None})
+
+    return store
+
+
+##############################################################################
+#
+#  HTTP SERVER
+#
+##############################################################################
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections open, like the real server does. This matters for
+    # benchmarking, since setting up a TLS connection is expensive.
+    protocol_version = "HTTP/1.1"
+    server_version = "SisyphusLocalServer"
+
+    def log_message(self, format, *args):
+        logger.debug(f"<LocalServer> {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        self.server.local_server._handle(self, "GET")
+
+    def do_POST(self):
+        self.server.local_server._handle(self, "POST")
+
+    def do_PATCH(self):
+        self.server.local_server._handle(self, "PATCH")
+
+
+class _Response:
+    def __init__(self, status_code, body, content_type="application/json", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class LocalServer:
+    '''A local HTTPS server that behaves like the HWDB REST API
+
+    Arguments:
+        host, port: where to listen. Port 0 picks a free port.
+        store: an HWDBStore. If None, a store filled by populate() is used.
+        prefix: the path before "/api/v1" in URLs, like "/cdbdev" on DEV
+        latency: seconds to wait before answering each request
+        latency_jitter: up to this many extra seconds, chosen at random
+        error_rate: the fraction of requests that get 'error_status'
+            instead of being handled
+        error_status: the status code for injected errors
+        retry_after: if not None, sent as "Retry-After" with injected errors
+        seed: seed for the random number generator, so that a run with
+            injected errors can be repeated exactly
+
+    The fault settings may be changed while the server is running.
+
+    Every request is recorded in 'request_log', as (method, path), and
+    'max_in_flight' is the most requests that were being handled at once.
+    reset_log() clears both.
+    '''
+
+    def __init__(self, host="127.0.0.1", port=0, *,
+                 store=None,
+                 prefix=DEFAULT_PREFIX,
+                 latency=0.0,
+                 latency_jitter=0.0,
+                 error_rate=0.0,
+                 error_status=503,
+                 retry_after=None,
+                 seed=None):
+        self.host = host
+        self.port = port
+        self.store = store if store is not None else populate(HWDBStore())
+        self.prefix = prefix.rstrip("/")
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self.request_log = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self._tempdir = None
+        self._httpd = None
+        self._thread = None
+        self._saved_settings = None
+        self._saved_verify = None
+
+        self._routes = [
+            ("GET", r"components/(?P<part_id>[^/]+)", self._get_hwitem),
+            ("GET", r"components/(?P<part_id>[^/]+)/images", self._get_component_images),
+            ("GET", r"components/(?P<part_id>[^/]+)/subcomponents", self._get_subcomponents),
+            ("GET", r"components/(?P<part_id>[^/]+)/tests", self._get_hwitem_tests),
+            ("PATCH", r"components/(?P<part_id>[^/]+)", self._patch_hwitem),
+            ("PATCH", r"components/(?P<part_id>[^/]+)/enable", self._patch_enable),
+            ("PATCH", r"components/(?P<part_id>[^/]+)/subcomponents", self._patch_subcomponents),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)", self._get_component_type),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/components", self._get_hwitems),
+            ("POST", r"component-types/(?P<part_type_id>[^/]+)/components", self._post_hwitem),
+            ("POST", r"component-types/(?P<part_type_id>[^/]+)/bulk-add", self._post_bulk_hwitems),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/connectors",
+                    self._get_component_type_connectors),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/specifications",
+                    self._get_component_type_specifications),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/images",
+                    self._get_component_type_images),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/test-types", self._get_test_types),
+            ("GET", r"component-types/(?P<part_type_id>[^/]+)/test-types/(?P<test_type_id>\d+)",
+                    self._get_test_type),
+            ("GET", r"component-types/(?P<project_id>[A-Za-z])/(?P<system_id>\d+)",
+                    self._get_component_types),
+            ("GET", r"component-types/(?P<project_id>[A-Za-z])/(?P<system_id>\d+)/"
+                    r"(?P<subsystem_id>\d+)", self._get_component_types),
+            ("GET", r"component-test-types/(?P<oid>\d+)", self._get_test_type_by_oid),
+            ("GET", r"img/(?P<image_id>[^/]+)", self._get_image),
+            ("GET", r"users/whoami", self._whoami),
+            ("GET", r"users", self._get_users),
+            ("GET", r"users/(?P<user_id>\d+)", self._get_user),
+            ("GET", r"countries", self._get_countries),
+            ("GET", r"institutions", self._get_institutions),
+            ("GET", r"manufacturers", self._get_manufacturers),
+            ("GET", r"projects", self._get_projects),
+            ("GET", r"roles", self._get_roles),
+            ("GET", r"roles/(?P<role_id>\d+)", self._get_role),
+            ("GET", r"systems/(?P<project_id>[^/]+)", self._get_systems),
+            ("GET", r"systems/(?P<project_id>[^/]+)/(?P<system_id>\d+)", self._get_system),
+            ("GET", r"subsystems/(?P<project_id>[^/]+)/(?P<system_id>\d+)", self._get_subsystems),
+            ("GET", r"subsystems/(?P<project_id>[^/]+)/(?P<system_id>\d+)/(?P<subsystem_id>\d+)",
+                    self._get_subsystem),
+        ]
+        self._routes = [(method, re.compile(f"^{pattern}$"), fn)
+                            for method, pattern, fn in self._routes]
+
+    #-----------------------------------------------------------------------------
+
+    @property
+    def rest_api(self):
+        '''The value to use for the "rest api" setting, e.g., "localhost:8443/cdbdev"'''
+        return f"localhost:{self.port}{self.prefix}"
+
+    @property
+    def certificate(self):
+        '''The PEM file holding the server's certificate and key'''
+        return os.path.join(self._tempdir.name, "localserver.pem")
+
+    def ssl_context(self):
+        '''An SSL context for clients that trusts this server's certificate
+
+        Use this for Sisyphus.RestApiV1.Asynchronous, e.g.,
+            ara.session_kwargs["ssl"] = server.ssl_context()
+        '''
+        context = ssl.create_default_context(cafile=self.certificate)
+        context.load_cert_chain(self.certificate)
+        return context
+
+    def start(self):
+        if self._httpd is not None:
+            return self
+        self._tempdir = tempfile.TemporaryDirectory(prefix="sisyphus_localserver_")
+        _write_self_signed_cert(self.certificate, self.host)
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.local_server = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certificate)
+        self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+        self.port = self._httpd.server_address[1]
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="LocalServer", daemon=True)
+        self._thread.start()
+        logger.info(f"<LocalServer> listening at https://{self.rest_api}")
+        return self
+
+    def serve_forever(self):
+        '''Start the server (if necessary) and block until interrupted'''
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self.disconnect()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._tempdir.cleanup()
+        self._httpd = self._thread = self._tempdir = None
+        logger.info("<LocalServer> stopped")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    #-----------------------------------------------------------------------------
+
+    def connect(self):
+        '''Point Sisyphus.RestApiV1 at this server
+
+        Changes the active profile in memory only (it is never saved) and
+        restarts the session so that it trusts this server's certificate.
+        Call disconnect() (or stop the server) to put things back.
+        '''
+        import Sisyphus.RestApiV1 as ra
+
+        if self._saved_settings is None:
+            profile = config.active_profile
+            self._saved_settings = {key: profile.get(key, None) for key in
+                    (Config.KW_REST_API, Config.KW_CERT_TYPE, Config.KW_CERTIFICATE)}
+            self._saved_verify = ra.session_kwargs.get("verify", None)
+
+        config.active_profile[Config.KW_REST_API] = self.rest_api
+        config.active_profile[Config.KW_CERT_TYPE] = Config.KW_PEM
+        config.active_profile[Config.KW_CERTIFICATE] = self.certificate
+        ra.start_session()
+        # This has to be passed with every request, rather than set on the
+        # session, or REQUESTS_CA_BUNDLE would take priority over it.
+        ra.session_kwargs["verify"] = self.certificate
+
+    def disconnect(self):
+        '''Undo connect()'''
+        if self._saved_settings is None:
+            return
+        import Sisyphus.RestApiV1 as ra
+
+        config.active_profile.update(self._saved_settings)
+        self._saved_settings = None
+        if self._saved_verify is None:
+            ra.session_kwargs.pop("verify", None)
+        else:
+            ra.session_kwargs["verify"] = self._saved_verify
+        ra.start_session()
+
+    def reset_log(self):
+        with self._log_lock:
+            self.request_log = []
+            self.max_in_flight = self.in_flight
+
+    #-----------------------------------------------------------------------------
+
+    def _handle(self, handler, method):
+        url = urllib.parse.urlsplit(handler.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = urllib.parse.unquote(url.path)
+
+        with self._log_lock:
+            self.request_log.append((method, handler.path))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self._respond(handler, method, path, query)
+        finally:
+            with self._log_lock:
+                self.in_flight -= 1
+
+    def _respond(self, handler, method, path, query):
+        body = None
+        length = int(handler.headers.get("Content-Length", 0) or 0)
+        if length:
+            body = handler.rfile.read(length)
+
+        with self._random_lock:
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            inject_error = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        if inject_error:
+            resp = self._injected_error()
+        else:
+            resp = self._dispatch(method, path, query, body, handler)
+
+        handler.send_response(resp.status_code)
+        handler.send_header("Content-Type", resp.content_type)
+        handler.send_header("Content-Length", str(len(resp.body)))
+        for key, value in resp.headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        if resp.status_code != 304:
+            handler.wfile.write(resp.body)
+
+    def _injected_error(self):
+        # Gateways in front of the real server send HTML error pages, so
+        # that's what we'll send, too.
+        body = (f"<html><head><title>{self.error_status}</title></head>"
+                f"<body><h1>Error {self.error_status}</h1></body></html>").encode("utf-8")
+        headers = {}
+        if self.retry_after is not None:
+            headers["Retry-After"] = str(self.retry_after)
+        return _Response(self.error_status, body, "text/html", headers)
+
+    def _dispatch(self, method, path, query, body, handler):
+        index = path.find("/api/v1/")
+        if index < 0:
+            return self._json(404, self._error(f"Not found: {path}"))
+        route = path[index + len("/api/v1/"):].rstrip("/")
+
+        for route_method, pattern, fn in self._routes:
+            match = pattern.match(route)
+            if match is None or route_method != method:
+                continue
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                return self._json(400, self._error("The request body is not valid JSON"))
+            try:
+                with self.store.lock:
+                    result = fn(route=route, query=query, data=data,
+                                headers=handler.headers, **match.groupdict())
+            except NotFound as exc:
+                return self._json(404, self._error(str(exc)))
+            except BadRequest as exc:
+                return self._json(400, self._error(str(exc)))
+            except Exception as exc:
+                logger.exception("<LocalServer> unhandled exception")
+                return _Response(500, b"<html><body><h1>Internal Server Error</h1></body></html>",
+                                 "text/html")
+
+            if isinstance(result, _Response):
+                return result
+
+            resp = self._json(200, result)
+            if method == "GET":
+                etag = '"' + hashlib.sha1(resp.body).hexdigest() + '"'
+                resp.headers["ETag"] = etag
+                if handler.headers.get("If-None-Match", None) == etag:
+                    return _Response(304, b"", headers={"ETag": etag})
+            return resp
+
+        return self._json(404, self._error(f"Not found: {path}"))
+
+    @staticmethod
+    def _json(status_code, obj):
+        return _Response(status_code, json.dumps(obj, indent=2, sort_keys=True).encode("utf-8"))
+
+    @staticmethod
+    def _error(msg):
+        return {"data": msg, "status": "ERROR"}
+
+    def _link(self, route, rel="self"):
+        return {"href": f"{self.prefix}/api/v1/{route}", "rel": rel}
+
+    def _page(self, route, query, items, page_size=DEFAULT_PAGE_SIZE, **extra):
+        '''Build a paginated response like the REST API does'''
+        try:
+            page = int(query.get("page", ["1"])[0])
+            size = int(query.get("size", [str(page_size)])[0])
+        except ValueError:
+            raise BadRequest("page and size must be integers")
+        if page < 1 or size < 1:
+            raise BadRequest("page and size must be positive")
+
+        pages = (len(items) + size - 1) // size
+        start = (page - 1) * size
+
+        def page_href(n):
+            if n < 1 or n > pages:
+                return None
+            return f"{self.prefix}/api/v1/{route}?page={n}&size={size}"
+
+        return {
+            **extra,
+            "data": items[start:start+size],
+            "link": {"href": page_href(page) or f"{self.prefix}/api/v1/{route}", "rel": "self"},
+            "pagination": {
+                "next": page_href(page + 1),
+                "page": page,
+                "pages": pages,
+                "prev": page_href(page - 1),
+            },
+            "status": "OK",
+        }
+
+    #-----------------------------------------------------------------------------
+    #  components
+    #-----------------------------------------------------------------------------
+
+    def _component_type(self, part_type_id):
+        if part_type_id not in self.store.component_types:
+            raise NotFound(f"Component type {part_type_id} does not exist")
+        return self.store.component_types[part_type_id]
+
+    def _get_hwitem(self, route, part_id, **kwargs):
+        item = self.store.get_hwitem(part_id)
+        return {
+            "data": deepcopy(item),
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_hwitems(self, route, query, part_type_id, **kwargs):
+        comp_type = self._component_type(part_type_id)
+        items = [item for item in self.store.components.values()
+                    if item["component_type"]["part_type_id"] == part_type_id]
+
+        if "serial_number" in query:
+            pattern = _wildcard(query["serial_number"][0])
+            items = [item for item in items
+                        if item["serial_number"] is not None
+                            and pattern.match(item["serial_number"])]
+        if "part_id" in query:
+            pattern = _wildcard(query["part_id"][0])
+            items = [item for item in items if pattern.match(item["part_id"])]
+
+        items = [
+            {
+                "component_id": item["component_id"],
+                "created": item["created"],
+                "creator": item["creator"],
+                "link": self._link(f"components/{item['part_id']}"),
+                "part_id": item["part_id"],
+                "serial_number": item["serial_number"],
+                "specifications": deepcopy(item["specifications"]),
+            }
+            for item in items
+        ]
+        return self._page(route, query, items,
+                component_type={"name": comp_type["name"], "part_type_id": part_type_id})
+
+    def _post_hwitem(self, data, part_type_id, **kwargs):
+        if not isinstance(data, dict):
+            raise BadRequest("Expected a JSON object")
+        item = self.store.add_hwitem(part_type_id, data)
+        return {
+            "component_id": item["component_id"],
+            "data": "Created",
+            "part_id": item["part_id"],
+            "status": "OK",
+        }
+
+    def _post_bulk_hwitems(self, data, part_type_id, **kwargs):
+        if not isinstance(data, dict):
+            raise BadRequest("Expected a JSON object")
+        try:
+            count = int(data.get("count", 0))
+        except (TypeError, ValueError):
+            raise BadRequest("count must be an integer")
+        if count < 1:
+            raise BadRequest("count must be at least 1")
+
+        item_data = {key: value for key, value in data.items() if key != "count"}
+        created = [self.store.add_hwitem(part_type_id, item_data) for _ in range(count)]
+        return {
+            "data": [{"component_id": item["component_id"], "part_id": item["part_id"]}
+                        for item in created],
+            "status": "OK",
+        }
+
+    def _patch_hwitem(self, data, part_id, **kwargs):
+        if not isinstance(data, dict):
+            raise BadRequest("Expected a JSON object")
+        item = self.store.get_hwitem(part_id)
+        if data.get("part_id", part_id) != part_id:
+            raise BadRequest("part_id in the data does not match the URL")
+
+        if "manufacturer" in data:
+            mfr_id = (data["manufacturer"] or {}).get("id", None)
+            if mfr_id is not None and mfr_id not in self.store.manufacturers:
+                raise BadRequest(f"Invalid manufacturer: {mfr_id}")
+            item["manufacturer"] = deepcopy(self.store.manufacturers.get(mfr_id, None))
+        for key in ("comments", "serial_number"):
+            if key in data:
+                item[key] = data[key]
+        if data.get("specifications", None) is not None:
+            self.store._check_specifications(item["component_type"]["part_type_id"],
+                                             data["specifications"])
+            # The newest version is first
+            item["specifications"].insert(0, deepcopy(data["specifications"]))
+
+        return {
+            "component_id": item["component_id"],
+            "data": "Updated",
+            "part_id": part_id,
+            "status": "OK",
+        }
+
+    def _patch_enable(self, data, part_id, **kwargs):
+        if not isinstance(data, dict) or "enabled" not in data:
+            raise BadRequest("'enabled' is required")
+        item = self.store.get_hwitem(part_id)
+        item["enabled"] = bool(data["enabled"])
+        if "comments" in data:
+            item["comments"] = data["comments"]
+        return {
+            "component_id": item["component_id"],
+            "data": "Updated",
+            "part_id": part_id,
+            "status": "OK",
+        }
+
+    def _get_subcomponents(self, route, part_id, **kwargs):
+        self.store.get_hwitem(part_id)
+        data = []
+        for position, sub_part_id in self.store.subcomponents.get(part_id, {}).items():
+            if sub_part_id is None:
+                continue
+            sub_item = self.store.components[sub_part_id]
+            data.append({
+                "component_id": sub_item["component_id"],
+                "functional_position": position,
+                "part_id": sub_part_id,
+                "type_name": sub_item["component_type"]["name"],
+            })
+        return {
+            "data": data,
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_hwitem_tests(self, route, query, part_id, **kwargs):
+        self.store.get_hwitem(part_id)
+        tests = self.store.tests.get(part_id, [])
+        if query.get("history", ["false"])[0] != "true":
+            # only the latest result of each test type
+            latest = {test["test_type"]["id"]: test for test in tests}
+            tests = list(latest.values())
+        return {
+            "data": deepcopy(tests),
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _patch_subcomponents(self, data, part_id, **kwargs):
+        if not isinstance(data, dict) or not isinstance(data.get("subcomponents", None), dict):
+            raise BadRequest("'subcomponents' is required")
+        self.store.get_hwitem(part_id)
+        slots = self.store.subcomponents.setdefault(part_id, {})
+
+        for position, sub_part_id in data["subcomponents"].items():
+            if position not in slots:
+                raise BadRequest(f"Invalid functional position: {position}")
+            if sub_part_id is not None:
+                self.store.get_hwitem(sub_part_id)
+                for other_part_id, other_slots in self.store.subcomponents.items():
+                    if other_part_id != part_id and sub_part_id in other_slots.values():
+                        raise BadRequest(f"{sub_part_id} is already a subcomponent "
+                                         f"of {other_part_id}")
+        slots.update(data["subcomponents"])
+        return {
+            "data": "Updated",
+            "part_id": part_id,
+            "status": "OK",
+        }
+
+    def _image_list(self, route, key, value):
+        data = []
+        for image in self.store.images.values():
+            if image[key] != value:
+                continue
+            data.append({
+                **{k: image[k] for k in
+                    ("comments", "created", "creator", "image_id", "image_name", "library")},
+                "link": self._link(f"img/{image['image_id']}"),
+            })
+        return {
+            "data": data,
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_component_images(self, route, part_id, **kwargs):
+        self.store.get_hwitem(part_id)
+        return self._image_list(route, "part_id", part_id)
+
+    def _get_component_type_images(self, route, part_type_id, **kwargs):
+        self._component_type(part_type_id)
+        return self._image_list(route, "part_type_id", part_type_id)
+
+    def _get_image(self, image_id, headers, **kwargs):
+        if image_id not in self.store.images:
+            raise NotFound(f"Image {image_id} does not exist")
+        image = self.store.images[image_id]
+        content = image["content"]
+        content_type, _ = mimetypes.guess_type(image["image_name"])
+        content_type = content_type or "application/octet-stream"
+
+        # Only "bytes=N-" is supported, since that's all a resumed download asks for
+        match = re.fullmatch(r"bytes=(\d+)-", headers.get("Range", None) or "")
+        if match is None:
+            return _Response(200, content, content_type, {"Accept-Ranges": "bytes"})
+        start = int(match.group(1))
+        if start >= len(content):
+            return _Response(416, b"", content_type,
+                             {"Content-Range": f"bytes */{len(content)}"})
+        return _Response(206, content[start:], content_type,
+                         {"Content-Range": f"bytes {start}-{len(content)-1}/{len(content)}"})
+
+    #-----------------------------------------------------------------------------
+    #  component types and test types
+    #-----------------------------------------------------------------------------
+
+    def _get_component_type(self, route, part_type_id, **kwargs):
+        comp_type = self._component_type(part_type_id)
+        data = {key: deepcopy(value) for key, value in comp_type.items()
+                    if key not in ("name", "project_id", "system_id", "subsystem_id")}
+        return {
+            "data": data,
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_component_type_connectors(self, route, part_type_id, **kwargs):
+        comp_type = self._component_type(part_type_id)
+        return {
+            "data": deepcopy(comp_type["connectors"]),
+            "link": self._link(route),
+            "part_type_id": part_type_id,
+            "status": "OK",
+        }
+
+    def _get_component_type_specifications(self, route, part_type_id, **kwargs):
+        comp_type = self._component_type(part_type_id)
+        return {
+            "data": deepcopy(comp_type["properties"]["specifications"]),
+            "link": self._link(route),
+            "part_type_id": part_type_id,
+            "status": "OK",
+        }
+
+    def _get_component_types(self, route, query, project_id, system_id,
+                             subsystem_id=None, **kwargs):
+        # A system or subsystem ID of 0 matches anything
+        system_id = int(system_id)
+        subsystem_id = int(subsystem_id) if subsystem_id is not None else 0
+
+        items = []
+        for comp_type in self.store.component_types.values():
+            if comp_type["project_id"] != project_id:
+                continue
+            if system_id and comp_type["system_id"] != system_id:
+                continue
+            if subsystem_id and comp_type["subsystem_id"] != subsystem_id:
+                continue
+            if ("full_name" in query
+                    and not _wildcard(query["full_name"][0]).match(comp_type["full_name"])):
+                continue
+            if ("comments" in query
+                    and not _wildcard(query["comments"][0]).match(comp_type["comments"] or "")):
+                continue
+            items.append({
+                **{k: deepcopy(comp_type[k]) for k in
+                    ("category", "comments", "created", "creator", "full_name", "id",
+                     "part_type_id")},
+                "link": self._link(f"component-types/{comp_type['part_type_id']}"),
+            })
+        return self._page(route, query, items)
+
+    def _test_type_summary(self, test_type):
+        return {
+            "comments": test_type["comments"],
+            "created": test_type["created"],
+            "creator": test_type["creator"],
+            "id": test_type["id"],
+            "link": self._link(f"component-test-types/{test_type['id']}"),
+            "name": test_type["name"],
+        }
+
+    def _test_type_detail(self, route, test_type):
+        comp_type = self._component_type(test_type["part_type_id"])
+        data = {key: deepcopy(value) for key, value in test_type.items()
+                    if key != "part_type_id"}
+        return {
+            "component_type": {"name": comp_type["name"],
+                               "part_type_id": comp_type["part_type_id"]},
+            "data": data,
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_test_types(self, route, part_type_id, **kwargs):
+        comp_type = self._component_type(part_type_id)
+        return {
+            "component_type": {"name": comp_type["name"], "part_type_id": part_type_id},
+            "data": [self._test_type_summary(test_type)
+                        for test_type in self.store.test_types.values()
+                        if test_type["part_type_id"] == part_type_id],
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _get_test_type(self, route, part_type_id, test_type_id, **kwargs):
+        test_type = self.store.test_types.get(int(test_type_id), None)
+        if test_type is None or test_type["part_type_id"] != part_type_id:
+            raise NotFound(f"Test type {test_type_id} does not exist for {part_type_id}")
+        return self._test_type_detail(route, test_type)
+
+    def _get_test_type_by_oid(self, route, oid, **kwargs):
+        test_type = self.store.test_types.get(int(oid), None)
+        if test_type is None:
+            raise NotFound(f"Test type {oid} does not exist")
+        return self._test_type_detail(route, test_type)
+
+    #-----------------------------------------------------------------------------
+    #  lookup lists
+    #-----------------------------------------------------------------------------
+
+    def _simple(self, route, data):
+        return {
+            "data": deepcopy(data),
+            "link": self._link(route),
+            "status": "OK",
+        }
+
+    def _whoami(self, **kwargs):
+        return self._simple(f"users/{self.store.user['user_id']}", self.store.user)
+
+    def _get_users(self, route, **kwargs):
+        return self._simple(route, [
+            {
+                "email": user["email"],
+                "full_name": user["full_name"],
+                "link": self._link(f"users/{user['user_id']}"),
+                "user_id": user["user_id"],
+                "username": user["username"],
+            }
+            for user in self.store.users.values()])
+
+    def _get_user(self, route, user_id, **kwargs):
+        if int(user_id) not in self.store.users:
+            raise NotFound(f"User {user_id} does not exist")
+        return self._simple(route, self.store.users[int(user_id)])
+
+    def _get_countries(self, route, **kwargs):
+        return self._simple(route, sorted(self.store.countries.values(),
+                                          key=lambda x: x["name"]))
+
+    def _get_institutions(self, route, **kwargs):
+        return self._simple(route, sorted(self.store.institutions.values(),
+                                          key=lambda x: x["name"]))
+
+    def _get_manufacturers(self, route, **kwargs):
+        return self._simple(route, sorted(self.store.manufacturers.values(),
+                                          key=lambda x: x["id"]))
+
+    def _get_projects(self, route, **kwargs):
+        return self._simple(route, list(self.store.projects.values()))
+
+    def _get_roles(self, route, **kwargs):
+        return self._simple(route, sorted(self.store.roles.values(), key=lambda x: x["name"]))
+
+    def _get_role(self, route, role_id, **kwargs):
+        if int(role_id) not in self.store.roles:
+            raise NotFound(f"Role {role_id} does not exist")
+        return self._simple(route, self.store.roles[int(role_id)])
+
+    def _get_systems(self, route, query, project_id, **kwargs):
+        items = [
+            {
+                **{k: system[k] for k in ("comments", "created", "creator", "id", "name")},
+                "link": self._link(f"systems/{project_id}/{system['id']}"),
+            }
+            for (proj, _), system in self.store.systems.items() if proj == project_id
+        ]
+        return self._page(route, query, items)
+
+    def _get_system(self, route, project_id, system_id, **kwargs):
+        system = self.store.systems.get((project_id, int(system_id)), None)
+        if system is None:
+            raise NotFound(f"System {project_id}/{system_id} does not exist")
+        return self._simple(route, system)
+
+    def _get_subsystems(self, route, query, project_id, system_id, **kwargs):
+        items = [
+            {
+                **{k: subsystem[k] for k in
+                    ("comments", "created", "creator", "subsystem_id", "subsystem_name")},
+                "link": self._link(f"subsystems/{project_id}/{system_id}/{subsys}"),
+            }
+            for (proj, sys, subsys), subsystem in self.store.subsystems.items()
+                if proj == project_id and sys == int(system_id)
+        ]
+        return self._page(route, query, items)
+
+    def _get_subsystem(self, route, project_id, system_id, subsystem_id, **kwargs):
+        subsystem = self.store.subsystems.get(
+                        (project_id, int(system_id), int(subsystem_id)), None)
+        if subsystem is None:
+            raise NotFound(f"Subsystem {project_id}/{system_id}/{subsystem_id} "
+                           "does not exist")
+        return self._simple(route, subsystem)
+
+
+##############################################################################
+
+def _write_self_signed_cert(filename, host):
+    # Write a PEM file containing a new private key and a certificate
+    # for 'localhost' and 'host' signed with that key
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+
+    alt_names = [x509.DNSName("localhost")]
+    for addr in {"127.0.0.1", host}:
+        try:
+            alt_names.append(x509.IPAddress(ipaddress.ip_address(addr)))
+        except ValueError:
+            alt_names.append(x509.DNSName(addr))
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(minutes=5))
+                .not_valid_after(now + datetime.timedelta(days=7))
+                .add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+                .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+                .sign(key, hashes.SHA256()))
+
+    with open(filename, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    os.chmod(filename, 0o600)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/Multi.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Crawls every item of a component type with a pool of threads:
+
+    from Sisyphus.RestApiV1.Multi import ItemList
+
+    for item in ItemList("Z00100300001", subcomponents=True, stream=True):
+        ...
+
+Requests go through a Client (Sisyphus.RestApiV1.default_client unless
+another is given), so a crawl shares its connection pool, retry policy,
+caches and concurrency limit with everything else using that client.
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import Sisyphus.RestApiV1 as ra
+
+import threading
+import queue
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime
+
+# Put in an ItemList's stream after the last item
+_END = object()
+
+class ItemList:
+    '''Fetches every item of a component type, using a pool of threads
+
+    The pages of the component list are fetched first, and then each item
+    on them. Pages always go ahead of items, so that the total is known
+    (and the rest of the work is queued) as early as possible.
+
+    Everything runs on a ThreadPoolExecutor, driven by a coordinator thread
+    that waits on the futures, so nothing ever polls. Only a few tasks more
+    than 'num_threads' are submitted at a time, so that when the crawl stops
+    early (every serial number in 'serial_numbers' has been found, a task
+    has been abandoned and 'raise_on_abandon' is set, or cancel() was
+    called) the ones that haven't started can be cancelled. Requests
+    already in flight finish, but don't retry, and their results are
+    dropped.
+
+    Requests are made with 'client', or Sisyphus.RestApiV1.default_client
+    if it isn't given. 'page_size' is the size of the pages of the
+    component list, or None for the server's default.
+
+    If 'num_threads' is None, the crawl follows the client's AdaptiveLimit
+    (see Utils.Concurrency), which every request it makes waits on anyway:
+    there are enough threads for its maximum, but only as many tasks are
+    submitted as its current limit allows. 'concurrency' is that limit, or
+    None if there isn't one.
+
+    'fields', if given, lists the fields the caller needs from each item.
+    An item whose row in the component list already has all of them is
+    delivered as that row, without fetching its details, and only the
+    rest are fetched one at a time. If None, every item's details are
+    fetched. When looking for 'serial_numbers', rows that have a serial
+    number that isn't wanted are skipped either way.
+
+    With 'subcomponents' or 'tests' set, each item also gets its
+    subcomponents (from get_subcomponents) or its latest test results
+    (from get_hwitem_tests), under the keys "subcomponents" and "tests".
+    These take one more request per item each.
+
+    'status_callback', if given, is called with the ItemList (from the
+    coordinator or one of the worker threads) each time an item is
+    finished with.
+
+    With 'stream' set, items aren't kept in 'results'. Instead, iterating
+    over the ItemList yields each one as soon as it has been fetched (in
+    no particular order), so the caller can work on them while the crawl
+    goes on:
+
+        for item in ItemList(part_type_id, stream=True):
+            ...
+
+    No more than 'max_pending' items are fetched ahead of the caller, so a
+    slow caller slows the crawl down instead of piling up items in memory.
+    A streaming ItemList never blocks in the constructor, and has to be
+    iterated over, or the crawl stalls. Leaving the loop early cancels the
+    crawl. Abandon is raised at the end of the loop, if appropriate.
+    '''
+    MAX_RETRIES = 3
+    MAX_PENDING = 100
+    class Abandon(Exception):
+        '''Exception raised when a task has reached its retry limit'''
+        pass
+
+    def __init__(self,
+                 type_id,
+                 num_threads=None,
+                 retries=MAX_RETRIES,
+                 raise_on_abandon=True,
+                 block=True,
+                 status_callback=None,
+                 status_interval=0.2,
+                 serial_numbers=None,
+                 fields=None,
+                 stream=False,
+                 max_pending=MAX_PENDING,
+                 *,
+                 subcomponents=False,
+                 tests=False,
+                 page_size=None,
+                 client=None):
+        thread_name = threading.current_thread().name
+        self.type_id = type_id
+        self.client = client if client is not None else ra.default_client
+        self.page_size_requested = page_size
+        self.concurrency = self._get_concurrency()
+        if num_threads is None:
+            num_threads = self.concurrency.maximum if self.concurrency is not None else 10
+        self.num_threads = num_threads
+        self.results = []
+        self.num_results = 0
+        self.raise_on_abandon = raise_on_abandon
+        self.fail_retry = 0
+        self.fail_abandon = 0
+        self.voluntary_abandon = False
+        self.retries = retries
+        self.status_callback = status_callback
+        self.status_interval = status_interval
+        self.stream = stream
+        self.block = block and not stream
+        self.serial_numbers = set(serial_numbers) if serial_numbers is not None else None
+        self.fields = set(fields) if fields is not None else None
+        if self.fields is not None and self.serial_numbers is not None:
+            # needed to tell which items were being looked for
+            self.fields.add("serial_number")
+        self.subcomponents = subcomponents
+        self.tests = tests
+        self.num_detail_fetches = 0
+
+        self.num_pages = 1
+        self.page_size = 1
+        self.num_items = 1
+
+        # '_lock' guards results, the counters and serial_numbers.
+        # '_stopped' is completed to wake the coordinator when it should
+        # stop early.
+        self._lock = threading.Lock()
+        self._stopped = Future()
+
+        # When streaming, '_credits' counts how many more items may be
+        # fetched ahead of the caller. The coordinator takes one before
+        # submitting an item, and it's given back when the caller takes the
+        # item from '_queue' (or when the item turns out to have nothing to
+        # deliver).
+        if self.stream:
+            self._queue = queue.Queue()
+            self._credits = threading.Semaphore(max_pending)
+
+        self._coordinator = threading.Thread(target=self._run,
+                                             name=f"ItemList_{type_id}",
+                                             daemon=True)
+        self._coordinator.start()
+        logger.debug(f"{thread_name}: ItemList for {type_id} started.")
+
+        if self.block:
+            self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leaving the block early (e.g., because of an exception) shouldn't
+        # leave the crawl running in the background
+        self.cancel()
+        self._coordinator.join()
+
+    def __iter__(self):
+        if not self.stream:
+            self.wait()
+            yield from self.results
+            return
+
+        finished = False
+        try:
+            while True:
+                result = self._queue.get()
+                if result is _END:
+                    # leave it for anyone else iterating
+                    self._queue.put(_END)
+                    break
+                self._credits.release()
+                yield result
+            finished = True
+        finally:
+            if not finished:
+                self.cancel()
+        self.wait()
+
+    def wait(self):
+        '''Wait for the crawl to finish
+
+        Raises Abandon if a task ran out of retries and 'raise_on_abandon'
+        is set. If the wait is interrupted (e.g., by KeyboardInterrupt), the
+        crawl is cancelled.
+        '''
+        thread_name = threading.current_thread().name
+        logger.debug(f"{thread_name}: Waiting for ItemList for {self.type_id} to finish.")
+        try:
+            self._coordinator.join()
+        except BaseException:
+            self.cancel()
+            raise
+        logger.debug(f"{thread_name}: ItemList for {self.type_id} is finished.")
+
+        if self.raise_on_abandon and self.fail_abandon > 0:
+            logger.error("Raising Abandon exception because max retries was exceeded.")
+            raise self.__class__.Abandon("A required REST API task could not be completed.")
+
+    def cancel(self):
+        '''Stop the crawl, keeping whatever results have been found so far'''
+        if not self._stopped.done():
+            try:
+                self._stopped.set_result(None)
+            except Exception:
+                # another thread got there first
+                pass
+            if self.stream:
+                # in case the coordinator is waiting for the caller
+                self._credits.release()
+
+    @property
+    def stopped(self):
+        return self._stopped.done()
+
+    def done(self):
+        return not self._coordinator.is_alive()
+
+    @classmethod
+    def get_items(cls, type_id, num_threads=None, retries=5, fail_on_abandon=True):
+        item_list = cls(type_id, num_threads=num_threads,
+                        retries=retries, raise_on_abandon=fail_on_abandon)
+        return item_list.results
+
+    #-----------------------------------------------------------------------------
+    #  The requests. Each returns the response from the server.
+    #-----------------------------------------------------------------------------
+
+    def _get_concurrency(self):
+        return self.client.concurrency
+
+    def _list_page(self, page):
+        return self.client.get_hwitems(self.type_id, page=page, size=self.page_size_requested)
+
+    def _fetch_item(self, part_id):
+        return self.client.get_hwitem(part_id)
+
+    def _fetch_subcomponents(self, part_id):
+        return self.client.get_subcomponents(part_id)
+
+    def _fetch_tests(self, part_id):
+        return self.client.get_hwitem_tests(part_id)
+
+    #-----------------------------------------------------------------------------
+
+    def _add_result(self, result):
+        # Returns True if the result was kept
+        with self._lock:
+            if self.stopped:
+                return False
+            if self.serial_numbers is not None:
+                serial_number = result['serial_number']
+                if serial_number not in self.serial_numbers:
+                    return False
+                self.serial_numbers.remove(serial_number)
+                if len(self.serial_numbers) == 0:
+                    self.voluntary_abandon = True
+            self.num_results += 1
+            if self.stream:
+                self._queue.put(result)
+            else:
+                self.results.append(result)
+        if self.voluntary_abandon:
+            self.cancel()
+        return True
+
+    def _deliver(self, result):
+        # Hands over a finished item (or None if there wasn't one)
+        delivered = result is not None and self._add_result(result)
+        if self.stream and not delivered:
+            # the caller won't be taking anything for this one
+            self._credits.release()
+
+        if self.status_callback is not None:
+            self.status_callback(self)
+
+    def _wanted(self, row):
+        # Whether a row from the component list could be one of the
+        # serial numbers being looked for
+        if self.serial_numbers is None or "serial_number" not in row:
+            return True
+        with self._lock:
+            return row["serial_number"] in self.serial_numbers
+
+    def _count_retry(self):
+        with self._lock:
+            self.fail_retry += 1
+
+    def _count_abandon(self):
+        with self._lock:
+            self.fail_abandon += 1
+        if self.raise_on_abandon:
+            self.cancel()
+
+    def _run(self):
+        # The coordinator: keeps the executor supplied with tasks, pages
+        # first, and waits for one of them (or a call to cancel()) to
+        # finish before submitting more. A few more tasks than threads are
+        # submitted, so a thread never sits idle waiting for this one.
+        # Items that came complete with their page (see 'fields') are
+        # delivered from here instead of being submitted.
+        thread_name = threading.current_thread().name
+        pages = deque([1])
+        items = deque()
+        running = set()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_threads,
+                                    thread_name_prefix=f"ItemList_{self.type_id}") as executor:
+                while not self.stopped:
+                    while (len(running) < self._window() and (pages or items)
+                            and not self.stopped):
+                        if pages:
+                            future = executor.submit(self._get_page, pages.popleft(),
+                                                     tries_remaining=self.retries)
+                        else:
+                            if self.stream:
+                                # wait until the caller has room for another item
+                                self._credits.acquire()
+                                if self.stopped:
+                                    break
+                            item = items.popleft()
+                            if isinstance(item, dict) and not self._needs_extras():
+                                self._deliver(item)
+                                continue
+                            future = executor.submit(self._get_item, item,
+                                                     tries_remaining=self.retries)
+                        running.add(future)
+
+                    if not running:
+                        break
+
+                    finished, _ = wait(running | {self._stopped}, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        if future is self._stopped:
+                            continue
+                        running.remove(future)
+                        try:
+                            new_pages, new_items = future.result()
+                        except Exception as exc:
+                            logger.error(f"{thread_name}: a task failed with an exception: {exc}")
+                            self._count_abandon()
+                            continue
+                        pages.extend(new_pages)
+                        items.extend(new_items)
+                        logger.debug(f"{thread_name}: {len(new_items)} tasks added to queue.")
+
+                if self.stopped:
+                    cancelled = sum(future.cancel() for future in running)
+                    logger.debug(f"{thread_name}: signaled to terminate with "
+                                 f"{len(pages) + len(items) + cancelled} tasks not started and "
+                                 f"{len(running) - cancelled} still running")
+        finally:
+            if self.stream:
+                self._queue.put(_END)
+
+        logger.debug(f"{thread_name}: finished")
+
+    def _window(self):
+        # How many tasks to keep submitted
+        threads = self.num_threads
+        if self.concurrency is not None:
+            threads = min(threads, self.concurrency.limit)
+        return 2 * threads
+
+    def _needs_extras(self):
+        return self.subcomponents or self.tests
+
+    def _get_page(self, page, tries_remaining=1):
+        # Returns the pages and items that still need to be fetched. An
+        # item is either a part ID, or its row from this page if that's
+        # all the caller needs.
+        thread_name = threading.current_thread().name
+        while tries_remaining > 0 and not self.stopped:
+            resp = self._list_page(page)
+            if resp["status"] == "OK":
+                new_pages = []
+                if page == 1:
+                    self.num_pages = resp["pagination"]["pages"]
+                    if self.num_pages > 1:
+                        # assume the page size must be the same as the size of what
+                        # we just got
+                        self.page_size = len(resp["data"])
+                        # we don't know how big the last page will be, so let's just
+                        # say it's half the page size
+                        self.num_items = self.page_size * (self.num_pages-1) + self.page_size//2
+                    else:
+                        self.num_items = len(resp["data"])
+                    new_pages = list(range(2, self.num_pages+1))
+                elif page == self.num_pages:
+                    self.num_items = self.page_size * (self.num_pages-1) + len(resp["data"])
+
+                return new_pages, [self._plan_item(row) for row in resp["data"]
+                                        if self._wanted(row)]
+            else:
+                tries_remaining -= 1
+                self._count_retry()
+                logger.error(f"{thread_name}: Error getting page {page}. Will try {tries_remaining} more times.")
+                logger.error(f"{thread_name}: \n{json.dumps(resp, indent=4)}")
+
+        if not self.stopped:
+            self._count_abandon()
+        return [], []
+
+    def _plan_item(self, row):
+        if self.fields is not None and self.fields.issubset(row):
+            return row
+        return row["part_id"]
+
+    def _get_item(self, item, tries_remaining=1):
+        # 'item' is a part ID, or a row from the component list that only
+        # needs its subcomponents or tests added
+        result = None
+        try:
+            if isinstance(item, dict):
+                part_id = item["part_id"]
+                result = dict(item)
+            else:
+                part_id = item
+                with self._lock:
+                    self.num_detail_fetches += 1
+                result = self._fetch("ext_id", part_id, self._fetch_item, tries_remaining)
+
+            if result is not None and self.subcomponents:
+                data = self._fetch("subcomponents", part_id,
+                                   self._fetch_subcomponents, tries_remaining)
+                result = {**result, "subcomponents": data} if data is not None else None
+
+            if result is not None and self.tests:
+                data = self._fetch("tests", part_id, self._fetch_tests, tries_remaining)
+                result = {**result, "tests": data} if data is not None else None
+        except BaseException:
+            if self.stream:
+                self._credits.release()
+            raise
+
+        self._deliver(result)
+        return [], []
+
+    def _fetch(self, what, part_id, fetch, tries_remaining):
+        # Returns the "data" node of the response, or None if the request
+        # failed too many times or the crawl stopped
+        thread_name = threading.current_thread().name
+        while tries_remaining > 0 and not self.stopped:
+            resp = fetch(part_id)
+            if resp["status"] == "OK":
+                return resp['data']
+            tries_remaining -= 1
+            self._count_retry()
+            logger.error(f"{thread_name}: Error getting {what} {part_id}. Will try {tries_remaining} more times.")
+
+        if not self.stopped:
+            self._count_abandon()
+        return None
+
+
+def run_test():
+
+    import argparse
+    from Sisyphus.Utils.Terminal import ProgressBar
+
+    parser = argparse.ArgumentParser(description='Fetch every item of a component type')
+    parser.add_argument('--threads',
+                        dest='threads',
+                        required=False,
+                        default=None,
+                        help='the number of threads (default: follow the adaptive limit)')
+    parser.add_argument('--typeid',
+                        dest='typeid',
+                        required=False,
+                        default="Z00100300001",
+                        help='the part type ID to fetch')
+    parser.add_argument('--subcomponents',
+                        dest='subcomponents',
+                        action='store_true',
+                        help='also fetch the subcomponents of each item')
+    parser.add_argument('--tests',
+                        dest='tests',
+                        action='store_true',
+                        help='also fetch the tests of each item')
+    args = parser.parse_args()
+
+    num_threads = int(args.threads) if args.threads is not None else None
+    typeid = args.typeid
+
+    print(f"begin test for typeid='{typeid}' with {num_threads or 'adaptive'} threads")
+    start_time = datetime.now()
+
+    global prog
+    prog = ProgressBar(1, prefix='Fetching items:', suffix='', decimals=1, length=50, fill='█', printEnd='\r')
+
+    def update_status(item_list):
+        global prog
+        prog.total = item_list.num_items
+        prog.update(len(item_list.results))
+
+
+    L = ItemList(typeid, num_threads=num_threads, status_callback=update_status, block=False,
+                 subcomponents=args.subcomponents, tests=args.tests)
+    print("and now we wait.")
+    L.wait()
+
+    end_time = datetime.now()
+    interval = end_time - start_time
+    num_results = len(L.results)
+
+    print(f"{num_results} results found.")
+    print(f"The test executed in {interval}")
+    print(f"Throughput: {num_results/interval.total_seconds():0.2f} items/second")
+
+    if L.fail_retry > 0:
+        print(f"fail/retry: {L.fail_retry}")
+    if L.fail_abandon > 0:
+        print(f"fail/abandon: {L.fail_abandon}")
+    if L.concurrency is not None:
+        print(f"concurrency: {L.concurrency.snapshot()}")
+
+
+    print("end test")
+
+if __name__ == '__main__':
+    run_test()
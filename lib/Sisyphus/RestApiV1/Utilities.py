@@ -11,6 +11,15 @@ from Sisyphus.Configuration import config
 logger = config.getLogger()
 
 import Sisyphus.RestApiV1 as ra
+from Sisyphus.Utils.ChunkSize import AdaptiveChunkSize
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# The most requests that the functions here will have in flight at once
+DEFAULT_MAX_WORKERS = 10
 
 
 #######################################################################
@@ -73,11 +82,20 @@ def lookup_component_type_defs(part_type_id):
         for node in resp['data']
     ]
 
-    for node in type_info["tests"]:
+    # The test type definitions don't depend on each other, so get them all
+    # at once
+    def get_test_def(node):
         resp = ra.get_test_type(part_type_id, node["test_type_id"])
         if resp["status"] != "OK":
             raise ValueError("Test type definition lookup failed.")
-        node["test_def"] = resp['data']['properties']['specifications'][0]['datasheet']
+        return resp['data']['properties']['specifications'][0]['datasheet']
+
+    if len(type_info["tests"]) > 0:
+        with ThreadPoolExecutor(max_workers=min(len(type_info["tests"]),
+                                                DEFAULT_MAX_WORKERS)) as executor:
+            for node, test_def in zip(type_info["tests"],
+                                      executor.map(get_test_def, type_info["tests"])):
+                node["test_def"] = test_def
     return type_info
 
 #######################################################################
@@ -126,6 +144,225 @@ def bulk_add_hwitems(part_type_id, count, *,
 
 #######################################################################
 
+def check_specifications(specifications, spec_def):
+    '''Return what the HWDB would refuse in 'specifications', or [] if nothing
+
+    'spec_def' is the datasheet of the item's component type (see
+    lookup_component_type_defs). Only what can be checked without the
+    server is found: fields that aren't in the datasheet, and values that
+    can't be sent as JSON (e.g., NaN, or a date from a spreadsheet).
+    '''
+    if not isinstance(specifications, dict):
+        return ["the specifications are not a JSON object"]
+    problems = []
+    unknown = [str(key) for key in specifications if key not in spec_def and key != "_meta"]
+    if len(unknown) > 0:
+        problems.append(f"not in the datasheet: {', '.join(unknown)}")
+    try:
+        json.dumps(specifications, allow_nan=False)
+    except (TypeError, ValueError) as exc:
+        problems.append(f"can't be sent as JSON: {exc}")
+    return problems
+
+#######################################################################
+
+class BulkAddError(ValueError):
+    '''Raised by bulk_create_hwitems when a request fails
+
+    'part_ids' has the items that the earlier requests did create.
+    '''
+    def __init__(self, msg, part_ids):
+        super().__init__(msg)
+        self.part_ids = part_ids
+
+def bulk_create_hwitems(part_type_id, count, *,
+                    institution_id = None,
+                    country_code = None,
+                    manufacturer_id = None,
+                    comments = None,
+                    chunk_size = None):
+    '''Like bulk_add_hwitems, but split into several requests if needed
+
+    'chunk_size' is an AdaptiveChunkSize (a new one is used if it's None),
+    which sets how many items to ask for in each request and is updated
+    with how long each one took. Share one between calls to have them all
+    adapt to the server together.
+
+    Raises BulkAddError if a request fails.
+    '''
+    if chunk_size is None:
+        chunk_size = AdaptiveChunkSize()
+
+    part_ids = []
+    for chunk in chunk_size.chunks(count):
+        start = time.perf_counter()
+        try:
+            part_ids.extend(bulk_add_hwitems(part_type_id, chunk,
+                                institution_id=institution_id,
+                                country_code=country_code,
+                                manufacturer_id=manufacturer_id,
+                                comments=comments))
+        except Exception as exc:
+            chunk_size.failed()
+            if part_ids:
+                logger.error(f"Bulk add for {part_type_id} failed after creating "
+                             f"{len(part_ids)} of {count} items: {part_ids}")
+            raise BulkAddError(f"Bulk add for {part_type_id} failed: {exc}", part_ids) from exc
+        chunk_size.record(chunk, time.perf_counter() - start)
+
+    return part_ids
+
+#######################################################################
+
+# Part IDs found by resolve_serial_numbers, shared by everything in the
+# process that needs to turn a serial number into a part ID:
+#     (part_type_id, serial_number) -> part_id, or None if there isn't one
+_serial_number_cache = {}
+_serial_number_lock = threading.Lock()
+
+RESOLVE_PAGE_SIZE = 100
+# Fetching a page of a type scan costs about as much as this many queries
+# for a single serial number
+RESOLVE_PAGE_COST = 2
+
+def resolve_serial_numbers(part_type_id, serial_numbers, *,
+                    max_workers = DEFAULT_MAX_WORKERS,
+                    strategy = None):
+    '''Find the part IDs for the given serial numbers of a component type
+
+    Returns {serial_number: part_id}, with None for serial numbers that
+    aren't in the HWDB.
+
+    There are two ways to do this: one query per serial number, run in
+    parallel, or a scan through every item of the type. If there are no
+    more serial numbers than 'max_workers', the queries are used right
+    away. Otherwise, the first page of the scan is fetched, and its
+    "pagination" shows how many more pages there are. The scan continues
+    if that's cheaper than the queries, counting each page as
+    RESOLVE_PAGE_COST queries. 'strategy' may be "query" or "scan" to
+    skip the choice.
+
+    Results go into a cache shared by every caller, so serial numbers
+    that were looked up before cost nothing. A scan caches every serial
+    number of the type that it sees. Raises ValueError if a serial
+    number belongs to more than one item, or RuntimeError if a request
+    fails.
+    '''
+    if strategy not in (None, "query", "scan"):
+        raise ValueError(f"Unknown strategy '{strategy}'")
+
+    # Sheets may give serial numbers as numbers, but the server's are
+    # strings, so they're matched and cached as strings. The result uses
+    # the caller's values as keys.
+    keys = {serial_number: str(serial_number) for serial_number in serial_numbers}
+    cached = {}
+    with _serial_number_lock:
+        for key in keys.values():
+            if (part_type_id, key) in _serial_number_cache:
+                cached[key] = _serial_number_cache[part_type_id, key]
+    missing = [key for key in dict.fromkeys(keys.values()) if key not in cached]
+    if len(missing) == 0:
+        return {serial_number: cached[key] for serial_number, key in keys.items()}
+
+    if strategy is None and len(missing) <= max_workers:
+        strategy = "query"
+
+    if strategy == "query":
+        found = _query_serial_numbers(part_type_id, missing, max_workers)
+    else:
+        found = _scan_serial_numbers(part_type_id, missing, max_workers,
+                                     force=(strategy == "scan"))
+
+    with _serial_number_lock:
+        for serial_number, part_id in found.items():
+            _serial_number_cache[part_type_id, serial_number] = part_id
+    cached.update(found)
+    return {serial_number: cached[key] for serial_number, key in keys.items()}
+
+def forget_serial_number(part_type_id, serial_number):
+    '''Drop a serial number from the cache, e.g., after it's been assigned'''
+    with _serial_number_lock:
+        _serial_number_cache.pop((part_type_id, str(serial_number)), None)
+
+def clear_serial_number_cache():
+    with _serial_number_lock:
+        _serial_number_cache.clear()
+
+def _match_serial_numbers(items):
+    # Group the items in a listing by serial number
+    matches = {}
+    for item in items:
+        if item.get("serial_number", None) is not None:
+            matches.setdefault(str(item["serial_number"]), []).append(item["part_id"])
+    return matches
+
+def _unique_part_id(part_type_id, serial_number, part_ids):
+    if len(part_ids) > 1:
+        msg = (f"Serial number '{serial_number}' for part type '{part_type_id}' "
+               f"is assigned to {len(part_ids)} parts.")
+        logger.error(msg)
+        raise ValueError(msg)
+    return part_ids[0] if part_ids else None
+
+def _query_serial_numbers(part_type_id, serial_numbers, max_workers):
+    def query(serial_number):
+        resp = ra.get_hwitems(part_type_id, serial_number=serial_number)
+        if resp["status"] != "OK":
+            msg = (f"Error looking up serial number '{serial_number}' for "
+                   f"part type '{part_type_id}'")
+            logger.error(msg)
+            raise RuntimeError(msg)
+        # The server may treat the serial number as a pattern, so only
+        # take exact matches
+        matches = _match_serial_numbers(resp["data"])
+        return _unique_part_id(part_type_id, serial_number,
+                               matches.get(serial_number, []))
+
+    logger.debug(f"<resolve_serial_numbers> querying {len(serial_numbers)} "
+                 f"serial numbers for {part_type_id}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(serial_numbers, executor.map(query, serial_numbers)))
+
+def _scan_serial_numbers(part_type_id, serial_numbers, max_workers, force):
+    def fetch_page(page):
+        resp = ra.get_hwitems(part_type_id, page=page, size=RESOLVE_PAGE_SIZE)
+        if resp["status"] != "OK":
+            msg = f"Error getting page {page} of the items of part type '{part_type_id}'"
+            logger.error(msg)
+            raise RuntimeError(msg)
+        return resp
+
+    first = fetch_page(1)
+    num_pages = (first.get("pagination", None) or {}).get("pages", 1) or 1
+    matches = _match_serial_numbers(first["data"])
+
+    if not force and (num_pages - 1) * RESOLVE_PAGE_COST > len(serial_numbers):
+        # Querying is cheaper, but use what the first page already found
+        found = {serial_number: _unique_part_id(part_type_id, serial_number,
+                                                matches[serial_number])
+                    for serial_number in serial_numbers if serial_number in matches}
+        rest = [serial_number for serial_number in serial_numbers
+                    if serial_number not in found]
+        found.update(_query_serial_numbers(part_type_id, rest, max_workers))
+        return found
+
+    logger.debug(f"<resolve_serial_numbers> scanning {num_pages} pages of {part_type_id} "
+                 f"for {len(serial_numbers)} serial numbers")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for resp in executor.map(fetch_page, range(2, num_pages + 1)):
+            for serial_number, part_ids in _match_serial_numbers(resp["data"]).items():
+                matches.setdefault(serial_number, []).extend(part_ids)
+
+    # Cache everything that was seen, not just what was asked for
+    found = {serial_number: part_ids[0] for serial_number, part_ids in matches.items()
+                if len(part_ids) == 1}
+    for serial_number in serial_numbers:
+        found[serial_number] = _unique_part_id(part_type_id, serial_number,
+                                               matches.get(serial_number, []))
+    return found
+
+#######################################################################
+
 def enable_hwitem(part_id, *,
                     enable=True,
                     comments=None):
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/_Cache.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from copy import deepcopy
+
+# How long (in seconds) a cached response is considered fresh, by endpoint.
+# After this, the entry is revalidated with the server (using ETag or
+# Last-Modified, if the server sent them) or fetched again.
+HOUR = 3600
+DAY = 24 * HOUR
+DEFAULT_TTLS = {
+    "component_type": HOUR,
+    "component_type_connectors": HOUR,
+    "component_type_specifications": HOUR,
+    "component_types": HOUR,
+    "test_types": HOUR,
+    "test_type": HOUR,
+    "test_type_by_oid": HOUR,
+    "countries": DAY,
+    "institutions": DAY,
+    "manufacturers": DAY,
+    "projects": DAY,
+    "roles": DAY,
+    "role": DAY,
+    "systems": DAY,
+    "system": DAY,
+    "subsystems": DAY,
+    "subsystem": DAY,
+}
+DEFAULT_TTL = HOUR
+DEFAULT_MAX_BYTES = 0x4000000  # 64 MiB
+
+class ResponseCache:
+    '''A size-bounded cache of REST API responses, stored as JSON files
+
+    Entries are keyed by profile, REST API host, URL and query parameters,
+    so different servers and different users never see each other's data.
+    Each entry remembers when it expires and the ETag/Last-Modified
+    validators the server sent, if any. When the total size of the files
+    goes over 'max_bytes', the least recently used entries are deleted.
+
+    Entries that have been read in this process are also kept in memory,
+    so repeated lookups don't touch the disk.
+    '''
+
+    def __init__(self, root, *,
+                 profile=None,
+                 rest_api=None,
+                 ttls=None,
+                 max_bytes=DEFAULT_MAX_BYTES,
+                 refresh=False):
+        self.root = root
+        self.profile = profile
+        self.rest_api = rest_api
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._total_bytes = None
+
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg=None):
+        '''Create a cache for the active profile, or None if it is turned off'''
+        cfg = cfg or config
+        if not cfg.response_cache:
+            return None
+        return cls(cfg.cache_root,
+                   profile=cfg.profile_name,
+                   rest_api=cfg.rest_api,
+                   refresh=cfg.refresh_cache)
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def _key(self, url, params):
+        key_info = [self.profile, self.rest_api, url, [list(p) for p in (params or [])]]
+        digest = hashlib.sha256(json.dumps(key_info, default=str).encode("utf-8")).hexdigest()
+        return digest
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def lookup(self, url, params=None):
+        '''Return the entry for this request, or None
+
+        The entry is a dictionary with "response", "expires", "etag" and
+        "last_modified". It may have expired; use is_fresh() to check. With
+        'refresh' set, entries from earlier runs are never returned, so each
+        request is fetched again once, and after that the new entry is used.
+        '''
+        key = self._key(url, params)
+        with self._lock:
+            entry = self._memory.get(key, None)
+        if entry is not None:
+            return entry
+        if self.refresh:
+            # Only entries stored by this process are in memory
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            # mark the file as recently used, for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry is not None and entry["expires"] > time.time()
+
+    @staticmethod
+    def validators(entry):
+        '''Headers that ask the server whether our copy is still current'''
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag", None) is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified", None) is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def response(entry):
+        '''A copy of the cached response that the caller is free to modify'''
+        return deepcopy(entry["response"])
+
+    def store(self, endpoint, url, params, response, *, etag=None, last_modified=None):
+        key = self._key(url, params)
+        entry = {
+            "url": url,
+            "params": [list(p) for p in (params or [])],
+            "profile": self.profile,
+            "rest_api": self.rest_api,
+            "stored": time.time(),
+            "expires": time.time() + self.ttl(endpoint),
+            "etag": etag,
+            "last_modified": last_modified,
+            "response": deepcopy(response),
+        }
+        self._write(key, entry)
+        return entry
+
+    def renew(self, endpoint, url, params, entry):
+        '''Extend an entry after the server said it hasn't changed (304)'''
+        key = self._key(url, params)
+        entry = {**entry, "expires": time.time() + self.ttl(endpoint)}
+        self._write(key, entry)
+        return entry
+
+    def _write(self, key, entry):
+        path = self._path(key)
+        data = json.dumps(entry).encode("utf-8")
+
+        # Write to a temp file and rename it, so that another process
+        # never sees a partial file.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp_", suffix=".json")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"Unable to write to the response cache: {exc}")
+            return
+
+        with self._lock:
+            self._memory[key] = entry
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - old_size
+        self._evict()
+
+    def _entries(self):
+        result = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, name[:-5], path))
+        return result
+
+    def _evict(self):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _, _ in self._entries())
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            # oldest first
+            entries = sorted(self._entries())
+            self._total_bytes = sum(size for _, size, _, _ in entries)
+            for mtime, size, key, path in entries:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._memory.pop(key, None)
+                self._total_bytes -= size
+            logger.debug(f"Response cache trimmed to {self._total_bytes} bytes")
+
+    def clear(self):
+        '''Delete every entry in the cache'''
+        with self._lock:
+            for _, _, key, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._memory.clear()
+            self._total_bytes = 0
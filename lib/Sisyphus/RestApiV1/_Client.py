@@ -0,0 +1,1087 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/_Client.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+    Urbas Ekka <ekka0002@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import Sisyphus.Configuration as Config
+from Sisyphus.RestApiV1._Retry import RetryPolicy
+from Sisyphus.RestApiV1._Cache import ResponseCache
+from Sisyphus.RestApiV1._SingleFlight import SingleFlight, request_key
+from Sisyphus.Utils.Metrics import metrics, body_size, response_size
+from Sisyphus.Utils.Concurrency import get_shared_limit, limited
+from Sisyphus.Utils.Download import download, DownloadError, ChecksumError
+from Sisyphus.Utils.Download import DEFAULT_CHUNK_SIZE, DEFAULT_HASH_ALGORITHM
+import os
+import json
+import urllib.parse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+KW_STATUS = "status"
+KW_ERROR = "ERROR"
+KW_SERVER_ERROR = "SERVER ERROR"
+
+class ServerError(Exception):
+    """thrown when the server is not returning a response"""
+
+# ##########
+# Use this function when constructing a URL that uses some variable as
+# part of the URL itself, e.g.,
+#    path = f"api/v1/components/{sanitize(part_id)}"
+# DON'T use this function for paramters at the end of the URL if you're
+# using "params" to pass them, because the session.get() method will
+# do that for you, and doing it twice messes up things like postgres wildcards.
+def sanitize(s, safe=""):
+    return urllib.parse.quote(str(s), safe=safe)
+
+# The number of connections kept open to the server, shared by all the
+# threads using a Client. It should be at least the maximum of the
+# AdaptiveLimit in use (see Utils.Concurrency), so that every request the
+# limit allows can keep its connection.
+DEFAULT_POOL_SIZE = 100
+
+# Marks an argument that wasn't given
+_DEFAULT = object()
+
+# The number of pages that _iter_pages will request ahead of the page
+# the caller is using
+DEFAULT_PREFETCH = 4
+
+def _iter_pages(fetch_page, *, prefetch=DEFAULT_PREFETCH):
+    '''Yield the items in the "data" node of every page of a paginated endpoint
+
+    'fetch_page' is called with a page number and must return the response
+    for that page. The first page is fetched right away, and its
+    "pagination" node tells us how many pages there are. After that,
+    up to 'prefetch' pages are kept in flight on a thread pool while
+    the caller works on the current page, so only about prefetch+1
+    pages are in memory at any time.
+
+    Raises RuntimeError if any page comes back with an error.
+    '''
+    def checked(page, resp):
+        if resp.get(KW_STATUS, None) != "OK":
+            msg = f"Error fetching page {page}: {resp}"
+            logger.error(msg)
+            raise RuntimeError(msg)
+        return resp
+
+    resp = checked(1, fetch_page(1))
+    num_pages = (resp.get("pagination", None) or {}).get("pages", 1) or 1
+    logger.debug(f"<_iter_pages> {num_pages} pages")
+
+    if num_pages == 1 or prefetch < 1:
+        yield from resp["data"]
+        for page in range(2, num_pages + 1):
+            yield from checked(page, fetch_page(page))["data"]
+        return
+
+    executor = ThreadPoolExecutor(max_workers=prefetch,
+                                  thread_name_prefix="iter_pages")
+    pending = deque()
+    next_page = 2
+    try:
+        def fill():
+            nonlocal next_page
+            while len(pending) < prefetch and next_page <= num_pages:
+                pending.append((next_page, executor.submit(fetch_page, next_page)))
+                next_page += 1
+
+        fill()
+        yield from resp["data"]
+        while pending:
+            page, future = pending.popleft()
+            resp = checked(page, future.result())
+            fill()
+            yield from resp["data"]
+    finally:
+        # If the caller stopped early, don't bother with any pages that
+        # haven't started yet.
+        for page, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+#######################################################################
+
+class Client:
+    '''A connection to the HWDB REST API
+
+    Every endpoint function in Sisyphus.RestApiV1 is also a method of
+    Client, with the same arguments. The module functions use
+    Sisyphus.RestApiV1.default_client, which follows the active profile.
+    Make your own Client to use a different server or certificate, or
+    different settings, without affecting anything else.
+
+    Arguments:
+        profile: a profile dictionary, like config.active_profile. If None,
+            the active profile is used, and it is re-read every time the
+            client is (re)started.
+        rest_api, certificate: override the profile's values
+        pool_size: the number of connections kept open to the server
+        timeout: the timeout for each request, if the caller doesn't give one
+        retry_policy: a RetryPolicy, or None to never retry. If not
+            given, RetryPolicy() is used.
+        response_cache: a ResponseCache, or None to turn caching off. If
+            not given, the profile decides.
+        single_flight: a SingleFlight, or None to turn it off. If not
+            given, the client gets its own.
+        concurrency: an AdaptiveLimit on the number of requests in
+            progress, or None for no limit. If not given, the shared one
+            from Utils.Concurrency.get_shared_limit() is used.
+        raise_server_errors: raise ServerError instead of returning an
+            error response when a GET can't reach the server. If None,
+            Sisyphus.RestApiV1.raise_server_errors decides.
+        session_kwargs: extra keyword arguments for every request
+
+    A Client can be used by many threads at once. Each thread gets its
+    own requests.Session (they aren't thread-safe), but they all share
+    one connection pool. If the process forks, the child starts over with
+    new connections the first time it makes a request, since sockets
+    inherited from the parent can't be used by both.
+    '''
+
+    def __init__(self, *,
+                 profile=None,
+                 rest_api=None,
+                 certificate=None,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 timeout=None,
+                 retry_policy=_DEFAULT,
+                 response_cache=_DEFAULT,
+                 single_flight=_DEFAULT,
+                 concurrency=_DEFAULT,
+                 raise_server_errors=None,
+                 session_kwargs=None):
+        self.profile = profile
+        self._rest_api = rest_api
+        self._certificate = certificate
+        self.pool_size = pool_size
+        self.timeout = timeout
+        if retry_policy is _DEFAULT:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy.never()
+        self._response_cache = response_cache
+        self.single_flight = single_flight if single_flight is not _DEFAULT else SingleFlight()
+        self._concurrency = concurrency
+        self.raise_server_errors = raise_server_errors
+        self.session_kwargs = session_kwargs if session_kwargs is not None else {}
+        self._reset()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(rest_api={self._rest_api or '<profile>'!r}, "
+                f"pool_size={self.pool_size}, timeout={self.timeout})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset(self):
+        # Forget every connection. Called at creation and after a fork.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapter = None
+        self._cert = None
+        self._started = False
+        self._generation = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            logger.debug(f"<Client> process {os.getpid()} was forked from {self._pid}, "
+                         "so making new connections")
+            self._reset()
+            if self.single_flight is not None:
+                # Its lock might have been held by a thread that didn't survive the fork
+                self.single_flight = SingleFlight()
+
+    #-----------------------------------------------------------------------------
+
+    @property
+    def _profile(self):
+        return self.profile if self.profile is not None else config.active_profile
+
+    @property
+    def rest_api(self):
+        return self._rest_api or self._profile[Config.KW_REST_API]
+
+    @property
+    def certificate(self):
+        return self._certificate or self._profile[Config.KW_CERTIFICATE]
+
+    @property
+    def cert_type(self):
+        if self._certificate is not None:
+            return Config.KW_PEM
+        return self._profile[Config.KW_CERT_TYPE]
+
+    @property
+    def response_cache(self):
+        if self._response_cache is _DEFAULT:
+            with self._lock:
+                if self._response_cache is _DEFAULT:
+                    self._response_cache = self._cache_from_config()
+        return self._response_cache
+
+    @response_cache.setter
+    def response_cache(self, cache):
+        self._response_cache = cache
+
+    def _cache_from_config(self):
+        try:
+            if self.profile is None:
+                return ResponseCache.from_config(config)
+            if self.profile.get(Config.KW_RESPONSE_CACHE, False):
+                return ResponseCache(config.cache_root, rest_api=self.rest_api)
+        except OSError as exc:
+            logger.warning(f"Unable to use the response cache: {exc}")
+        return None
+
+    @property
+    def concurrency(self):
+        if self._concurrency is _DEFAULT:
+            return get_shared_limit()
+        return self._concurrency
+
+    @concurrency.setter
+    def concurrency(self, limit):
+        self._concurrency = limit
+
+    def _raise_server_errors(self):
+        if self.raise_server_errors is not None:
+            return self.raise_server_errors
+        import Sisyphus.RestApiV1._RestApiV1 as _ra
+        return _ra.raise_server_errors
+
+    #-----------------------------------------------------------------------------
+
+    def start(self):
+        '''(Re)start the client with the current profile settings
+
+        Connections that are already open are closed. Returns this
+        thread's session, or None if there's no certificate to use.
+        '''
+        self._check_fork()
+        with self._lock:
+            self._start()
+        return self.session
+
+    def _start(self):
+        # Call with the lock held.
+        # 'requests' takes a while to import, so wait until we need it
+        import requests.adapters
+
+        if self._adapter is not None:
+            self._adapter.close()
+        if self.cert_type == Config.KW_PEM:
+            self._adapter = requests.adapters.HTTPAdapter(
+                                    pool_connections=self.pool_size,
+                                    pool_maxsize=self.pool_size)
+            self._cert = self.certificate
+            self._prefix = f'https://{self.rest_api}'
+        else:
+            logger.warning("Unable to start session because a certificate was not available.")
+            self._adapter = None
+        self._generation += 1
+        self._started = True
+
+    def close(self):
+        '''Close every connection. The client can still be used afterwards.'''
+        with self._lock:
+            if self._adapter is not None:
+                self._adapter.close()
+            self._adapter = None
+            self._started = False
+            self._local = threading.local()
+
+    @property
+    def session(self):
+        '''The requests.Session for this thread, or None if there's no
+        certificate to use. The client starts the first time this is used.
+        '''
+        self._check_fork()
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    self._start()
+
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            from requests import Session
+            with self._lock:
+                generation, adapter = self._generation, self._adapter
+            if adapter is None:
+                local.session = None
+            else:
+                local.session = Session()
+                local.session.mount(self._prefix, adapter)
+                local.session.cert = self._cert
+            local.generation = generation
+        return local.session
+
+    #-----------------------------------------------------------------------------
+
+    def _url(self, path):
+        return f"https://{self.rest_api}/{path}"
+
+    def _request(self, method, url, *args, retry_policy=None, **kwargs):
+        '''Send a request, retrying according to the retry policy
+
+        Returns the final response, even if it has a retryable status code,
+        so that the caller can report it. If the final attempt raised an
+        exception, that exception is raised.
+
+        Each attempt waits for a slot in the client's concurrency limit,
+        but the slot isn't held while waiting to retry.
+        '''
+        policy = retry_policy if retry_policy is not None else self.retry_policy
+        send = getattr(self.session, method.lower())
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
+
+        streamed = kwargs.get("stream", False)
+        limit = self.concurrency
+
+        attempt = 0
+        while True:
+            try:
+                with limited(limit, method, url) as slot, \
+                        metrics.track(method, url) as tracked:
+                    resp = send(url, *args, **kwargs)
+                    slot.finish(resp.status_code)
+                    tracked.finish(resp.status_code,
+                                   response_bytes=response_size(resp, streamed),
+                                   request_bytes=body_size(resp.request.body))
+            except Exception as exc:
+                if not policy.should_retry_exception(method, exc, attempt):
+                    raise
+                metrics.record_retry(method, url)
+                delay = policy.sleep(attempt)
+                logger.warning(f"<_request> {method} '{url}' raised {type(exc).__name__}. "
+                               f"Retry {attempt+1} of {policy.max_retries} "
+                               f"after {delay:0.2f} seconds.")
+            else:
+                if not policy.should_retry_status(method, resp.status_code, attempt):
+                    return resp
+                retry_after = resp.headers.get("Retry-After", None)
+                resp.close()
+                metrics.record_retry(method, url)
+                delay = policy.sleep(attempt, retry_after)
+                logger.warning(f"<_request> {method} '{url}' returned status code "
+                               f"{resp.status_code}. Retry {attempt+1} of {policy.max_retries} "
+                               f"after {delay:0.2f} seconds.")
+            attempt += 1
+
+    #######################################################################
+
+    def _get(self, url, *args, cache_endpoint=None, **kwargs):
+        flight = self.single_flight
+        key = None
+        if flight is not None:
+            key = request_key("GET", url, args, {**kwargs, "cache_endpoint": cache_endpoint})
+        if key is None:
+            return self._get_uncoalesced(url, *args, cache_endpoint=cache_endpoint, **kwargs)
+        return flight.do(key,
+                lambda: self._get_uncoalesced(url, *args, cache_endpoint=cache_endpoint, **kwargs))
+
+    def _get_uncoalesced(self, url, *args, cache_endpoint=None, **kwargs):
+
+        logger.debug(f"<_get> Calling REST API with url='{url}'")
+
+        #
+        #  If this endpoint may be cached, and the cache is turned on, see
+        #  if we already have a fresh copy. If we have a stale copy, ask the
+        #  server to only send it again if it has changed.
+        #
+        cache = self.response_cache if cache_endpoint is not None else None
+        cache_entry = None
+        if cache is not None:
+            params = kwargs.get("params", None)
+            cache_entry = cache.lookup(url, params)
+            if cache.is_fresh(cache_entry):
+                logger.debug(f"<_get> using cached response for url='{url}'")
+                return cache.response(cache_entry)
+            if cache_entry is not None:
+                kwargs["headers"] = {**kwargs.get("headers", {}),
+                                     **cache.validators(cache_entry)}
+
+        if self.session is None:
+            msg = "No session available"
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        # kwargs["timeout"]=10
+
+        #
+        #  Send the "get" request.
+        #  If an error occurs, create a JSON response explaining the problem
+        #  and return it.
+        #
+        try:
+            resp = self._request("GET", url, *args, **{**kwargs, **self.session_kwargs})
+        except Exception as exc:
+            msg = ("An exception occurred while attempting to retrieve data from "
+                         f"the REST API. Exception details: {exc}")
+            logger.error(msg)
+            logger.info(f"The exception type was {type(exc)}")
+
+            if self._raise_server_errors():
+                raise ServerError(msg)
+            resp_data = {
+                "status": KW_SERVER_ERROR,
+                "addl_info": {
+                    "msg": msg,
+                }
+            }
+            return resp_data
+
+        #
+        #  Convert the response to JSON and return.
+        #  If the response cannot be converted to JSON, construct an alternate
+        #  JSON response stating the problem and return that instead.
+        #
+        if cache_entry is not None and resp.status_code == 304:
+            logger.debug(f"<_get> cached response for url='{url}' is still current")
+            cache_entry = cache.renew(cache_endpoint, url, params, cache_entry)
+            return cache.response(cache_entry)
+
+        try:
+            resp_data = resp.json()
+
+            if type(resp_data) != dict:
+                err = {
+                    "status": "Server Error",
+                    "addl_info": {
+                        "msg": "The server returned invalid data",
+                        "response": f"{resp_data}",
+                    }
+                }
+                return err
+            else:
+                if (cache is not None and resp.status_code == 200
+                        and resp_data.get(KW_STATUS, None) == "OK"):
+                    cache.store(cache_endpoint, url, params, resp_data,
+                                etag=resp.headers.get("ETag", None),
+                                last_modified=resp.headers.get("Last-Modified", None))
+                return resp_data
+
+        except json.JSONDecodeError:
+            # This is probably a 500 error that returned an HTML page
+            # instead of JSON text. Package it up to have the same
+            # structure as how the API would've handled a 4xx error so
+            # the consumer can look in the same place for info.
+            logger.error("The server returned content that was not valid JSON")
+            err = {
+                "status": "Server Error",
+                "addl_info":
+                {
+                    "msg": "The server returned content that was not valid JSON",
+                    "http_response_code": resp.status_code,
+                    "url" : url,
+                    "response": resp.text,
+                },
+            }
+            logger.info(f"response: {resp.text}")
+            return err
+
+    #######################################################################
+
+    @staticmethod
+    def _binary_request_failed(exc):
+        logger.error("An exception occurred while attempting to retrieve data from "
+                     f"the REST API. Exception details: {exc}")
+        resp_data = {
+            "status": KW_SERVER_ERROR,
+            "addl_info": {
+                "msg": "An exception occurred while retrieving data",
+                "exception_details": f"{exc}",
+            }
+        }
+        return resp_data
+
+    def _get_binary(self, url, write_to_file, *args,
+                    chunk_size=DEFAULT_CHUNK_SIZE,
+                    resume=True,
+                    checksum=None,
+                    hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                    **kwargs):
+
+        logger.debug(f"<_get_binary> Calling API with url='{url}'")
+
+        if self.session is None:
+            msg = "No session available"
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        import requests.exceptions
+
+        #
+        #  Stream the file to disk. See Sisyphus.Utils.Download for how
+        #  partial downloads are resumed and checksums are verified.
+        #  If an error occurs, create a JSON response explaining the problem
+        #  and return it.
+        #
+        def send(url, **send_kwargs):
+            return self._request("GET", url, *args, **{**send_kwargs, **self.session_kwargs})
+
+        try:
+            result = download(send, url, write_to_file,
+                              chunk_size=chunk_size,
+                              resume=resume,
+                              checksum=checksum,
+                              hash_algorithm=hash_algorithm,
+                              **kwargs)
+        except ChecksumError as exc:
+            msg = f"The file downloaded from {url} did not match the checksum"
+            logger.error(f"{msg}: expected {exc.expected}, received {exc.actual}")
+            resp_data = {
+                "status": KW_ERROR,
+                "addl_info": {
+                    "msg": msg,
+                    "url": url,
+                    "expected": exc.expected,
+                    "actual": exc.actual,
+                }
+            }
+            return resp_data
+        except DownloadError as exc:
+            logger.error("The request to the REST API failed. HTTP status code "
+                         f"{exc.status_code}")
+            raise RuntimeError("the request failed: status code %d"
+                                     % exc.status_code)
+        except OSError as exc:
+            # requests' exceptions are OSErrors too, but those aren't our fault
+            if isinstance(exc, requests.exceptions.RequestException):
+                return self._binary_request_failed(exc)
+            logger.error("An exception occurred while attempting to write binary "
+                         f"data to {write_to_file}. Exception details: {exc}")
+            resp_data = {
+                "status": KW_ERROR,
+                "addl_info": {
+                    "msg": f"Unable to write to {write_to_file}",
+                    "exception_details": f"{exc}",
+                }
+            }
+            return resp_data
+        except Exception as exc:
+            return self._binary_request_failed(exc)
+
+        logger.info(f"<_get_binary> received {result['bytes_received']} bytes from '{url}' "
+                    f"at {(result['throughput'] or 0) / 1e6:0.2f} MB/s")
+        resp_data = {
+            "status": "OK",
+            "data": result,
+        }
+        return resp_data
+
+    #######################################################################
+
+
+    def _post(self, url, data, *args, **kwargs):
+
+        logger.debug(f"<_post> Calling REST API with url='{url}'")
+
+        if self.session is None:
+            msg = "No session available"
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        #kwargs["timeout"]=10
+
+        #
+        #  Send the "post" request.
+        #  If an error occurs, create a JSON response explaining the problem
+        #  and return it.
+        #
+        try:
+            resp = self._request("POST", url, json=data, *args, **{**kwargs, **self.session_kwargs})
+        except Exception as exc:
+            logger.error("An exception occurred while attempting to post data to "
+                         f"the REST API. Exception details: {exc}")
+            resp_data = {
+                "status": "ERROR",
+                "addl_info": {
+                    "msg": "An exception occurred while posting data",
+                    "exception_details": f"{exc}",
+                }
+            }
+            return resp_data
+
+        if resp.status_code not in (200, 201):
+            logger.warning(f"RestApiV1._post method returned status code {resp.status_code}")
+            logger.info(f"The response was: {resp.text}")
+
+        #
+        #  Interpret the response as JSON and return.
+        #  If the response cannot be interpreted as JSON, construct an alternate
+        #  JSON response stating the problem and return that instead.
+        #
+        try:
+            resp_data = resp.json()
+            return resp_data
+        except json.JSONDecodeError:
+            # This is probably a 500 error that returned an HTML page
+            # instead of JSON text. Package it up to have the same
+            # structure as how the API would've handled a 4xx error so
+            # the consumer can look in the same place for info.
+            logger.error("The server returned content that was not valid JSON")
+            err = {
+                "status": "Server Error",
+                "addl_info":
+                {
+                    "msg": "The server returned content that was not valid JSON",
+                    "http_response_code": resp.status_code,
+                    "url" : url,
+                    "response": resp.text,
+                },
+            }
+            logger.info(f"response: {resp.text}")
+            return err
+
+    #######################################################################
+
+    def _patch(self, url, data, *args, **kwargs):
+
+        logger.debug(f"<_patch> Calling REST API with url='{url}'")
+
+        if self.session is None:
+            msg = "No session available"
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        #kwargs["timeout"]=10
+
+        #
+        #  Send the "patch" request.
+        #  If an error occurs, create a JSON response explaining the problem
+        #  and return it.
+        #
+        try:
+            resp = self._request("PATCH", url, json=data, *args, **{**kwargs, **self.session_kwargs})
+        except Exception as exc:
+            logger.error("An exception occurred while attempting to patch data to "
+                         f"the REST API. Exception details: {exc}")
+            resp_data = {
+                "status": "ERROR",
+                "addl_info": {
+                    "msg": "An exception occurred while patching data",
+                    "exception_details": f"{exc}",
+                }
+            }
+            return resp_data
+
+        if resp.status_code not in (200, 201):
+            logger.warning(f"RestApiV1._patch method returned status code {resp.status_code}")
+            logger.info(f"The data was: {data}")
+            logger.info(f"The response was: {resp.text}")
+
+        try:
+            resp_data = resp.json()
+            return resp_data
+        except json.JSONDecodeError:
+            # This is probably a 500 error that returned an HTML page
+            # instead of JSON text. Package it up to have the same
+            # structure as how the API would've handled a 4xx error so
+            # the consumer can look in the same place for info.
+            err = {
+                "status": "ERROR",
+                "addl_info":
+                {
+                    "msg": "The server returned an error.",
+                    "http_response_code": resp.status_code,
+                    "url" : url,
+                    "response": resp.text,
+                },
+            }
+            logger.info(f"response: {resp.text}")
+            return err
+
+    def get_component_image(self, part_id, **kwargs):
+        logger.debug(f"<get_image_by_part_id>")
+        path = f"api/v1/components/{sanitize(part_id)}/images"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp
+
+    def get_component_type_image_list(self, part_type_id, **kwargs):
+        logger.debug(f"<get_component_images>")
+        path = f"api/v1/component-types/{part_type_id}/images"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp
+
+    def get_image(self, image_id, write_to_file, **kwargs):
+        logger.debug(f"<get_image>")
+        path = f"api/v1/img/{image_id}"
+        url = self._url(path)
+
+        resp = self._get_binary(url, write_to_file, **kwargs)
+        return resp
+
+    ##############################################################################
+    #
+    #  HW ITEMS
+    #
+    ##############################################################################
+
+    def get_hwitem(self, part_id, **kwargs):
+        logger.debug(f"<get_hwitem> part_id={part_id}")
+        path = f"api/v1/components/{sanitize(part_id)}"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs) 
+        return resp
+
+    def get_hwitems(self, part_type_id, *,
+                    page=None, size=None, fields=None, 
+                    serial_number=None,
+                    part_id=None,
+                    **kwargs):
+
+        logger.debug(f"<get_component_types> part_type_id={part_type_id},"
+                    f"page={page}, size={size}, fields={fields}, "
+                    f"serial_number={serial_number}, part_id={part_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}/components"
+        url = self._url(path)
+
+        params = []
+        if page is not None:
+            params.append(("page", page))
+        if size is not None:
+            params.append(("size", size))
+        if serial_number is not None:
+            params.append(("serial_number", serial_number))
+        if part_id is not None:
+            params.append(("part_id", part_id))
+        ## *** currently broken in REST API
+        if fields is not None:
+            params.append(("fields", ",".join(fields)))
+
+        resp = self._get(url, params=params, **kwargs) 
+        return resp
+
+    def iter_hwitems(self, part_type_id, *,
+                    size=100, fields=None,
+                    serial_number=None,
+                    part_id=None,
+                    prefetch=DEFAULT_PREFETCH,
+                    **kwargs):
+        '''Yield every hwitem of the given type, one at a time
+
+        Fetches all pages of get_hwitems(). See _iter_pages for how pages
+        are prefetched.
+        '''
+        logger.debug(f"<iter_hwitems> part_type_id={part_type_id}, size={size}, "
+                     f"prefetch={prefetch}")
+
+        def fetch_page(page):
+            return self.get_hwitems(part_type_id, page=page, size=size, fields=fields,
+                                    serial_number=serial_number, part_id=part_id, **kwargs)
+
+        yield from _iter_pages(fetch_page, prefetch=prefetch)
+
+    def post_hwitem(self, part_type_id, data, **kwargs):
+        logger.debug(f"<post_hwitem> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}/components" 
+        url = self._url(path) 
+
+        resp = self._post(url, data=data, **kwargs)
+        return resp
+
+    def patch_hwitem(self, part_id, data, **kwargs):
+        logger.debug(f"<patch_hwitem> part_id={part_id}")
+        path = f"api/v1/components/{sanitize(part_id)}" 
+        url = self._url(path)
+
+        resp = self._patch(url, data=data, **kwargs)
+        return resp
+
+    def post_bulk_hwitems(self, part_type_id, data, **kwargs):
+        logger.debug(f"<post_bulk_hwitems> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}/bulk-add"
+        url = self._url(path)
+
+        resp = self._post(url, data=data, **kwargs)
+        return resp
+
+    def patch_part_id_enable(self, part_id, data, **kwargs):
+        logger.debug(f"<patch_part_id_enable> part_id={part_id}")
+        path = f"api/v1/components/{sanitize(part_id)}/enable" 
+        url = self._url(path)
+
+        resp = self._patch(url, data=data, **kwargs)
+        return resp
+
+    def get_subcomponents(self, part_id, **kwargs):
+        logger.debug(f"<get_subcomponents> part_id={part_id}")
+        path = f"api/v1/components/{sanitize(part_id)}/subcomponents" 
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp
+
+    def get_hwitem_tests(self, part_id, history=False, **kwargs):
+        logger.debug(f"<get_hwitem_tests> part_id={part_id}, history={history}")
+        path = f"api/v1/components/{sanitize(part_id)}/tests"
+        url = self._url(path)
+
+        params = []
+        if history:
+            params.append(("history", "true"))
+
+        resp = self._get(url, params=params, **kwargs)
+        return resp
+
+    def patch_subcomponents(self, part_id, data, **kwargs):
+        logger.debug(f"<patch_subcomponents> part_id={part_id}")
+        path = f"api/v1/components/{sanitize(part_id)}/subcomponents" 
+        url = self._url(path)
+
+        resp = self._patch(url, data=data, **kwargs)
+        return resp
+
+
+
+    ##############################################################################
+    #
+    #  COMPONENT TYPES
+    #
+    ##############################################################################
+
+    def get_component_type(self, part_type_id, **kwargs):
+        logger.debug(f"<get_component_type> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="component_type", **kwargs)
+        return resp
+
+    def get_component_type_connectors(self, part_type_id, **kwargs):
+        logger.debug(f"<get_component_type_connectors> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}/connectors"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="component_type_connectors", **kwargs)
+        return resp
+
+    def get_component_type_specifications(self, part_type_id, **kwargs):
+        logger.debug(f"<get_component_type_specifications> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{sanitize(part_type_id)}/specifications"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="component_type_specifications", **kwargs)
+        return resp
+
+    def get_component_types(self, project_id, system_id, subsystem_id=None, *,
+                            full_name=None, comments=None,
+                            #part_type_id=None,
+                            page=None, size=None, fields=None, **kwargs):
+        logger.debug(f"<get_component_types> project_id={project_id}, "
+                        f"system_id={system_id}, subsystem_id={subsystem_id}")
+
+        # There are actually two different REST API methods for this, one that
+        # takes proj/sys/subsys and the other that takes only proj/sys. You 
+        # can use a wildcard "0" for subsys for the first one and get the same
+        # results as the second, so there really was no need. But, we'll go ahead
+        # and use both, switching based on if subsystem_id is or isn't None.
+        if subsystem_id is None:
+            path = (f"api/v1/component-types/{sanitize(project_id)}/"
+                    f"{sanitize(system_id)}")
+        else:
+            path = (f"api/v1/component-types/{sanitize(project_id)}/"
+                    f"{sanitize(system_id)}/{sanitize(subsystem_id)}")
+        url = self._url(path)
+
+        params = []
+        if page is not None:
+            params.append(("page", page))
+        if size is not None:
+            params.append(("size", size))
+        if full_name is not None:
+            params.append(("full_name", full_name))
+        if comments is not None:
+            params.append(("comments", comments))
+        if fields is not None:
+            params.append(("fields", ",".join(fields)))
+
+        resp = self._get(url, params=params, cache_endpoint="component_types", **kwargs)
+        return resp
+
+    def iter_component_types(self, project_id, system_id, subsystem_id=None, *,
+                            full_name=None, comments=None,
+                            size=100, fields=None,
+                            prefetch=DEFAULT_PREFETCH,
+                            **kwargs):
+        '''Yield every component type matching the arguments, one at a time
+
+        Fetches all pages of get_component_types(). See _iter_pages for how
+        pages are prefetched.
+        '''
+        logger.debug(f"<iter_component_types> project_id={project_id}, "
+                     f"system_id={system_id}, subsystem_id={subsystem_id}, "
+                     f"size={size}, prefetch={prefetch}")
+
+        def fetch_page(page):
+            return self.get_component_types(project_id, system_id, subsystem_id,
+                                            full_name=full_name, comments=comments,
+                                            page=page, size=size, fields=fields, **kwargs)
+
+        yield from _iter_pages(fetch_page, prefetch=prefetch)
+
+    ##############################################################################
+    #
+    #  TESTS
+    #
+    ##############################################################################
+
+    def get_test_types(self, part_type_id, **kwargs):
+        logger.debug(f"<get_test_types> part_type_id={part_type_id}")
+        path = f"api/v1/component-types/{part_type_id}/test-types"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="test_types", **kwargs)
+        return resp
+
+    def get_test_type(self, part_type_id, test_type_id, **kwargs):
+        logger.debug(f"<get_test_type> part_type_id={part_type_id}, "
+                    f"test_type_id={test_type_id}")
+        path = f"api/v1/component-types/{part_type_id}/test-types/{test_type_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="test_type", **kwargs)
+        return resp
+
+    def get_test_type_by_oid(self, oid, **kwargs):
+        logger.debug(f"<get_test_type_by_oid> oid={oid}")
+        path = f"api/v1/component-test-types/{oid}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="test_type_by_oid", **kwargs)
+        return resp
+
+
+    ##############################################################################
+    #
+    #  MISCELLANEOUS
+    #
+    ##############################################################################
+
+    def whoami(self, **kwargs):
+        logger.debug(f"<whoami>")
+        path = "api/v1/users/whoami"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp 
+
+
+    def get_countries(self, **kwargs):
+        logger.debug(f"<get_countries>")
+        path = "api/v1/countries"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="countries", **kwargs)
+        return resp 
+
+    def get_institutions(self, **kwargs):
+        logger.debug(f"<get_institutions>")
+        path = "api/v1/institutions"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="institutions", **kwargs)
+        return resp 
+
+    def get_manufacturers(self, **kwargs):
+        logger.debug(f"<get_manufacturers>")
+        path = "api/v1/manufacturers"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="manufacturers", **kwargs)
+        return resp 
+
+    def get_projects(self, **kwargs):
+        logger.debug(f"<get_projects>")
+        path = "api/v1/projects"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="projects", **kwargs)
+        return resp 
+
+    def get_roles(self, **kwargs):
+        logger.debug(f"<get_roles>")
+        path = "api/v1/roles"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="roles", **kwargs)
+        return resp 
+
+    def get_users(self, **kwargs):
+        logger.debug(f"<get_users>")
+        path = "api/v1/users"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp 
+
+
+    def get_user(self, user_id, **kwargs):
+        logger.debug(f"<get_user> user_id={user_id}")
+        path = f"api/v1/users/{user_id}"
+        url = self._url(path)
+
+        resp = self._get(url, **kwargs)
+        return resp 
+
+    def get_role(self, role_id, **kwargs):
+        logger.debug(f"<get_role> role_id={role_id}")
+        path = f"api/v1/roles/{role_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="role", **kwargs)
+        return resp 
+
+    def get_subsystems(self, project_id, system_id, **kwargs):
+        logger.debug(f"<get_subsystems> project_id={project_id}, system_id={system_id}")
+        path = f"api/v1/subsystems/{project_id}/{system_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="subsystems", **kwargs)
+        return resp
+
+    def get_subsystem(self, project_id, system_id, subsystem_id, **kwargs): 
+        logger.debug(f"<get_subsystem> project_id={project_id}, "
+                        "system_id={system_id}, subsystem_id={subsystem_id}")
+        path = f"api/v1/subsystems/{project_id}/{system_id}/{subsystem_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="subsystem", **kwargs)
+        return resp
+
+    def get_systems(self, project_id, **kwargs):
+        logger.debug(f"<get_systems> project_id={project_id}")
+        path = f"api/v1/systems/{project_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="systems", **kwargs)
+        return resp 
+
+    def get_system(self, project_id, system_id, **kwargs):
+        logger.debug(f"<get_system> project_id={project_id}, system_id={system_id}")
+        path = f"api/v1/systems/{project_id}/{system_id}"
+        url = self._url(path)
+
+        resp = self._get(url, cache_endpoint="system", **kwargs)
+        return resp
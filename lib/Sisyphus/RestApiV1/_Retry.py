@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/_Retry.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+class RetryPolicy:
+    '''Decides whether a failed request should be sent again, and when
+
+    A request is retried if it raised one of 'retry_exceptions' or the
+    server answered with one of 'retry_statuses', up to 'max_retries'
+    additional attempts. The wait between attempts grows exponentially
+    from 'backoff_base' and is capped at 'backoff_max'. With 'jitter',
+    the wait is a random fraction of that ("full jitter"), so that many
+    clients failing at once don't all come back at the same moment. If
+    the server sends a Retry-After header, we wait at least that long
+    (but no more than 'max_retry_after').
+
+    Methods that aren't idempotent (POST) are treated more carefully,
+    since a retry could create a second item. They are only retried
+    when the server definitely didn't act on the request: the connection
+    could never be made, or the status is one of 'post_retry_statuses'.
+
+    If 'retry_exceptions' is None, default_retry_exceptions() is used.
+    '''
+
+    DEFAULT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+    DEFAULT_POST_RETRY_STATUSES = (429, 503)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE")
+
+    def __init__(self, *,
+                 max_retries=3,
+                 backoff_base=0.5,
+                 backoff_max=30.0,
+                 jitter=True,
+                 retry_statuses=DEFAULT_RETRY_STATUSES,
+                 post_retry_statuses=DEFAULT_POST_RETRY_STATUSES,
+                 retry_exceptions=None,
+                 respect_retry_after=True,
+                 max_retry_after=120.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = set(retry_statuses)
+        self.post_retry_statuses = set(post_retry_statuses)
+        self._retry_exceptions = tuple(retry_exceptions) if retry_exceptions is not None else None
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(max_retries={self.max_retries}, "
+                f"backoff_base={self.backoff_base}, backoff_max={self.backoff_max}, "
+                f"jitter={self.jitter})")
+
+    @staticmethod
+    def default_retry_exceptions():
+        '''Connection errors, timeouts, and responses that were cut off'''
+        # Imported here so that creating a policy doesn't load 'requests'
+        import requests.exceptions
+        return (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        )
+
+    @property
+    def retry_exceptions(self):
+        if self._retry_exceptions is None:
+            self._retry_exceptions = self.default_retry_exceptions()
+        return self._retry_exceptions
+
+    @classmethod
+    def never(cls):
+        '''A policy that makes exactly one attempt'''
+        return cls(max_retries=0)
+
+    def should_retry_status(self, method, status_code, attempt):
+        '''True if a response with this status should be retried
+
+        'attempt' is the number of retries already made (0 after the
+        first request).
+        '''
+        if attempt >= self.max_retries:
+            return False
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            return status_code in self.retry_statuses
+        return status_code in self.post_retry_statuses
+
+    def should_retry_exception(self, method, exc, attempt):
+        '''True if a request that raised 'exc' should be retried'''
+        if attempt >= self.max_retries:
+            return False
+        if not isinstance(exc, self.retry_exceptions):
+            return False
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            return True
+        return self.request_was_not_sent(exc)
+
+    @staticmethod
+    def request_was_not_sent(exc):
+        '''True if 'exc' shows that the request never reached the server'''
+        import requests.exceptions
+        import urllib3.exceptions
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            reason = exc.args[0] if exc.args else None
+            if isinstance(reason, urllib3.exceptions.MaxRetryError):
+                reason = reason.reason
+            return isinstance(reason, (urllib3.exceptions.NewConnectionError,
+                                       urllib3.exceptions.ConnectTimeoutError))
+        return False
+
+    def backoff(self, attempt):
+        '''Seconds to wait before retry number 'attempt' (starting at 0)'''
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def parse_retry_after(self, value):
+        '''Seconds requested by a Retry-After header, or None
+
+        The header may be a number of seconds or an HTTP date.
+        '''
+        if value is None:
+            return None
+        value = value.strip()
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            seconds = (when - datetime.now(timezone.utc)).total_seconds()
+        return max(0.0, seconds)
+
+    def delay(self, attempt, retry_after=None):
+        '''Seconds to wait before retry number 'attempt', honoring Retry-After'''
+        delay = self.backoff(attempt)
+        if self.respect_retry_after:
+            requested = self.parse_retry_after(retry_after)
+            if requested is not None:
+                delay = max(delay, min(requested, self.max_retry_after))
+        return delay
+
+    def sleep(self, attempt, retry_after=None):
+        delay = self.delay(attempt, retry_after)
+        time.sleep(delay)
+        return delay
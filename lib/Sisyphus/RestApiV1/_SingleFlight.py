@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/RestApiV1/_SingleFlight.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import threading
+from copy import deepcopy
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.exception = None
+
+class SingleFlight:
+    '''Lets identical requests that are in progress at the same time share
+    one round trip to the server
+
+    When a thread asks for something that another thread is already
+    fetching, it waits for that request to finish and gets the same result
+    (or the same exception) instead of sending its own. Requests that
+    arrive after the first one has finished are sent normally, so this
+    never returns stale data.
+
+    Every caller gets its own copy of the result, so they can modify it
+    without affecting each other.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(requests={self.requests}, "
+                f"coalesced={self.coalesced})")
+
+    def do(self, key, fn):
+        '''Return fn(), unless a call with the same key is already running,
+        in which case wait for it and return its result
+        '''
+        with self._lock:
+            call = self._calls.get(key, None)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.requests += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            logger.debug(f"<SingleFlight> waiting for request already in flight: {key}")
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return deepcopy(call.result)
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            with self._lock:
+                del self._calls[key]
+            call.exception = exc
+            call.done.set()
+            raise
+
+        # Once the call is removed, nobody else can join it, so we know
+        # whether anyone needs a copy that the caller can't touch.
+        with self._lock:
+            del self._calls[key]
+            waiters = call.waiters
+        if waiters:
+            call.result = deepcopy(result)
+        call.done.set()
+        return result
+
+def request_key(method, url, args, kwargs):
+    '''Make a hashable key out of a request's arguments
+
+    Returns None if an argument can't be made hashable, in which case the
+    request shouldn't be shared.
+    '''
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((str(k), freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        hash(value)
+        return value
+    try:
+        return (method.upper(), url, freeze(args), freeze(kwargs))
+    except TypeError:
+        return None
@@ -7,3 +7,6 @@ Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
 """
 
 from ._RestApiV1 import *
+
+# 'import *' leaves this out, and it provides default_retry_policy
+from ._RestApiV1 import __getattr__
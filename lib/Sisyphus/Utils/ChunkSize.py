@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/ChunkSize.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Picks how many items to put in each request when a large job is split
+into several requests (e.g., bulk-adding HW Items). The size grows while
+the server answers quickly and shrinks when it slows down, so that each
+request takes roughly 'target' seconds:
+
+    chunk_size = AdaptiveChunkSize()
+    for count in chunk_size.chunks(total):
+        start = time.perf_counter()
+        send_request(count)
+        chunk_size.record(count, time.perf_counter() - start)
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import threading
+
+DEFAULT_INITIAL = 10
+DEFAULT_MINIMUM = 1
+DEFAULT_MAXIMUM = 200
+DEFAULT_TARGET = 2.0
+
+class AdaptiveChunkSize:
+    '''A chunk size that adapts to how long requests are taking
+
+    The time per item is tracked as a moving average, and the next size
+    is whatever would take 'target' seconds at that rate, but never more
+    than double or less than half of the current size, so one unusually
+    fast or slow response can't swing it too far. Safe to share between
+    threads.
+    '''
+    def __init__(self, initial=DEFAULT_INITIAL, *,
+                 minimum=DEFAULT_MINIMUM,
+                 maximum=DEFAULT_MAXIMUM,
+                 target=DEFAULT_TARGET,
+                 smoothing=0.5):
+        if not 1 <= minimum <= maximum:
+            raise ValueError("chunk sizes must satisfy 1 <= minimum <= maximum")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.smoothing = smoothing
+        self._size = min(max(initial, minimum), maximum)
+        self._per_item = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<AdaptiveChunkSize size={self.size}>"
+
+    @property
+    def size(self):
+        return int(self._size)
+
+    def record(self, count, elapsed):
+        '''Update the size after a request for 'count' items took 'elapsed' seconds'''
+        if count <= 0 or elapsed <= 0:
+            return
+        with self._lock:
+            per_item = elapsed / count
+            if self._per_item is None:
+                self._per_item = per_item
+            else:
+                self._per_item += self.smoothing * (per_item - self._per_item)
+
+            ideal = self.target / self._per_item
+            size = min(max(ideal, self._size / 2), self._size * 2)
+            self._size = min(max(size, self.minimum), self.maximum)
+        logger.debug(f"<AdaptiveChunkSize> {count} items in {elapsed:.3f}s, "
+                     f"next size {self.size}")
+
+    def failed(self):
+        '''Halve the size after a request failed or timed out'''
+        with self._lock:
+            self._size = max(self._size / 2, self.minimum)
+
+    def chunks(self, total):
+        '''Yield chunk sizes adding up to 'total'
+
+        Each size is read when it's needed, so record() calls made in
+        between are taken into account.
+        '''
+        remaining = total
+        while remaining > 0:
+            count = min(self.size, remaining)
+            yield count
+            remaining -= count
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/Concurrency.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Limits how many REST API requests are in progress at once, and adapts the
+limit to how well the server is coping, the way TCP does: additive
+increase, multiplicative decrease. While requests succeed at their usual
+speed, the limit goes up by one for each limit's worth of them. When one
+fails with a 5xx status (or 429), raises (e.g., times out), or takes much
+longer than usual for its endpoint, the limit is halved:
+
+    limit = AdaptiveLimit()
+    with limited(limit, "GET", url) as slot:
+        resp = session.get(url)
+        slot.finish(resp.status_code)
+
+Sisyphus.RestApiV1 and Sisyphus.RestApi both use the limit returned by
+get_shared_limit(), so a crawl and an upload running at the same time back
+off together. The current limit is also reported by Utils.Metrics.
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from Sisyphus.Utils.Metrics import metrics, endpoint_template
+
+DEFAULT_INITIAL = 10
+DEFAULT_MINIMUM = 1
+# Keep this no more than RestApiV1's DEFAULT_POOL_SIZE (and the pool size in
+# Sisyphus.RestApi), or connections will be opened and thrown away
+DEFAULT_MAXIMUM = 64
+DEFAULT_BACKOFF = 0.5
+DEFAULT_SPIKE_FACTOR = 3.0
+
+# The number of responses from an endpoint needed to know its usual
+# latency, before any of them can count as a spike
+MIN_SAMPLES = 5
+
+class AdaptiveLimit:
+    '''A limit on requests in progress that adapts to the server (AIMD)
+
+    Only requests that were in progress while the limit was reached count
+    toward raising it, so it doesn't run away while the callers are using
+    fewer threads than it allows. After backing off, responses to requests
+    that were sent before the back-off can't cause another one, so a burst
+    of errors from one moment only halves the limit once. Safe to share
+    between threads.
+
+    A slow response also raises the usual latency of its endpoint, by
+    'spike_smoothing' of the difference, so if the server settles at a
+    slower speed, its responses soon stop counting as spikes and the
+    limit can grow again.
+
+    If the process forks, the child starts with nothing in flight, since
+    the threads holding slots in the parent don't exist there.
+    '''
+    def __init__(self, initial=DEFAULT_INITIAL, *,
+                 minimum=DEFAULT_MINIMUM,
+                 maximum=DEFAULT_MAXIMUM,
+                 backoff=DEFAULT_BACKOFF,
+                 spike_factor=DEFAULT_SPIKE_FACTOR,
+                 smoothing=0.02,
+                 spike_smoothing=0.2):
+        if not 1 <= minimum <= maximum:
+            raise ValueError("limits must satisfy 1 <= minimum <= maximum")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.spike_factor = spike_factor
+        self.smoothing = smoothing
+        self.spike_smoothing = spike_smoothing
+
+        self._limit = min(max(initial, minimum), maximum)
+        self._successes = 0  # toward the next increase
+        self._reset()
+        self._latency = {}  # (method, endpoint) -> (samples, usual latency)
+        self._last_backoff = float("-inf")
+        self._fills = 0  # times the limit has been reached
+
+        self.increases = 0
+        self.decreases = 0
+        self.max_in_flight = 0
+
+    def _reset(self):
+        # Forget every slot. Called at creation and after a fork.
+        self._pid = os.getpid()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            logger.debug(f"<AdaptiveLimit> process {os.getpid()} was forked from "
+                         f"{self._pid}, so forgetting {self._in_flight} requests in flight")
+            self._reset()
+
+    def __repr__(self):
+        return f"<AdaptiveLimit limit={self.limit} in_flight={self.in_flight}>"
+
+    @property
+    def limit(self):
+        '''The number of requests currently allowed at once'''
+        return self._limit
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "minimum": self.minimum,
+                "maximum": self.maximum,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+    def acquire(self):
+        '''Wait for room for one more request, and return its _Slot'''
+        self._check_fork()
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._condition.wait()
+            fills = self._fills
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            if self._in_flight >= self._limit:
+                self._fills += 1
+        return _Slot(self, fills)
+
+    def _release(self, slot, key, elapsed, overloaded):
+        self._check_fork()
+        if slot.pid != self._pid:
+            # taken in the parent, before a fork, and already forgotten
+            return
+        with self._condition:
+            self._in_flight -= 1
+            if overloaded:
+                self._back_off(slot, "the request failed")
+            elif self._is_spike(key, elapsed):
+                self._back_off(slot, f"a response took {elapsed:.3f}s")
+            elif self._fills > slot.fills and self._limit < self.maximum:
+                # +1 for each full limit's worth of successes
+                self._successes += 1
+                if self._successes >= self._limit:
+                    self._limit += 1
+                    self._successes = 0
+                    self.increases += 1
+                    logger.debug(f"<AdaptiveLimit> raised to {self._limit}")
+            self._condition.notify_all()
+
+    def _is_spike(self, key, elapsed):
+        # Call with the lock held. The usual latency follows faster
+        # responses right away, but slower ones only a little at a time,
+        # so that a server slowing down gradually under the load is still
+        # noticed. Spikes pull it up faster, so that a lasting change in
+        # speed soon becomes the usual one.
+        if key is None:
+            return False
+        samples, usual = self._latency.get(key, (0, None))
+        spike = samples >= MIN_SAMPLES and elapsed > self.spike_factor * usual
+        if usual is None or elapsed < usual:
+            usual = elapsed
+        elif spike:
+            usual += self.spike_smoothing * (elapsed - usual)
+        else:
+            usual += self.smoothing * (elapsed - usual)
+        self._latency[key] = (samples + 1, usual)
+        return spike
+
+    def _back_off(self, slot, reason):
+        # Call with the lock held
+        if slot.start <= self._last_backoff:
+            return
+        self._last_backoff = time.perf_counter()
+        self._successes = 0
+        old_limit = self._limit
+        self._limit = max(int(self._limit * self.backoff), self.minimum)
+        if self._limit < old_limit:
+            self.decreases += 1
+            logger.info(f"<AdaptiveLimit> lowered from {old_limit} to {self.limit} "
+                        f"because {reason}")
+
+class _Slot:
+    '''Room for one request, given out by AdaptiveLimit.acquire()'''
+    def __init__(self, limit, fills):
+        self.limit = limit
+        self.pid = limit._pid
+        self.fills = fills
+        self.start = time.perf_counter()
+        self.status = None
+
+    def finish(self, status):
+        '''Give the status code of the response'''
+        self.status = status
+
+    def release(self, key=None, overloaded=None):
+        '''Give the room back. 'overloaded' is decided from the status if None.'''
+        if overloaded is None:
+            overloaded = self.status is None or _overloaded(self.status)
+        self.limit._release(self, key, time.perf_counter() - self.start, overloaded)
+
+class _NullSlot(_Slot):
+    def __init__(self):
+        self.status = None
+
+def _overloaded(status):
+    return status == 429 or status >= 500
+
+@contextmanager
+def limited(limit, method, url):
+    '''Hold a slot of 'limit' (an AdaptiveLimit, or None for no limit)
+    around one request
+
+    Call finish(status_code) on what this yields when the response
+    arrives. If the block raises, or the response has a 5xx or 429 status,
+    the limit backs off.
+    '''
+    if limit is None:
+        yield _NullSlot()
+        return
+    slot = limit.acquire()
+    try:
+        yield slot
+    except BaseException:
+        slot.release(overloaded=True)
+        raise
+    else:
+        slot.release(key=(method.upper(), endpoint_template(url)))
+
+#-----------------------------------------------------------------------------
+
+_shared_limit = None
+_shared_limit_set = False
+_shared_lock = threading.Lock()
+
+def get_shared_limit():
+    '''The AdaptiveLimit used by Sisyphus.RestApiV1 and Sisyphus.RestApi,
+    or None if requests aren't limited. It's created the first time it's
+    needed.
+    '''
+    global _shared_limit, _shared_limit_set
+    if not _shared_limit_set:
+        with _shared_lock:
+            if not _shared_limit_set:
+                _shared_limit = AdaptiveLimit()
+                _shared_limit_set = True
+    return _shared_limit
+
+def set_shared_limit(limit):
+    '''Replace the shared AdaptiveLimit. Use None to stop limiting requests.'''
+    global _shared_limit, _shared_limit_set
+    with _shared_lock:
+        _shared_limit = limit
+        _shared_limit_set = True
+
+def _after_fork():
+    # The lock might have been held by a thread that didn't survive the
+    # fork. The limits check for the fork themselves.
+    global _shared_lock
+    _shared_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def _limit_gauge(key):
+    def gauge():
+        limit = _shared_limit if _shared_limit_set else None
+        return None if limit is None else limit.snapshot()[key]
+    return gauge
+
+metrics.register_gauge("concurrency_limit", "Requests currently allowed at once",
+                       _limit_gauge("limit"))
+metrics.register_gauge("concurrency_in_flight", "Requests currently holding a slot",
+                       _limit_gauge("in_flight"))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/Download.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Streams a binary file (such as an image) from the REST API to disk. Used
+by the _get_binary functions in Sisyphus.RestApiV1 and Sisyphus.RestApi.
+
+The data is written in chunks to "<filename>.part", which is renamed to
+<filename> only after the whole file has arrived (and matched its
+checksum, if one was given). If the transfer is interrupted, the next
+attempt asks the server for only the part that's missing.
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import os
+import time
+import hashlib
+
+DEFAULT_CHUNK_SIZE = 0x10000
+DEFAULT_HASH_ALGORITHM = "sha256"
+
+# The number of times a download will be resumed after the connection
+# fails partway through
+DEFAULT_MAX_RESUMES = 3
+
+class DownloadError(Exception):
+    """raised when the server refuses to send the file"""
+    def __init__(self, msg, status_code=None):
+        super().__init__(msg)
+        self.status_code = status_code
+
+class ChecksumError(DownloadError):
+    """raised when a downloaded file doesn't match the expected checksum"""
+    def __init__(self, msg, expected, actual):
+        super().__init__(msg)
+        self.expected = expected
+        self.actual = actual
+
+def partial_filename(filename):
+    return f"{filename}.part"
+
+def parse_checksum(checksum, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    '''Split "sha256:abc123..." into ("sha256", "abc123...")
+
+    A bare digest uses 'hash_algorithm'.
+    '''
+    if ":" in checksum:
+        hash_algorithm, checksum = checksum.split(":", 1)
+    return hash_algorithm.lower(), checksum.strip().lower()
+
+def _content_range_start(resp):
+    # "Content-Range: bytes 1000-1999/2000" -> 1000
+    value = resp.headers.get("Content-Range", "")
+    try:
+        unit, rest = value.split(" ", 1)
+        return int(rest.split("-", 1)[0]) if unit == "bytes" else None
+    except ValueError:
+        return None
+
+def download(send, url, filename, *,
+             chunk_size=DEFAULT_CHUNK_SIZE,
+             resume=True,
+             checksum=None,
+             hash_algorithm=DEFAULT_HASH_ALGORITHM,
+             max_resumes=DEFAULT_MAX_RESUMES,
+             **kwargs):
+    '''Stream 'url' to 'filename'
+
+    'send(url, **kwargs)' must make a GET request and return the
+    requests.Response. It is called with stream=True, and with a "Range"
+    header when resuming.
+
+    If 'resume' is True and a partial file is left over from an earlier
+    attempt, only the rest of the file is requested. If 'checksum' is
+    given (as a hex digest, optionally prefixed by the algorithm, e.g.,
+    "sha256:..."), the file is checked before it's renamed into place.
+
+    Returns a dictionary with the filename, its size in bytes, how many
+    bytes were received by this call, where it resumed from, and the
+    elapsed time and throughput. Raises DownloadError if the server
+    answered with an error status, ChecksumError if the file is wrong,
+    and whatever 'send' or the file system raised otherwise.
+    '''
+    import requests.exceptions
+    interrupted = (requests.exceptions.ConnectionError,
+                   requests.exceptions.ChunkedEncodingError,
+                   requests.exceptions.Timeout)
+
+    part = partial_filename(filename)
+    if checksum is not None:
+        hash_algorithm, checksum = parse_checksum(checksum, hash_algorithm)
+
+    def restart():
+        # Forget anything we've already received
+        if os.path.exists(part):
+            os.remove(part)
+        return 0, hashlib.new(hash_algorithm) if checksum is not None else None
+
+    if resume and os.path.exists(part):
+        offset = os.path.getsize(part)
+        hasher = hashlib.new(hash_algorithm) if checksum is not None else None
+        if hasher is not None:
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    hasher.update(chunk)
+    else:
+        offset, hasher = restart()
+
+    resumed_from = offset
+    received = 0
+    resumes = 0
+    start = time.perf_counter()
+
+    while True:
+        headers = dict(kwargs.get("headers", None) or {})
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            logger.info(f"<download> resuming '{url}' at byte {offset}")
+        try:
+            resp = send(url, **{**kwargs, "headers": headers, "stream": True})
+            with resp:
+                if offset and resp.status_code == 206 and _content_range_start(resp) == offset:
+                    mode = "ab"
+                elif resp.status_code in (200, 201):
+                    if offset:
+                        logger.info("<download> the server sent the whole file, "
+                                    "so starting over")
+                        offset, hasher = restart()
+                        resumed_from = 0
+                    mode = "wb"
+                elif offset and resp.status_code in (206, 416):
+                    # The server didn't like our range, so the partial file
+                    # is probably bad. Try again from the beginning.
+                    logger.warning(f"<download> unable to resume '{url}' (status code "
+                                   f"{resp.status_code}), starting over")
+                    offset, hasher = restart()
+                    resumed_from = 0
+                    continue
+                else:
+                    raise DownloadError(f"the request failed: status code {resp.status_code}",
+                                        resp.status_code)
+
+                with open(part, mode) as f:
+                    for chunk in resp.iter_content(chunk_size):
+                        f.write(chunk)
+                        if hasher is not None:
+                            hasher.update(chunk)
+                        offset += len(chunk)
+                        received += len(chunk)
+        except interrupted as exc:
+            if not resume or resumes >= max_resumes:
+                raise
+            resumes += 1
+            logger.warning(f"<download> transfer of '{url}' was interrupted after "
+                           f"{offset} bytes ({exc}). Resume {resumes} of {max_resumes}.")
+            continue
+        break
+
+    actual = hasher.hexdigest() if hasher is not None else None
+    if checksum is not None and actual != checksum:
+        os.remove(part)
+        raise ChecksumError(f"'{url}' failed the {hash_algorithm} check", checksum, actual)
+
+    os.replace(part, filename)
+
+    elapsed = time.perf_counter() - start
+    result = {
+        "filename": filename,
+        "bytes": offset,
+        "bytes_received": received,
+        "resumed_from": resumed_from,
+        "elapsed": elapsed,
+        "throughput": received / elapsed if elapsed > 0 else None,
+        "checksum": f"{hash_algorithm}:{actual}" if actual is not None else None,
+    }
+    logger.debug(f"<download> {result}")
+    return result
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/Metrics.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Per-endpoint statistics for REST API requests. Both Sisyphus.RestApiV1
+and Sisyphus.RestApi record every request in the shared 'metrics'
+object, which can be examined from Python or written to a file:
+
+    from Sisyphus.Utils.Metrics import metrics
+    ...
+    print(metrics.snapshot())
+    metrics.write("metrics.json")    # or "metrics.prom" for Prometheus text
+"""
+
+import re
+import json
+import time
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets. There is an
+# implied final bucket for everything slower.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Rules for turning a URL path into an endpoint template, so that requests
+# for different items are counted together. Each rule is applied to a
+# single path segment, and the first one that matches wins.
+_SEGMENT_RULES = [
+    (re.compile(r"^[A-Z]\d{11}-\d{5}$"), "{part_id}"),
+    (re.compile(r"^[A-Z]\d{11}$"), "{part_type_id}"),
+    (re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"), "{image_id}"),
+    (re.compile(r"^\d+$"), "{id}"),
+]
+# Segments following these are free-form names, e.g. a test name
+_NAME_AFTER = {"tests", "test-types"}
+# Segments following these are project IDs (a single letter), e.g.,
+# /component-types/D/1/1
+_PROJECT_AFTER = {"component-types", "systems", "subsystems"}
+
+def endpoint_template(url):
+    '''Reduce a URL to its endpoint, e.g., "/api/v1/components/{part_id}"
+
+    The host, any prefix before "/api/", and the query string are dropped.
+    '''
+    path = urllib.parse.urlsplit(url).path
+    index = path.find("/api/")
+    if index >= 0:
+        path = path[index:]
+
+    segments = path.split("/")
+    result = []
+    for pos, segment in enumerate(segments):
+        replacement = None
+        for pattern, name in _SEGMENT_RULES:
+            if pattern.match(segment):
+                replacement = name
+                break
+        if replacement is None and pos > 0:
+            previous = segments[pos - 1]
+            if previous in _NAME_AFTER and segment:
+                replacement = "{name}"
+            elif previous in _PROJECT_AFTER and re.match(r"^[A-Za-z]$", segment):
+                replacement = "{project_id}"
+        result.append(replacement or segment)
+    return "/".join(result)
+
+
+class EndpointStats:
+    '''Counters for a single (method, endpoint template)'''
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.requests = 0
+        self.statuses = {}
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _observe_latency(self, seconds):
+        self.latency_sum += seconds
+        self.latency_min = seconds if self.latency_min is None else min(self.latency_min, seconds)
+        self.latency_max = seconds if self.latency_max is None else max(self.latency_max, seconds)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.latency_buckets[index] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+    def as_dict(self):
+        return {
+            "method": self.method,
+            "endpoint": self.endpoint,
+            "requests": self.requests,
+            "statuses": dict(self.statuses),
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency": {
+                "sum": self.latency_sum,
+                "min": self.latency_min,
+                "max": self.latency_max,
+                "mean": self.latency_sum / self.requests if self.requests else None,
+                "buckets": {
+                    **{str(bound): count for bound, count
+                            in zip(LATENCY_BUCKETS, self.latency_buckets)},
+                    "+Inf": self.latency_buckets[-1],
+                },
+            },
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+class Metrics:
+    '''A thread-safe collection of EndpointStats'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._gauges = {}
+        self.enabled = True
+
+    def _get_stats(self, method, url):
+        key = (method.upper(), endpoint_template(url))
+        stats = self._stats.get(key, None)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats(*key)
+        return stats
+
+    @contextmanager
+    def track(self, method, url):
+        '''Record a single request to 'url'
+
+        Use as a context manager around the request. The object it yields
+        has a finish(status_code, response_bytes, request_bytes) method,
+        which should be called when the response arrives. If the block
+        raises instead, the request is counted with status "exception".
+        '''
+        if not self.enabled:
+            yield _NullRequest()
+            return
+
+        with self._lock:
+            stats = self._get_stats(method, url)
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+
+        request = _TrackedRequest()
+        start = time.perf_counter()
+        try:
+            yield request
+        except BaseException:
+            request.status = "exception"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            status = str(request.status if request.status is not None else "exception")
+            with self._lock:
+                stats.in_flight -= 1
+                stats.requests += 1
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+                stats.request_bytes += request.request_bytes or 0
+                stats.response_bytes += request.response_bytes or 0
+                stats._observe_latency(elapsed)
+
+    def record_retry(self, method, url):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get_stats(method, url).retries += 1
+
+    def register_gauge(self, name, help_text, fn):
+        '''Report fn() as 'name' alongside the endpoint statistics
+
+        'fn' is called whenever the statistics are read, and may return
+        None to leave the gauge out. Gauges are kept by reset().
+        '''
+        with self._lock:
+            self._gauges[name] = (help_text, fn)
+
+    def gauges(self):
+        '''Return the current value of every gauge that has one'''
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = {}
+        for name, (help_text, fn) in gauges:
+            value = fn()
+            if value is not None:
+                values[name] = value
+        return values
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def snapshot(self):
+        '''Return the current statistics as a list of dictionaries'''
+        with self._lock:
+            return [stats.as_dict() for key, stats in sorted(self._stats.items())]
+
+    def to_json(self):
+        return json.dumps({"latency_buckets": list(LATENCY_BUCKETS),
+                           "endpoints": self.snapshot(),
+                           "gauges": self.gauges()}, indent=4)
+
+    def to_prometheus(self, prefix="sisyphus_rest"):
+        '''Return the statistics in the Prometheus text exposition format'''
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def labels(item, **extra):
+            pairs = {"method": item["method"], "endpoint": item["endpoint"], **extra}
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items())
+            return "{" + text + "}"
+
+        snapshot = self.snapshot()
+
+        header("requests_total", "counter", "Completed requests by status code")
+        for item in snapshot:
+            for status, count in sorted(item["statuses"].items()):
+                lines.append(f"{prefix}_requests_total{labels(item, status=status)} {count}")
+
+        header("request_duration_seconds", "histogram", "Request latency")
+        for item in snapshot:
+            cumulative = 0
+            for bound, count in item["latency"]["buckets"].items():
+                cumulative += count
+                lines.append(f"{prefix}_request_duration_seconds_bucket"
+                             f"{labels(item, le=bound)} {cumulative}")
+            lines.append(f"{prefix}_request_duration_seconds_sum{labels(item)} "
+                         f"{item['latency']['sum']}")
+            lines.append(f"{prefix}_request_duration_seconds_count{labels(item)} "
+                         f"{item['requests']}")
+
+        for name, key, help_text in (
+                    ("request_bytes_total", "request_bytes", "Bytes sent in request bodies"),
+                    ("response_bytes_total", "response_bytes", "Bytes received in response bodies"),
+                    ("retries_total", "retries", "Requests that were retried")):
+            header(name, "counter", help_text)
+            for item in snapshot:
+                lines.append(f"{prefix}_{name}{labels(item)} {item[key]}")
+
+        for name, key, help_text in (
+                    ("in_flight", "in_flight", "Requests currently in progress"),
+                    ("max_in_flight", "max_in_flight", "Most requests in progress at once")):
+            header(name, "gauge", help_text)
+            for item in snapshot:
+                lines.append(f"{prefix}_{name}{labels(item)} {item[key]}")
+
+        with self._lock:
+            help_texts = {name: help_text for name, (help_text, fn) in self._gauges.items()}
+        for name, value in self.gauges().items():
+            header(name, "gauge", help_texts[name])
+            lines.append(f"{prefix}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        '''Write the statistics to a file
+
+        Files ending in ".prom" or ".txt" get the Prometheus text format;
+        anything else gets JSON.
+        '''
+        if filename.endswith((".prom", ".txt")):
+            contents = self.to_prometheus()
+        else:
+            contents = self.to_json()
+        with open(filename, "w") as f:
+            f.write(contents)
+
+
+class _TrackedRequest:
+    def __init__(self):
+        self.status = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def finish(self, status, response_bytes=0, request_bytes=0):
+        self.status = status
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+
+
+class _NullRequest(_TrackedRequest):
+    pass
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def body_size(body):
+    '''The size in bytes of a request body as prepared by requests'''
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def response_size(resp, streamed=False):
+    '''The size in bytes of a requests.Response body
+
+    For streamed responses, the body hasn't been read yet, so we go by
+    the Content-Length header instead.
+    '''
+    if streamed:
+        try:
+            return int(resp.headers.get("Content-Length", 0))
+        except ValueError:
+            return 0
+    return len(resp.content)
+
+
+metrics = Metrics()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/SheetCache.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Keeps sheets that have already been parsed on disk, so that running the
+same docket again (e.g., a dry run followed by --submit) doesn't have to
+parse the spreadsheets again. SheetReader uses this automatically; see
+SheetReader.get_sheet_cache().
+
+Entries are keyed by the file's path, size, modification time and a hash
+of its contents, along with the sheet name and the options used to read
+it, so editing a file (or replacing it with a different one) is never
+missed. Sheets are stored as Parquet if pyarrow is installed, and as
+pickles otherwise (or if Parquet can't hold a sheet, e.g., because it has
+a column with both numbers and strings).
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import os
+import io
+import json
+import pickle
+import hashlib
+import tempfile
+import threading
+import importlib.util
+
+CACHE_DIRNAME = "sheets"
+DEFAULT_MAX_BYTES = 0x10000000  # 256 MiB
+
+# Files bigger than this aren't cached, since storing a sheet means having
+# all of it in memory at once
+MAX_FILE_BYTES = 0x1000000  # 16 MiB
+
+# Change this if the way sheets are read changes, so that old entries are
+# no longer used
+FORMAT_VERSION = 1
+
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+_SUFFIXES = (".parquet", ".pkl", ".json")
+
+class SheetCache:
+    '''A size-bounded cache of parsed sheets, stored as files in 'root'
+
+    When the total size of the files goes over 'max_bytes', the least
+    recently used entries are deleted. With 'refresh' set, entries are
+    never returned, but new ones are still stored.
+    '''
+    def __init__(self, root, *,
+                 max_bytes=DEFAULT_MAX_BYTES,
+                 refresh=False,
+                 use_parquet=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.use_parquet = HAVE_PYARROW if use_parquet is None else use_parquet
+
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._total_bytes = None
+
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg=None):
+        '''Create a cache in the configuration's cache directory'''
+        cfg = cfg or config
+        return cls(os.path.join(cfg.cache_root, CACHE_DIRNAME),
+                   refresh=getattr(cfg, "refresh_cache", False))
+
+    def fingerprint(self, filename):
+        '''(path, size, mtime, content hash) for a file, or None if it's too big
+
+        The hash is remembered as long as the size and mtime don't change,
+        so a file is only read once per process.
+        '''
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        if st.st_size > MAX_FILE_BYTES:
+            return None
+        stat_key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(stat_key, None)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(0x100000), b""):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._hashes[stat_key] = digest
+        return (*stat_key, digest)
+
+    def _key(self, filename, kind, sheet_name=None, options=None):
+        try:
+            fingerprint = self.fingerprint(filename)
+        except OSError:
+            return None
+        if fingerprint is None:
+            return None
+        key_info = [FORMAT_VERSION, kind, *fingerprint, sheet_name, options or {}]
+        return hashlib.sha256(
+                json.dumps(key_info, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def can_store(self, filename):
+        '''Whether anything can be stored for this file, e.g., it isn't too big'''
+        return self._key(filename, "sheet") is not None
+
+    def _path(self, key, suffix):
+        return os.path.join(self.root, f"{key}{suffix}")
+
+    def _read(self, path, reader):
+        try:
+            value = reader(path)
+            # mark the file as recently used, for eviction
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Unable to read {path} from the sheet cache: {exc}")
+            return None
+
+    def get_info(self, filename):
+        '''Return the file info stored for this file, or None'''
+        if self.refresh:
+            return None
+        key = self._key(filename, "info")
+        if key is None:
+            return None
+        def reader(path):
+            with open(path, "r") as f:
+                return json.load(f)
+        return self._read(self._path(key, ".json"), reader)
+
+    def put_info(self, filename, info):
+        '''Store file info (anything JSON can hold) for this file'''
+        key = self._key(filename, "info")
+        if key is None:
+            return
+        data = json.dumps(info).encode("utf-8")
+        self._write(self._path(key, ".json"), lambda f: f.write(data))
+
+    def get_sheet(self, filename, sheet_name=None, options=None):
+        '''Return the DataFrame stored for this sheet, or None'''
+        if self.refresh:
+            return None
+        key = self._key(filename, "sheet", sheet_name, options)
+        if key is None:
+            return None
+        if HAVE_PYARROW:
+            import pandas as pd
+            df = self._read(self._path(key, ".parquet"), pd.read_parquet)
+            if df is not None:
+                return df
+        def reader(path):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        return self._read(self._path(key, ".pkl"), reader)
+
+    def put_sheet(self, filename, sheet_name, options, df):
+        '''Store the DataFrame read from this sheet'''
+        key = self._key(filename, "sheet", sheet_name, options)
+        if key is None:
+            return
+        if self.use_parquet:
+            try:
+                buffer = io.BytesIO()
+                df.to_parquet(buffer)
+            except Exception as exc:
+                logger.debug(f"Sheet '{sheet_name}' of {filename} can't be stored "
+                             f"as Parquet ({exc}), so it will be pickled")
+            else:
+                self._write(self._path(key, ".parquet"), lambda f: f.write(buffer.getvalue()))
+                return
+        data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._path(key, ".pkl"), lambda f: f.write(data))
+
+    def _write(self, path, writer):
+        # Write to a temp file and rename it, so that another process
+        # (e.g., one of SheetReader.map_files' workers) never sees a
+        # partial file.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp_")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    writer(f)
+                size = os.path.getsize(tmp_path)
+                try:
+                    old_size = os.path.getsize(path)
+                except OSError:
+                    old_size = 0
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError as exc:
+            logger.warning(f"Unable to write to the sheet cache: {exc}")
+            return
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size - old_size
+        self._evict()
+
+    def _entries(self):
+        result = []
+        for name in os.listdir(self.root):
+            if not name.endswith(_SUFFIXES) or name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def _evict(self):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            # oldest first
+            entries = sorted(self._entries())
+            self._total_bytes = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._total_bytes -= size
+            logger.debug(f"Sheet cache trimmed to {self._total_bytes} bytes")
+
+    def clear(self):
+        '''Delete every entry in the cache'''
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
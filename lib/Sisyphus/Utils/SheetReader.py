@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/SheetReader.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Reads spreadsheets (Excel or CSV) a batch of rows at a time, so that a
+large sheet never has to be in memory all at once:
+
+    file_type, sheet_names = SheetReader.file_info("data.xlsx")
+    for df in SheetReader.iter_batches("data.xlsx", "Sheet1"):
+        ...
+
+Each batch is a DataFrame with the sheet's column names. The index keeps
+counting from one batch to the next, so row numbers are the same as if
+the whole sheet had been read with pandas. CSV files are read with
+pd.read_csv(chunksize=...), and .xlsx files with openpyxl in read-only
+mode, parsed the same way pd.read_excel parses them. Other formats pandas
+can read (e.g., .xls, .ods) are read whole and then split into batches.
+
+The type of each column is worked out separately for each batch, so it
+can differ from what pandas gives for the whole sheet: e.g., a column of
+integers is int64 in a batch with no blank cells in that column, but
+float64 in a batch that has one.
+
+Sheets that have been read before are taken from a SheetCache on disk
+instead of being parsed again, unless the file has changed. Use
+set_sheet_cache(None) to turn this off.
+
+When there are many files to read, map_files runs a function on each one
+in a pool of processes, since parsing spreadsheets is CPU-bound:
+
+    for file_type, sheet_names in SheetReader.map_files(
+                SheetReader.file_info, [(fn,) for fn in filenames]):
+        ...
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import zipfile
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+EXCEL = "Excel"
+CSV = "CSV"
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Starting a process pool isn't free, so fewer files than this are just
+# read in this process
+POOL_MIN_JOBS = 4
+
+_DEFAULT = object()
+_sheet_cache = _DEFAULT
+
+def get_sheet_cache():
+    '''Return the SheetCache used for reading sheets, or None if there isn't one'''
+    global _sheet_cache
+    if _sheet_cache is _DEFAULT:
+        from Sisyphus.Utils.SheetCache import SheetCache
+        try:
+            _sheet_cache = SheetCache.from_config(config)
+        except OSError as exc:
+            logger.warning(f"Unable to use the sheet cache: {exc}")
+            _sheet_cache = None
+    return _sheet_cache
+
+def set_sheet_cache(cache):
+    '''Replace the SheetCache used for reading sheets. Use None to turn caching off.'''
+    global _sheet_cache
+    _sheet_cache = cache
+
+def file_info(filename, *, cache=_DEFAULT):
+    '''Returns (EXCEL, [sheet names]) or (CSV, None)
+
+    Raises ValueError if the file can't be read as either. 'cache' is the
+    SheetCache to use, if not the one from get_sheet_cache().
+    '''
+    if cache is _DEFAULT:
+        cache = get_sheet_cache()
+    if cache is not None:
+        info = cache.get_info(filename)
+        if info is not None:
+            return tuple(info)
+    info = _file_info(filename)
+    if cache is not None:
+        cache.put_info(filename, info)
+    return info
+
+def _file_info(filename):
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+    try:
+        workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+        try:
+            return EXCEL, list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    except (InvalidFileException, zipfile.BadZipFile, KeyError):
+        pass
+
+    import pandas as pd
+    try:
+        with pd.ExcelFile(filename) as excel_file:
+            return EXCEL, list(excel_file.sheet_names)
+    except ValueError as err1:
+        try:
+            pd.read_csv(filename, nrows=1)
+            return CSV, None
+        except ValueError as err2:
+            msg = f"Could not parse '{filename}' as Excel or CSV."
+            logger.error(msg)
+            logger.info(f"As Excel: {err1}")
+            logger.info(f"As CSV: {err2}")
+            raise
+
+def iter_batches(filename, sheet_name=None, *,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 file_type=None,
+                 cache=_DEFAULT):
+    '''Yield the rows of a sheet as DataFrames of up to 'batch_size' rows
+
+    'sheet_name' may be a name or an index, and is ignored for CSV files.
+    None means the first sheet. 'file_type' is EXCEL or CSV, if already
+    known. Rows are the same as pd.read_excel (or pd.read_csv) would give,
+    except that the types of the columns are worked out for each batch
+    separately (see above). Cells past the last column with a header are
+    left out.
+
+    If the sheet is in the cache (see file_info), the batches are sliced
+    from the cached copy. Otherwise, the sheet is stored in the cache once
+    all of it has been read, unless the cache can't store anything for this
+    file (e.g., it's too big), in which case each batch is let go as soon
+    as the caller is done with it.
+    '''
+    if cache is _DEFAULT:
+        cache = get_sheet_cache()
+    if file_type is None:
+        file_type, sheet_names = file_info(filename, cache=cache)
+    if sheet_name is None:
+        sheet_name = 0
+    if file_type == CSV:
+        sheet_name = 0
+
+    if cache is None or not cache.can_store(filename):
+        yield from _iter_batches(filename, sheet_name, batch_size, file_type)
+        return
+
+    options = {"file_type": file_type}
+    df = cache.get_sheet(filename, sheet_name, options)
+    if df is not None:
+        logger.debug(f"Using cached copy of sheet '{sheet_name}' of {filename}")
+        if len(df) == 0:
+            yield df
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start+batch_size]
+        return
+
+    batches = []
+    for batch in _iter_batches(filename, sheet_name, batch_size, file_type):
+        batches.append(batch)
+        yield batch
+
+    # (only if the caller read the whole sheet)
+    import pandas as pd
+    if len(batches) == 0:
+        df = pd.DataFrame()
+    elif len(batches) == 1:
+        df = batches[0]
+    else:
+        df = pd.concat(batches)
+    cache.put_sheet(filename, sheet_name, options, df)
+
+def _iter_batches(filename, sheet_name, batch_size, file_type):
+    if file_type == CSV:
+        import pandas as pd
+        with pd.read_csv(filename, chunksize=batch_size) as reader:
+            yield from reader
+    elif filename.lower().endswith((".xlsx", ".xlsm")):
+        yield from _iter_xlsx(filename, sheet_name, batch_size)
+    else:
+        import pandas as pd
+        df = pd.read_excel(filename, sheet_name=sheet_name)
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start+batch_size]
+
+def read_sheet(filename, sheet_name=None, *, file_type=None, cache=_DEFAULT):
+    '''Read a whole sheet into one DataFrame'''
+    import pandas as pd
+    batches = list(iter_batches(filename, sheet_name, file_type=file_type, cache=cache))
+    if len(batches) == 1:
+        return batches[0]
+    if len(batches) == 0:
+        return pd.DataFrame()
+    return pd.concat(batches)
+
+def _column_names(header):
+    # Name the columns the way pandas does: blank headers become
+    # "Unnamed: N", and repeats get ".1", ".2", ... added
+    names = []
+    seen = {}
+    for index, name in enumerate(header):
+        if name is None or name == "":
+            name = f"Unnamed: {index}"
+        if name in seen:
+            seen[name] += 1
+            new_name = f"{name}.{seen[name]}"
+            while new_name in seen:
+                seen[name] += 1
+                new_name = f"{name}.{seen[name]}"
+            seen[new_name] = 0
+            name = new_name
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _xlsx_cell(cell):
+    # Convert a cell the way pandas' openpyxl reader does, so that the
+    # batches have the same values pd.read_excel would give
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float("nan")
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+def _iter_xlsx(filename, sheet_name, batch_size):
+    import openpyxl
+    from pandas.io.parsers import TextParser
+
+    def make_batch(batch, start):
+        # (pd.read_excel uses TextParser too, to turn cells into columns)
+        with TextParser(batch, names=columns, header=None) as parser:
+            df = parser.read()
+        df.index = range(start, start + len(df))
+        return df
+
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try:
+        if isinstance(sheet_name, int):
+            sheet = workbook.worksheets[sheet_name]
+        else:
+            sheet = workbook[sheet_name]
+
+        rows = ([_xlsx_cell(cell) for cell in row] for row in sheet.iter_rows())
+        header = next(rows, None)
+        if header is None:
+            return
+        # Trailing empty header cells aren't columns
+        while len(header) > 0 and header[-1] == "":
+            header.pop()
+        columns = _column_names(header)
+        width = len(columns)
+
+        start = 0
+        batch = []
+        blank_rows = 0
+        for row in rows:
+            row = row[:width]
+            if all(value == "" for value in row):
+                # Empty rows are kept, as pd.read_excel keeps them, unless
+                # there's nothing after them
+                blank_rows += 1
+                continue
+            row += [""] * (width - len(row))
+            for row in [[""] * width] * blank_rows + [row]:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    yield make_batch(batch, start)
+                    start += len(batch)
+                    batch = []
+            blank_rows = 0
+        if len(batch) > 0 or start == 0:
+            yield make_batch(batch, start)
+    finally:
+        workbook.close()
+
+def map_files(func, jobs, *, max_workers=None, min_jobs=None):
+    '''Yield func(*job) for each job in 'jobs', in the same order
+
+    If there are at least 'min_jobs' jobs (default POOL_MIN_JOBS), they're
+    run in a pool of 'max_workers' processes (default: one per CPU).
+    Results are yielded as soon as they're ready and in order, and only
+    a few jobs per worker are started ahead of the one being yielded, so
+    the results don't pile up in memory. 'func' and its arguments and
+    results must be picklable, so 'func' should be a module-level function
+    and should return something compact (e.g., a tuple or a set) rather
+    than, say, a DataFrame.
+    '''
+    jobs = list(jobs)
+    if min_jobs is None:
+        min_jobs = POOL_MIN_JOBS
+    if max_workers is None:
+        max_workers = _cpu_count()
+    max_workers = min(max_workers, len(jobs))
+
+    if max_workers <= 1 or len(jobs) < min_jobs:
+        for job in jobs:
+            yield func(*job)
+        return
+
+    logger.debug(f"map_files: {len(jobs)} jobs in {max_workers} processes")
+    executor = ProcessPoolExecutor(max_workers)
+    try:
+        remaining = iter(jobs)
+        pending = deque()
+        for job in remaining:
+            pending.append(executor.submit(func, *job))
+            if len(pending) >= 2 * max_workers:
+                break
+        while len(pending) > 0:
+            result = pending.popleft().result()
+            job = next(remaining, None)
+            if job is not None:
+                pending.append(executor.submit(func, *job))
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _cpu_count():
+    # The CPUs this process may actually run on, where that's known
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
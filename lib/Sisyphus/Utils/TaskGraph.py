@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sisyphus/Utils/TaskGraph.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Runs a set of tasks on a thread pool, where a task may have to wait for
+other tasks to finish first. Used by the HWDBUploader to send as many
+requests at once as the dependencies between them allow:
+
+    graph = TaskGraph()
+    post = graph.add("post A", post_item, "A")
+    graph.add("enable A", enable_item, "A", depends_on=[post])
+    summary = graph.run(max_workers=10)
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_MAX_WORKERS = 10
+
+# Task states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+CANCELLED = "cancelled"
+
+class Task:
+    '''One node of a TaskGraph
+
+    After the graph has run, 'status' is DONE, FAILED, SKIPPED (because
+    something it depended on didn't succeed) or CANCELLED (because the
+    graph stopped early). 'result' or 'exception' hold the outcome.
+    '''
+    def __init__(self, name, fn, args, kwargs, depends_on, run_on_stop=False):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.run_on_stop = run_on_stop
+        self.depends_on = list(depends_on)
+        self.dependents = []
+        self.status = PENDING
+        self.result = None
+        self.exception = None
+        self.elapsed = None
+
+    def __repr__(self):
+        return f"<Task {self.name!r} {self.status}>"
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            return self.fn(*self.args, **self.kwargs)
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+class TaskGraph:
+    '''A directed acyclic graph of tasks'''
+
+    def __init__(self):
+        self.tasks = []
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def add(self, name, fn, *args, depends_on=(), run_on_stop=False, **kwargs):
+        '''Add a task that calls fn(*args, **kwargs)
+
+        The task won't start until every task in 'depends_on' is DONE.
+        None is allowed in 'depends_on' and ignored. With 'run_on_stop',
+        the task still runs after run() has stopped starting new tasks
+        because of a failure, e.g., to finish something that its
+        dependencies started. Returns the Task.
+        '''
+        task = Task(name, fn, args, kwargs, [t for t in depends_on if t is not None],
+                    run_on_stop)
+        for dependency in task.depends_on:
+            dependency.dependents.append(task)
+        self.tasks.append(task)
+        return task
+
+    def add_dependency(self, task, depends_on):
+        if depends_on is None or depends_on is task or depends_on in task.depends_on:
+            return
+        task.depends_on.append(depends_on)
+        depends_on.dependents.append(task)
+
+    def summary(self):
+        '''Count the tasks in each state'''
+        counts = {}
+        for task in self.tasks:
+            counts[task.status] = counts.get(task.status, 0) + 1
+        return counts
+
+    def failures(self):
+        return [task for task in self.tasks if task.status == FAILED]
+
+    def _skip_dependents(self, task):
+        stack = list(task.dependents)
+        while stack:
+            dependent = stack.pop()
+            if dependent.status == PENDING:
+                dependent.status = SKIPPED
+                logger.warning(f"<TaskGraph> skipping {dependent.name!r} because "
+                               f"{task.name!r} {task.status}")
+                stack.extend(dependent.dependents)
+
+    def run(self, max_workers=DEFAULT_MAX_WORKERS, *,
+            stop_on_error=True,
+            status_callback=None):
+        '''Run every task, at most 'max_workers' at a time
+
+        A task starts as soon as everything it depends on is done. If a
+        task raises an exception, everything that depends on it (directly
+        or not) is skipped. With 'stop_on_error', no new tasks are started
+        after the first failure, except those added with 'run_on_stop',
+        though the ones already running are allowed to finish.
+
+        'status_callback', if given, is called with the graph after each
+        task finishes.
+
+        Returns summary(). Raises ValueError if the graph has a cycle.
+        '''
+        self._check_acyclic()
+
+        remaining = {task: len(task.depends_on) for task in self.tasks}
+        ready = deque(task for task in self.tasks if remaining[task] == 0)
+        running = {}
+        stopping = False
+
+        with ThreadPoolExecutor(max_workers=max_workers,
+                                thread_name_prefix="TaskGraph") as executor:
+            while ready or running:
+                while ready and len(running) < max_workers:
+                    if stopping:
+                        ready = deque(task for task in ready if task.run_on_stop)
+                        if not ready:
+                            break
+                    task = ready.popleft()
+                    task.status = RUNNING
+                    running[executor.submit(task._run)] = task
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        task.result = future.result()
+                    except Exception as exc:
+                        task.status = FAILED
+                        task.exception = exc
+                        logger.error(f"<TaskGraph> {task.name!r} failed: {exc}")
+                        self._skip_dependents(task)
+                        if stop_on_error:
+                            stopping = True
+                    else:
+                        task.status = DONE
+                        for dependent in task.dependents:
+                            remaining[dependent] -= 1
+                            if remaining[dependent] == 0 and dependent.status == PENDING:
+                                ready.append(dependent)
+                    if status_callback is not None:
+                        status_callback(self)
+
+        for task in self.tasks:
+            if task.status == PENDING:
+                task.status = CANCELLED
+
+        return self.summary()
+
+    def _check_acyclic(self):
+        # Kahn's algorithm: if we can't remove every task by repeatedly
+        # taking ones with no remaining dependencies, there's a cycle.
+        remaining = {task: len(task.depends_on) for task in self.tasks}
+        ready = [task for task in self.tasks if remaining[task] == 0]
+        count = 0
+        while ready:
+            task = ready.pop()
+            count += 1
+            for dependent in task.dependents:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if count != len(self.tasks):
+            stuck = next(task for task in self.tasks if remaining[task] > 0)
+            raise ValueError(f"The task graph has a cycle involving {stuck.name!r}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__batches.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks that sheets read a batch at a time (Sisyphus.Utils.SheetReader)
+give the same rows as pandas, and the same plan in Docket
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket
+import Sisyphus.Utils.SheetReader as SheetReader
+import unittest
+import tempfile
+import os
+import pandas as pd
+
+PART_TYPE_ID = "Z00100300001"
+
+class Test__batches(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+        cls.tempdir = tempfile.TemporaryDirectory()
+
+        cls.df = pd.DataFrame({
+            "External ID": [""] * 25,
+            "Serial Number": [f"BT-{n:03d}" for n in range(25)],
+            "Widget ID": [f"BT-{n:03d}" for n in range(25)],
+            "Color": ["red", "green", "blue", None, "red"] * 5,
+            "Comment": [n * 1.5 for n in range(25)],
+        })
+        cls.csv_file = os.path.join(cls.tempdir.name, "widgets.csv")
+        cls.df.to_csv(cls.csv_file, index=False)
+        cls.xlsx_file = os.path.join(cls.tempdir.name, "widgets.xlsx")
+        with pd.ExcelWriter(cls.xlsx_file) as writer:
+            pd.DataFrame({"Note": ["nothing here"]}).to_excel(
+                        writer, sheet_name="Notes", index=False)
+            cls.df.to_excel(writer, sheet_name="Widgets", index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_file_info(self):
+        self.assertEqual(SheetReader.file_info(self.csv_file), (SheetReader.CSV, None))
+        self.assertEqual(SheetReader.file_info(self.xlsx_file),
+                            (SheetReader.EXCEL, ["Notes", "Widgets"]))
+
+    #-----------------------------------------------------------------------------
+
+    def test_same_as_pandas(self):
+        for filename, sheet_name, expected in [
+                    (self.csv_file, None, pd.read_csv(self.csv_file)),
+                    (self.xlsx_file, "Widgets", pd.read_excel(self.xlsx_file, "Widgets")),
+                    (self.xlsx_file, 0, pd.read_excel(self.xlsx_file, 0))]:
+            batches = list(SheetReader.iter_batches(filename, sheet_name, batch_size=10))
+            self.assertEqual([len(batch) for batch in batches],
+                    [10, 10, 5] if sheet_name != 0 else [1])
+            df = pd.concat(batches)
+            self.assertEqual(list(df.columns), list(expected.columns))
+            self.assertEqual(list(df.index), list(expected.index))
+            self.assertEqual(
+                    df.astype(object).where(df.notna(), None).values.tolist(),
+                    expected.astype(object).where(expected.notna(), None).values.tolist())
+
+    #-----------------------------------------------------------------------------
+
+    def test_blank_rows(self):
+        # empty rows in the middle are kept, so row numbers match pandas,
+        # and the ones at the end aren't
+        import openpyxl
+        filename = os.path.join(self.tempdir.name, "blank_rows.xlsx")
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Serial Number", "Count", "Size"])
+        for n in range(9):
+            sheet.append([f"BR-{n}", n, n + 0.5] if n % 4 != 1 else [None] * 3)
+        sheet.append([None] * 3)
+        workbook.save(filename)
+
+        expected = pd.read_excel(filename)
+        df = pd.concat(list(SheetReader.iter_batches(filename, batch_size=1000, cache=None)))
+        pd.testing.assert_frame_equal(df, expected, check_index_type=False)
+
+        batches = list(SheetReader.iter_batches(filename, batch_size=4, cache=None))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 1])
+        df = pd.concat(batches)
+        self.assertEqual(list(df.index), list(expected.index))
+        self.assertEqual(
+                df.astype(object).where(df.notna(), None).values.tolist(),
+                expected.astype(object).where(expected.notna(), None).values.tolist())
+        # (a batch without blank rows has its integers as integers)
+        self.assertEqual(str(batches[2]["Count"].dtype), "int64")
+
+    #-----------------------------------------------------------------------------
+
+    def test_docket(self):
+        def plan(filename, batch_size):
+            source = {
+                "Source Name": "Widgets",
+                "Files": filename,
+                "Data Type": "Item",
+                "Values": {
+                    "Type ID": PART_TYPE_ID,
+                    "Institution ID": 186,
+                    "Manufacturer ID": 7,
+                    "Comments": "from Test__batches",
+                },
+            }
+            if filename.endswith(".xlsx"):
+                source["Sheets"] = "Widgets"
+            docket = Docket({"Docket Name": self.id(), "Sources": [source]})
+            docket.batch_size = batch_size
+            docket.process_sources()
+            return docket.new_hwitems
+
+        expected = plan(self.csv_file, 1000)
+        self.assertEqual(len(expected), 25)
+        self.assertEqual(plan(self.csv_file, 7), expected)
+        self.assertEqual(plan(self.xlsx_file, 7), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__columns.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks the column-at-a-time helpers used by Docket._process_auto_item
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.HWDBUploader import Docket
+import unittest
+import numpy as np
+import pandas as pd
+
+class Test__columns(unittest.TestCase):
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_same_as_coalesce(self):
+        df = pd.DataFrame({
+            "Serial Number": ["A", None, "C"],
+            "Count": [1, 2, 3],
+            "Reading": [1.5, np.nan, 3.5],
+            "Flag": [True, False, True],
+        })
+        context = {"Institution ID": 186, "Count": 99}
+        names = ["Serial Number", "Count", "Reading", "Flag", "Institution ID", "Missing"]
+
+        columns = Docket.df_columns(df, names, context)
+        for row_index in range(len(df)):
+            df_coalesce = Docket.df_coalesce_generator(df, row_index, context)
+            for name in names:
+                self.assertEqual(columns[name][row_index], df_coalesce(name))
+                # (but as plain Python values)
+                self.assertNotIsInstance(columns[name][row_index], np.generic)
+
+    #-----------------------------------------------------------------------------
+
+    def test_enabled(self):
+        self.assertEqual(
+            Docket._parse_enabled([None, "", 0, 1, "Yes", "no", "TRUE", True, False]),
+            [True, False, False, True, True, False, True, True, False])
+        with self.assertRaises(ValueError):
+            Docket._parse_enabled(["maybe"])
+
+    #-----------------------------------------------------------------------------
+
+    def test_subcomponents(self):
+        self.assertEqual(
+            Docket._parse_subcomponents(
+                ["D00501300001-00042", "SN-1", "", None, 17], "D00501300001"),
+            ["D00501300001-00042", "D00501300001:SN-1", None, None, "D00501300001:17"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__ledger.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks that Docket skips rows that haven't changed since they were last
+sent, according to its Ledger
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket, Ledger
+from Sisyphus.Utils.TaskGraph import DONE
+import unittest
+import tempfile
+import os
+import csv
+
+PART_TYPE_ID = "Z00100300001"
+
+class Test__ledger(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ledger_file = os.path.join(self.tempdir.name, "ledger.jsonl")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def add_item(self, serial_number):
+        return self.server.store.add_hwitem(PART_TYPE_ID, {
+            "institution": {"id": 186},
+            "country_code": "US",
+            "manufacturer": {"id": 7},
+            "serial_number": serial_number,
+            "comments": "from Test__ledger",
+            "specifications": {"Widget ID": serial_number, "Color": "red", "Comment": ""},
+        })["part_id"]
+
+    def make_docket(self, rows, ledger_verify=0.0):
+        filename = os.path.join(self.tempdir.name, "widgets.csv")
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["External ID", "Serial Number", "Widget ID", "Color", "Comment"])
+            writer.writerows(rows)
+        docket = Docket({
+            "Docket Name": self.id(),
+            "Sources": [
+                {
+                    "Source Name": "Widgets",
+                    "Files": filename,
+                    "Data Type": "Item",
+                    "Values": {
+                        "Type ID": PART_TYPE_ID,
+                        "Institution ID": 186,
+                        "Manufacturer ID": 7,
+                        "Comments": "from Test__ledger",
+                    },
+                },
+            ],
+        })
+        docket.ledger = Ledger(self.ledger_file)
+        docket.ledger_verify = ledger_verify
+        docket.process_sources()
+        return docket
+
+    def item_requests(self):
+        return [path for method, path in self.server.request_log
+                    if PART_TYPE_ID + "-" in path or "serial_number" in path]
+
+    def make_rows(self, prefix, count):
+        rows = []
+        for n in range(count):
+            rows.append(["", f"{prefix}-NEW-{n}", f"{prefix}-NEW-{n}", "blue", ""])
+            part_id = self.add_item(f"{prefix}-OLD-{n}")
+            rows.append([part_id, f"{prefix}-OLD-{n}", f"{prefix}-OLD-{n}", "green", ""])
+        return rows
+
+    #-----------------------------------------------------------------------------
+
+    def test_skip_unchanged(self):
+        count = 4
+        rows = self.make_rows("LS", count)
+        docket = self.make_docket(rows)
+        self.assertEqual(docket.ledger_stats["skipped"], 0)
+        summary = docket.update_hwdb()
+        self.assertEqual(summary.get(DONE), sum(summary.values()))
+        self.assertEqual(len(Ledger(self.ledger_file)), 2 * count)
+
+        # nothing has changed, so nothing is looked up
+        self.server.reset_log()
+        docket = self.make_docket(rows)
+        self.assertEqual(self.item_requests(), [])
+        self.assertEqual(docket.ledger_stats["skipped"], 2 * count)
+        self.assertEqual(docket.new_hwitems, [])
+        self.assertEqual(docket.update_hwitems, [])
+
+        # only the row that changed is looked up and sent
+        rows[1][3] = "orange"
+        docket = self.make_docket(rows)
+        self.assertEqual(docket.ledger_stats["skipped"], 2 * count - 1)
+        self.assertEqual([op_node["kwargs"]["part_id"] for op_node in docket.update_hwitems
+                            if op_node["operation"] == "patch_hwitem"], [rows[1][0]])
+        docket.update_hwdb()
+        self.assertEqual(self.make_docket(rows).ledger_stats["skipped"], 2 * count)
+
+    #-----------------------------------------------------------------------------
+
+    def test_failed_request(self):
+        # an item isn't recorded unless all of its requests succeed
+        rows = self.make_rows("LF", 2)
+        docket = self.make_docket(rows)
+        docket.terminate_on_error = False
+        docket.update_hwitems[0]["kwargs"]["data"]["manufacturer"] = {"id": -1}
+        docket.update_hwdb()
+        self.assertEqual(len(Ledger(self.ledger_file)), 3)
+        self.assertEqual(self.make_docket(rows).ledger_stats["skipped"], 3)
+
+    #-----------------------------------------------------------------------------
+
+    def test_verify(self):
+        rows = self.make_rows("LV", 3)
+        self.make_docket(rows).update_hwdb()
+
+        # someone changes an item behind our back
+        part_id = rows[3][0]
+        self.server.store.get_hwitem(part_id)["specifications"][0]["Color"] = "purple"
+        self.assertEqual(self.make_docket(rows).ledger_stats["skipped"], 6)
+
+        docket = self.make_docket(rows, ledger_verify=1.0)
+        self.assertEqual(docket.ledger_stats,
+                         {"skipped": 0, "verified": 6, "mismatched": 1})
+        self.assertEqual([op_node["kwargs"]["part_id"] for op_node in docket.update_hwitems
+                            if op_node["operation"] == "patch_hwitem"], [part_id])
+
+        # and until it's fixed, the row isn't skipped
+        self.assertEqual(self.make_docket(rows).ledger_stats["skipped"], 5)
+
+    #-----------------------------------------------------------------------------
+
+    def test_repeated_rows(self):
+        # an item in more than one row is never skipped, so the HWDB always
+        # ends up with its last row
+        by_id = self.add_item("LR-ID")
+        by_sn = self.add_item("LR-SN")
+        single = self.add_item("LR-ONE")
+        rows = [
+            [by_id, "LR-ID", "LR-ID", "green", ""],
+            ["", "LR-SN", "LR-SN", "green", ""],
+            [single, "LR-ONE", "LR-ONE", "green", ""],
+            [by_id, "LR-ID", "LR-ID", "orange", ""],
+            ["", "LR-SN", "LR-SN", "orange", ""],
+        ]
+        color = lambda part_id: self.server.store.get_hwitem(part_id)["specifications"][0]["Color"]
+
+        for run in range(3):
+            docket = self.make_docket(rows)
+            self.assertEqual(docket.ledger_stats["skipped"], 0 if run == 0 else 1)
+            docket.update_hwdb()
+            self.assertEqual([color(by_id), color(by_sn), color(single)],
+                             ["orange", "orange", "green"])
+
+if __name__ == "__main__":
+    unittest.main()
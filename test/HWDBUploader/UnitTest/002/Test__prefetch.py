@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__prefetch.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks that Docket.process_sources gets everything from the HWDB before
+making the plan
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket
+import unittest
+import tempfile
+import os
+import csv
+
+PART_TYPE_ID = "Z00100300001"
+
+class Test__prefetch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+        cls.tempdir = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.server.latency = 0.0
+
+    def add_item(self, serial_number):
+        return self.server.store.add_hwitem(PART_TYPE_ID, {
+            "institution": {"id": 186},
+            "country_code": "US",
+            "manufacturer": {"id": 7},
+            "serial_number": serial_number,
+            "comments": "from Test__prefetch",
+            "specifications": {"Widget ID": serial_number, "Color": "red", "Comment": ""},
+        })["part_id"]
+
+    def make_docket(self, rows):
+        filename = os.path.join(self.tempdir.name, f"{self.id()}.csv")
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["External ID", "Serial Number", "Widget ID", "Color", "Comment"])
+            writer.writerows(rows)
+        return Docket({
+            "Docket Name": self.id(),
+            "Sources": [
+                {
+                    "Source Name": "Widgets",
+                    "Files": filename,
+                    "Data Type": "Item",
+                    "Values": {
+                        "Type ID": PART_TYPE_ID,
+                        "Institution ID": 186,
+                        "Manufacturer ID": 7,
+                        "Comments": "from Test__prefetch",
+                    },
+                },
+            ],
+        })
+
+    #-----------------------------------------------------------------------------
+
+    def test_prefetch(self):
+        count = 8
+        rows = []
+        for n in range(count):
+            # new items, existing items by serial number, and by external ID
+            rows.append(["", f"PF-NEW-{n}", f"PF-NEW-{n}", "blue", ""])
+            self.add_item(f"PF-OLD-{n}")
+            rows.append(["", f"PF-OLD-{n}", f"PF-OLD-{n}", "green", ""])
+            part_id = self.add_item(f"PF-PID-{n}")
+            rows.append([part_id, f"PF-PID-{n}", f"PF-PID-{n}", "green", ""])
+        docket = self.make_docket(rows)
+
+        self.server.reset_log()
+        scan = docket._scan_sources()
+        self.assertEqual(self.server.request_log, [])
+        self.assertEqual(len(scan["part_ids"]), count)
+        self.assertEqual(len(scan["sheets"][0][2]), 2 * count)
+
+        docket._prefetch(scan)
+        self.assertGreater(len(self.server.request_log), 4 * count)
+
+        # making the plan doesn't need the server at all
+        self.server.reset_log()
+        docket._plan_sources()
+        self.assertEqual(self.server.request_log, [])
+
+        self.assertEqual(len(docket.new_hwitems), count)
+        patches = [op_node for op_node in docket.update_hwitems
+                        if op_node["operation"] == "patch_hwitem"]
+        self.assertEqual(len(patches), 2 * count)
+
+    #-----------------------------------------------------------------------------
+
+    def test_process_sources(self):
+        part_id = self.add_item("PS-OLD")
+        docket = self.make_docket([
+            ["", "PS-NEW", "PS-NEW", "blue", ""],
+            [part_id, "PS-OLD", "PS-OLD", "red", ""],
+        ])
+        docket.process_sources()
+        self.assertEqual(len(docket.new_hwitems), 1)
+        self.assertEqual(docket.new_hwitems[0]["kwargs"]["data"]["serial_number"], "PS-NEW")
+        self.assertEqual(
+            [op_node["operation"] for op_node in docket.update_hwitems], ["no action"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__processes.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks that source files read by a pool of processes (SheetReader.map_files)
+come back in order, and give Docket the same plan as reading them here
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket
+import Sisyphus.Utils.SheetReader as SheetReader
+import unittest
+import tempfile
+import os
+import csv
+
+PART_TYPE_ID = "Z00100300001"
+FILE_COUNT = 6
+
+class Test__processes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+        cls.tempdir = tempfile.TemporaryDirectory()
+
+        # several files, with a different number of rows in each
+        for file_index in range(FILE_COUNT):
+            filename = os.path.join(cls.tempdir.name, f"widgets-{file_index}.csv")
+            with open(filename, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["External ID", "Serial Number", "Widget ID", "Color", "Comment"])
+                for n in range(file_index + 1):
+                    sn = f"MP-{file_index}-{n}"
+                    writer.writerow(["", sn, sn, "red", ""])
+        cls.pattern = os.path.join(cls.tempdir.name, "widgets-*.csv")
+        cls.filenames = [os.path.join(cls.tempdir.name, f"widgets-{file_index}.csv")
+                            for file_index in range(FILE_COUNT)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_map_files(self):
+        jobs = [(filename,) for filename in self.filenames]
+        expected = [list(SheetReader.read_sheet(*job)["Serial Number"]) for job in jobs]
+
+        results = SheetReader.map_files(SheetReader.read_sheet, jobs,
+                                        max_workers=2, min_jobs=1)
+        self.assertEqual([list(df["Serial Number"]) for df in results], expected)
+
+        # errors come back to the caller
+        with self.assertRaises(Exception):
+            list(SheetReader.map_files(SheetReader.file_info,
+                    [(filename,) for filename in self.filenames] + [("no-such-file",)],
+                    max_workers=2, min_jobs=1))
+
+    #-----------------------------------------------------------------------------
+
+    def test_docket(self):
+        def plan(max_processes):
+            docket = Docket({
+                "Docket Name": self.id(),
+                "Sources": [
+                    {
+                        "Source Name": "Widgets",
+                        "Files": self.pattern,
+                        "Data Type": "Item",
+                        "Values": {
+                            "Type ID": PART_TYPE_ID,
+                            "Institution ID": 186,
+                            "Manufacturer ID": 7,
+                            "Comments": "from Test__processes",
+                        },
+                    },
+                ],
+            })
+            docket.max_processes = max_processes
+            scan = docket._scan_sources()
+            docket._prefetch(scan)
+            docket._plan_sources()
+            return scan, docket.new_hwitems
+
+        min_jobs, SheetReader.POOL_MIN_JOBS = SheetReader.POOL_MIN_JOBS, 1
+        try:
+            scan, new_hwitems = plan(2)
+        finally:
+            SheetReader.POOL_MIN_JOBS = min_jobs
+        self.assertEqual((scan, new_hwitems), plan(1))
+
+        # files are taken in order, however the glob lists them
+        self.assertEqual([sheet[2] for sheet in scan["sheets"]],
+                [{f"MP-{file_index}-{n}" for n in range(file_index + 1)}
+                    for file_index in range(FILE_COUNT)])
+        self.assertEqual(len(new_hwitems), FILE_COUNT * (FILE_COUNT + 1) // 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__sheet_cache.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Checks that sheets read a second time come from the SheetCache instead of
+being parsed again
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket
+import Sisyphus.Utils.SheetReader as SheetReader
+from Sisyphus.Utils.SheetCache import SheetCache
+import unittest
+from unittest import mock
+import tempfile
+import weakref
+import gc
+import os
+import openpyxl
+import pandas as pd
+
+PART_TYPE_ID = "Z00100300001"
+
+class Test__sheet_cache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = SheetCache(os.path.join(self.tempdir.name, "cache"))
+        self.old_cache = SheetReader.get_sheet_cache()
+        SheetReader.set_sheet_cache(self.cache)
+
+        self.xlsx_file = os.path.join(self.tempdir.name, "widgets.xlsx")
+        self.write_xlsx(["SC-000", "SC-001", "SC-002"])
+
+    def tearDown(self):
+        SheetReader.set_sheet_cache(self.old_cache)
+        self.tempdir.cleanup()
+
+    def write_xlsx(self, serial_numbers):
+        df = pd.DataFrame({
+            "External ID": [""] * len(serial_numbers),
+            "Serial Number": serial_numbers,
+            "Widget ID": serial_numbers,
+            # numbers and strings in the same column
+            "Color": ["red", 3, "blue"][:len(serial_numbers)],
+            "Comment": [1.5] * len(serial_numbers),
+        })
+        df.to_excel(self.xlsx_file, sheet_name="Widgets", index=False)
+
+    def count_parses(self):
+        return mock.patch("openpyxl.load_workbook", side_effect=openpyxl.load_workbook)
+
+    def read(self):
+        # (empty cells are NaN, which never equals itself, so they're
+        # compared as None)
+        df = SheetReader.read_sheet(self.xlsx_file, "Widgets")
+        return (SheetReader.file_info(self.xlsx_file),
+                df.astype(object).where(df.notna(), None).values.tolist())
+
+    #-----------------------------------------------------------------------------
+
+    def test_second_read(self):
+        with self.count_parses() as load_workbook:
+            first = self.read()
+        self.assertGreater(load_workbook.call_count, 0)
+
+        with self.count_parses() as load_workbook:
+            second = self.read()
+        self.assertEqual(load_workbook.call_count, 0)
+        self.assertEqual(second, first)
+        self.assertEqual(first[1][1][1:], ["SC-001", "SC-001", 3, 1.5])
+
+        # batches are still the right size
+        self.assertEqual([len(df) for df in SheetReader.iter_batches(
+                                self.xlsx_file, "Widgets", batch_size=2)], [2, 1])
+
+    #-----------------------------------------------------------------------------
+
+    def test_changed_file(self):
+        self.read()
+        self.write_xlsx(["SC-100", "SC-101"])
+        with self.count_parses() as load_workbook:
+            file_info, rows = self.read()
+        self.assertGreater(load_workbook.call_count, 0)
+        self.assertEqual([row[1] for row in rows], ["SC-100", "SC-101"])
+
+    #-----------------------------------------------------------------------------
+
+    def test_partial_read(self):
+        # a sheet that wasn't read all the way through isn't stored
+        batches = SheetReader.iter_batches(self.xlsx_file, "Widgets", batch_size=1)
+        next(batches)
+        batches.close()
+        self.assertIsNone(self.cache.get_sheet(self.xlsx_file, "Widgets",
+                                               {"file_type": SheetReader.EXCEL}))
+
+    #-----------------------------------------------------------------------------
+
+    def test_too_big(self):
+        # batches of a file that can't be cached aren't kept for the cache
+        csv_file = os.path.join(self.tempdir.name, "big.csv")
+        pd.DataFrame({"Serial Number": [f"BIG-{n:04d}" for n in range(200)]}).to_csv(
+                csv_file, index=False)
+        with mock.patch("Sisyphus.Utils.SheetCache.MAX_FILE_BYTES", 100):
+            refs = []
+            for batch in SheetReader.iter_batches(csv_file, batch_size=10):
+                refs.append(weakref.ref(batch))
+                del batch
+                gc.collect()
+                self.assertEqual(sum(ref() is not None for ref in refs), 0)
+            self.assertEqual(len(refs), 20)
+            self.assertIsNone(self.cache.get_sheet(csv_file, 0,
+                                                   {"file_type": SheetReader.CSV}))
+
+    #-----------------------------------------------------------------------------
+
+    def test_refresh(self):
+        self.read()
+        SheetReader.set_sheet_cache(SheetCache(self.cache.root, refresh=True))
+        with self.count_parses() as load_workbook:
+            self.read()
+        self.assertGreater(load_workbook.call_count, 0)
+
+    #-----------------------------------------------------------------------------
+
+    def test_docket(self):
+        def plan():
+            docket = Docket({
+                "Docket Name": self.id(),
+                "Sources": [
+                    {
+                        "Source Name": "Widgets",
+                        "Files": self.xlsx_file,
+                        "Sheets": "Widgets",
+                        "Data Type": "Item",
+                        "Values": {
+                            "Type ID": PART_TYPE_ID,
+                            "Institution ID": 186,
+                            "Manufacturer ID": 7,
+                            "Comments": "from Test__sheet_cache",
+                        },
+                    },
+                ],
+            })
+            docket.process_sources()
+            return docket.new_hwitems
+
+        first = plan()
+        with self.count_parses() as load_workbook:
+            self.assertEqual(plan(), first)
+        self.assertEqual(load_workbook.call_count, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__task_graph.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus.Utils.TaskGraph import TaskGraph, DONE, FAILED, SKIPPED, CANCELLED
+import unittest
+import threading
+import time
+
+class Test__task_graph(unittest.TestCase):
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_order(self):
+        graph = TaskGraph()
+        finished = []
+        lock = threading.Lock()
+
+        def work(name):
+            time.sleep(0.01)
+            with lock:
+                finished.append(name)
+            return name
+
+        posts = [graph.add(f"post {n}", work, f"post {n}") for n in range(5)]
+        enables = [graph.add(f"enable {n}", work, f"enable {n}", depends_on=[post])
+                        for n, post in enumerate(posts)]
+        attach = graph.add("attach", work, "attach", depends_on=posts + enables)
+
+        summary = graph.run(max_workers=4)
+        self.assertEqual(summary, {DONE: 11})
+        self.assertEqual(finished[-1], "attach")
+        for n in range(5):
+            self.assertLess(finished.index(f"post {n}"), finished.index(f"enable {n}"))
+        self.assertEqual(posts[3].result, "post 3")
+
+    #-----------------------------------------------------------------------------
+
+    def test_concurrency(self):
+        graph = TaskGraph()
+        for n in range(8):
+            graph.add(f"sleep {n}", time.sleep, 0.1)
+        start = time.perf_counter()
+        graph.run(max_workers=8)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    #-----------------------------------------------------------------------------
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("nope")
+
+        graph = TaskGraph()
+        bad = graph.add("bad", fail)
+        child = graph.add("child", lambda: None, depends_on=[bad])
+        grandchild = graph.add("grandchild", lambda: None, depends_on=[child])
+        other = graph.add("other", lambda: None)
+
+        graph.run(max_workers=1, stop_on_error=False)
+        self.assertEqual(bad.status, FAILED)
+        self.assertIsInstance(bad.exception, RuntimeError)
+        self.assertEqual(child.status, SKIPPED)
+        self.assertEqual(grandchild.status, SKIPPED)
+        self.assertEqual(other.status, DONE)
+
+        # stopping on the first error leaves the rest undone
+        graph = TaskGraph()
+        graph.add("bad", fail)
+        later = [graph.add(f"later {n}", lambda: None) for n in range(3)]
+        graph.run(max_workers=1)
+        self.assertEqual([task.status for task in later], [CANCELLED] * 3)
+
+        # ... except for tasks that have to finish what another one started
+        graph = TaskGraph()
+        started = graph.add("started", lambda: time.sleep(0.02))
+        graph.add("bad", fail)
+        finish = graph.add("finish", lambda: None, depends_on=[started], run_on_stop=True)
+        later = graph.add("later", lambda: None, depends_on=[started])
+        graph.run(max_workers=2)
+        self.assertEqual((finish.status, later.status), (DONE, CANCELLED))
+
+    #-----------------------------------------------------------------------------
+
+    def test_cycle(self):
+        graph = TaskGraph()
+        a = graph.add("a", lambda: None)
+        b = graph.add("b", lambda: None, depends_on=[a])
+        graph.add_dependency(a, b)
+        with self.assertRaises(ValueError):
+            graph.run()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/HWDBUploader/UnitTest/002/Test__update_hwdb.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author:
+    Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Runs Docket.update_hwdb against the local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+from Sisyphus import RestApiV1 as ra
+import Sisyphus.RestApiV1.Utilities as ut
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.HWDBUploader import Docket
+from Sisyphus.Utils.TaskGraph import DONE, FAILED, SKIPPED
+from Sisyphus.Utils.ChunkSize import AdaptiveChunkSize
+from Sisyphus.Utils.Concurrency import AdaptiveLimit, get_shared_limit, set_shared_limit
+import unittest
+from unittest import mock
+import time
+import datetime
+
+PLANE_TYPE = "D00501300001"
+ASSEMBLY_TYPE = "D00501341001"
+
+def new_data(part_type_id, serial_number, subcomponents=None, manufacturer=7):
+    return {
+        "part_type_id": part_type_id,
+        "institution": 186,
+        "country_code": "US",
+        "manufacturer": manufacturer,
+        "serial_number": serial_number,
+        "specifications": {"Drawing Number": serial_number},
+        "comments": "",
+        "enabled": True,
+        "subcomponents": subcomponents or {},
+    }
+
+class Test__update_hwdb(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.server.latency = 0.0
+        # don't let the requests in other tests decide how many run at once
+        self.saved_limit = get_shared_limit()
+        set_shared_limit(AdaptiveLimit())
+
+    def tearDown(self):
+        set_shared_limit(self.saved_limit)
+
+    def make_docket(self, prefix, count):
+        docket = Docket({"Docket Name": self.id()})
+        for n in range(count):
+            docket._generate_hwitem_requests(None, new_data(PLANE_TYPE, f"{prefix}-P{n}"))
+            docket._generate_hwitem_requests(None, new_data(ASSEMBLY_TYPE, f"{prefix}-A{n}",
+                    {"CPA Plane PID": f"{PLANE_TYPE}:{prefix}-P{n}",
+                     "FC Top SS PID": None,
+                     "FC Top NJ PID": None}))
+        return docket
+
+    #-----------------------------------------------------------------------------
+
+    def test_new_assemblies(self):
+        count = 6
+        docket = self.make_docket("DAG", count)
+        docket.bulk_threshold = None
+
+        # post, enable, and attach for each assembly; post and enable for each plane
+        self.server.latency = 0.05
+        self.server.reset_log()
+        summary = docket.update_hwdb(max_workers=8)
+        self.assertEqual(summary, {DONE: 5 * count})
+        # the posts for different items went to the server together
+        self.assertGreaterEqual(self.server.max_in_flight, count)
+
+        for op_node in docket.attach_subcomponents:
+            part_id = op_node["kwargs"]["part_id"]
+            plane_id = op_node["kwargs"]["subcomponents"]["CPA Plane PID"]
+            self.assertTrue(part_id.startswith(ASSEMBLY_TYPE))
+            self.assertTrue(plane_id.startswith(PLANE_TYPE))
+
+            resp = ra.get_subcomponents(part_id)
+            self.assertEqual([node["part_id"] for node in resp["data"]], [plane_id])
+            self.assertTrue(ra.get_hwitem(part_id)["data"]["enabled"])
+
+    #-----------------------------------------------------------------------------
+
+    def test_bulk_add(self):
+        count = 7
+        docket = self.make_docket("BULK", count)
+        docket.bulk_chunk_size = AdaptiveChunkSize(2, maximum=4)
+        self.server.reset_log()
+
+        # one bulk-add task per type, then the same as before
+        summary = docket.update_hwdb(max_workers=8)
+        self.assertEqual(summary, {DONE: 5 * count + 2})
+
+        # the requests were split into chunks that grew as the server kept up,
+        # e.g., 2 + 4 + 1 for each type, or 4 + 3 if the other type's first
+        # chunk already raised the size
+        bulk_adds = [path for method, path in self.server.request_log
+                        if method == "POST" and path.endswith("/bulk-add")]
+        self.assertTrue(4 <= len(bulk_adds) <= 6)
+        self.assertEqual(docket.bulk_chunk_size.size, 4)
+
+        for op_node in docket.attach_subcomponents:
+            part_id = op_node["kwargs"]["part_id"]
+            plane_id = op_node["kwargs"]["subcomponents"]["CPA Plane PID"]
+            plane = ra.get_hwitem(plane_id)["data"]
+            self.assertEqual(plane["specifications"][0]["Drawing Number"],
+                             plane["serial_number"])
+            self.assertTrue(plane["serial_number"].startswith("BULK-P"))
+            resp = ra.get_subcomponents(part_id)
+            self.assertEqual([node["part_id"] for node in resp["data"]], [plane_id])
+
+    #-----------------------------------------------------------------------------
+
+    def test_bulk_add_orphans(self):
+        count = 4
+        docket = self.make_docket("ORPH", count)
+
+        # one bulk-added item can't be given its serial number, which stops
+        # the run
+        patch_hwitem = ra.patch_hwitem
+        def failing_patch(part_id, data, **kwargs):
+            if data.get("serial_number", None) == "ORPH-A1":
+                return {"status": "ERROR", "data": "nope"}
+            return patch_hwitem(part_id, data, **kwargs)
+
+        with mock.patch.object(ra, "patch_hwitem", failing_patch):
+            with self.assertRaises(RuntimeError):
+                docket.update_hwdb(max_workers=1)
+
+        status = {task.name: task.status for task in docket.task_graph.tasks}
+        self.assertEqual(status[f"set up {ASSEMBLY_TYPE}:ORPH-A1"], FAILED)
+        # the others were still set up, even though the run had stopped
+        self.assertEqual([status[f"set up {ASSEMBLY_TYPE}:ORPH-A{n}"] for n in (0, 2, 3)],
+                         [DONE] * 3)
+        self.assertEqual([alt_id for part_id, alt_id in docket.orphaned_hwitems],
+                         [f"{ASSEMBLY_TYPE}:ORPH-A1"])
+        part_id = docket.orphaned_hwitems[0][0]
+        self.assertIsNone(ra.get_hwitem(part_id)["data"]["serial_number"])
+
+    #-----------------------------------------------------------------------------
+
+    def test_bulk_add_invalid_specs(self):
+        spec_def = {"Drawing Number": None}
+        self.assertEqual(ut.check_specifications({"Drawing Number": "x"}, spec_def), [])
+        for value in (float("nan"), datetime.date(2024, 1, 2)):
+            self.assertEqual(len(ut.check_specifications({"Drawing Number": value}, spec_def)), 1)
+
+        count = 4
+        docket = self.make_docket("BADSPEC", count)
+        docket.terminate_on_error = False
+        # the HWDB would refuse this one's specifications
+        bad = docket.new_hwitems[2]
+        self.assertEqual(bad["kwargs"]["data"]["serial_number"], "BADSPEC-P1")
+        bad["kwargs"]["data"]["specifications"]["Wrong Field"] = 1
+        unnamed = lambda: sum(1 for item in self.server.store.components.values()
+                                if item["serial_number"] is None)
+        before = unnamed()
+        self.server.reset_log()
+
+        docket.update_hwdb(max_workers=4)
+
+        # it was posted by itself and refused, so nothing was left without
+        # a serial number
+        status = {task.name: task.status for task in docket.task_graph.tasks}
+        self.assertEqual(status[f"post {PLANE_TYPE}:BADSPEC-P1"], FAILED)
+        self.assertEqual(docket.orphaned_hwitems, [])
+        bulk_adds = [path for method, path in self.server.request_log
+                        if method == "POST" and path.endswith("/bulk-add")]
+        self.assertEqual(len(bulk_adds), 2)
+        for n in (0, 2, 3):
+            self.assertEqual(status[f"set up {PLANE_TYPE}:BADSPEC-P{n}"], DONE)
+        self.assertEqual(unnamed(), before)
+
+    #-----------------------------------------------------------------------------
+
+    def test_chunk_size(self):
+        chunk_size = AdaptiveChunkSize(10, maximum=100, target=1.0)
+        # fast responses grow it, but no more than double each time
+        chunk_size.record(10, 0.1)
+        self.assertEqual(chunk_size.size, 20)
+        # a slow response shrinks it, but no more than half
+        chunk_size.record(20, 20.0)
+        self.assertEqual(chunk_size.size, 10)
+        chunk_size.failed()
+        self.assertEqual(chunk_size.size, 5)
+        self.assertEqual(sum(chunk_size.chunks(12)), 12)
+
+    #-----------------------------------------------------------------------------
+
+    def test_resolve_serial_number(self):
+        count = 5000
+        docket = self.make_docket("IDX", count)
+
+        # each resolution only touches the places that use that ID, so this
+        # stays fast as the plan grows
+        start = time.perf_counter()
+        for n in range(count):
+            docket._resolve_serial_number(f"{PLANE_TYPE}:IDX-P{n}", f"{PLANE_TYPE}-{n:05d}")
+            docket._resolve_serial_number(f"{ASSEMBLY_TYPE}:IDX-A{n}", f"{ASSEMBLY_TYPE}-{n:05d}")
+        self.assertLess(time.perf_counter() - start, 2.0)
+
+        for n, op_node in enumerate(docket.attach_subcomponents):
+            self.assertEqual(op_node["kwargs"]["part_id"], f"{ASSEMBLY_TYPE}-{n:05d}")
+            self.assertEqual(op_node["kwargs"]["subcomponents"]["CPA Plane PID"],
+                             f"{PLANE_TYPE}-{n:05d}")
+        self.assertEqual(docket.enable_hwitems[0]["kwargs"]["part_id"], f"{PLANE_TYPE}-00000")
+        self.assertEqual(docket._references, {})
+
+    #-----------------------------------------------------------------------------
+
+    def test_failure(self):
+        docket = self.make_docket("FAIL", 2)
+        # an invalid manufacturer makes the first plane's post fail
+        docket.new_hwitems[0]["kwargs"]["data"]["manufacturer"] = {"id": 99999}
+        docket.terminate_on_error = False
+
+        docket.update_hwdb(max_workers=4)
+        status = {task.name: task.status for task in docket.task_graph.tasks}
+        self.assertEqual(status[f"enable {PLANE_TYPE}:FAIL-P0"], SKIPPED)
+        self.assertEqual(status[f"attach subcomponents {ASSEMBLY_TYPE}:FAIL-A0"], SKIPPED)
+        self.assertEqual(status[f"post {PLANE_TYPE}:FAIL-P1"], DONE)
+        self.assertEqual(
+            [task.status for task in docket.task_graph.tasks if "FAIL-A1" in task.name
+                or "FAIL-P1" in task.name],
+            [DONE] * 5)
+
+        docket = self.make_docket("FAIL2", 1)
+        docket.new_hwitems[0]["kwargs"]["data"]["manufacturer"] = {"id": 99999}
+        with self.assertRaises(RuntimeError):
+            docket.update_hwdb()
+
+if __name__ == "__main__":
+    unittest.main()
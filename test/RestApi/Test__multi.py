@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApi/Test__multi.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApi.Multi.ItemList, against a fake component list
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+from unittest import mock
+import threading
+import time
+
+from Sisyphus import RestApi as ra
+from Sisyphus.RestApi.Multi import ItemList
+
+TYPE_ID = "Z00100100007"
+
+class FakeApi:
+    '''Stands in for ra.get_components and ra.get_component'''
+    def __init__(self, pages=4, page_size=25, latency=0.002, fail=(), listed_serials=False):
+        self.pages = pages
+        self.listed_serials = listed_serials
+        self.page_size = page_size
+        self.latency = latency
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.item_calls = []
+
+    def part_ids(self, page):
+        count = self.page_size if page < self.pages else self.page_size // 2
+        return [f"{TYPE_ID}-{page:02d}{n:03d}" for n in range(count)]
+
+    def get_components(self, type_id, page=None, **kwargs):
+        time.sleep(self.latency)
+        rows = [{"part_id": part_id} for part_id in self.part_ids(page)]
+        if self.listed_serials:
+            for row in rows:
+                row["serial_number"] = f"SN-{row['part_id']}"
+        return {"status": "OK", "pagination": {"pages": self.pages}, "data": rows}
+
+    def get_component(self, part_id, **kwargs):
+        with self.lock:
+            self.item_calls.append(part_id)
+        time.sleep(self.latency)
+        if part_id in self.fail:
+            return {"status": "ERROR", "data": "Not Found"}
+        return {"status": "OK", "data": {"part_id": part_id, "serial_number": f"SN-{part_id}"}}
+
+    def patch(self):
+        return mock.patch.multiple(ra, get_components=self.get_components,
+                                   get_component=self.get_component)
+
+    @property
+    def all_part_ids(self):
+        return [part_id for page in range(1, self.pages + 1) for part_id in self.part_ids(page)]
+
+class Test__multi(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_all_items(self):
+        api = FakeApi()
+        calls = []
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=5,
+                                 status_callback=lambda L: calls.append(len(L.results)))
+        self.assertEqual(sorted(item["part_id"] for item in item_list.results),
+                         sorted(api.all_part_ids))
+        self.assertEqual(item_list.num_items, len(api.all_part_ids))
+        self.assertEqual(len(calls), len(api.all_part_ids))
+        self.assertEqual(max(calls), len(api.all_part_ids))
+        self.assertEqual((item_list.fail_retry, item_list.fail_abandon), (0, 0))
+
+    #-----------------------------------------------------------------------------
+
+    def test_serial_numbers(self):
+        # the crawl stops once everything it's looking for has been found
+        api = FakeApi(pages=10)
+        wanted = [f"SN-{part_id}" for part_id in api.part_ids(1)[:3]]
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=2, serial_numbers=wanted)
+        self.assertTrue(item_list.voluntary_abandon)
+        self.assertEqual(sorted(item["serial_number"] for item in item_list.results),
+                         sorted(wanted))
+        self.assertLess(len(api.item_calls), len(api.all_part_ids) // 2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_abandon(self):
+        api = FakeApi(fail=[f"{TYPE_ID}-01005"])
+        with api.patch():
+            with self.assertRaises(ItemList.Abandon):
+                ItemList(TYPE_ID, num_threads=3, retries=2)
+            self.assertEqual(api.item_calls.count(f"{TYPE_ID}-01005"), 2)
+
+            api.item_calls.clear()
+            item_list = ItemList(TYPE_ID, num_threads=3, retries=2, raise_on_abandon=False)
+        self.assertEqual((item_list.fail_retry, item_list.fail_abandon), (2, 1))
+        self.assertEqual(len(item_list.results), len(api.all_part_ids) - 1)
+
+    #-----------------------------------------------------------------------------
+
+    def test_fields(self):
+        # nothing is fetched item by item if the listing has what's needed
+        api = FakeApi(listed_serials=True)
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=3, fields=["part_id", "serial_number"])
+        self.assertEqual(sorted(item["serial_number"] for item in item_list.results),
+                         sorted(f"SN-{part_id}" for part_id in api.all_part_ids))
+        self.assertEqual((api.item_calls, item_list.num_detail_fetches), ([], 0))
+
+        # ... and only the items that are wanted are fetched if it doesn't
+        wanted = [f"SN-{part_id}" for part_id in api.part_ids(2)[:3]]
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=3, fields=["part_id", "location"],
+                                 serial_numbers=wanted)
+        self.assertEqual(sorted(item["serial_number"] for item in item_list.results),
+                         sorted(wanted))
+        self.assertEqual(item_list.num_detail_fetches, len(wanted))
+
+        # streaming works the same way
+        with api.patch():
+            received = [item["part_id"] for item in
+                        ItemList(TYPE_ID, num_threads=3, fields=["part_id"],
+                                 stream=True, max_pending=5)]
+        self.assertEqual(sorted(received), sorted(api.all_part_ids))
+        self.assertEqual(len(api.item_calls), len(wanted))
+
+    #-----------------------------------------------------------------------------
+
+    def test_cancel(self):
+        api = FakeApi(pages=20, latency=0.01)
+        with api.patch():
+            with ItemList(TYPE_ID, num_threads=2, block=False) as item_list:
+                while len(api.item_calls) < 5:
+                    time.sleep(0.01)
+            # leaving the block cancelled the crawl, and nothing runs after it
+            self.assertTrue(item_list.done())
+            calls = len(api.item_calls)
+            time.sleep(0.05)
+            self.assertEqual(len(api.item_calls), calls)
+        self.assertLess(calls, len(api.all_part_ids) // 2)
+        self.assertLessEqual(len(item_list.results), calls)
+
+    #-----------------------------------------------------------------------------
+
+    def test_stream(self):
+        api = FakeApi(pages=6)
+        max_pending = 10
+        received = []
+        ahead = []
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=4, stream=True, max_pending=max_pending)
+            for item in item_list:
+                if not received:
+                    # items arrive while the crawl is still going
+                    self.assertFalse(item_list.done())
+                received.append(item["part_id"])
+                with api.lock:
+                    ahead.append(len(api.item_calls) - len(received))
+                time.sleep(0.001)
+        self.assertEqual(sorted(received), sorted(api.all_part_ids))
+        self.assertEqual(item_list.results, [])
+        self.assertEqual(item_list.num_results, len(received))
+        # a slow caller holds the fetchers back
+        self.assertLessEqual(max(ahead), max_pending)
+
+    #-----------------------------------------------------------------------------
+
+    def test_stream_early_exit(self):
+        api = FakeApi(pages=20, fail=[f"{TYPE_ID}-01003"])
+        with api.patch():
+            item_list = ItemList(TYPE_ID, num_threads=2, stream=True, raise_on_abandon=False)
+            for n, item in enumerate(item_list):
+                if n == 4:
+                    break
+            item_list.wait()
+        self.assertLess(len(api.item_calls), len(api.all_part_ids) // 2)
+
+        with api.patch():
+            with self.assertRaises(ItemList.Abandon):
+                for item in ItemList(TYPE_ID, num_threads=2, stream=True, retries=1):
+                    pass
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__asynchronous.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.Asynchronous
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import asyncio
+import os
+import json
+from unittest import mock
+import aiohttp
+
+import Sisyphus.RestApiV1.Asynchronous as ara
+
+class Test__asynchronous(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+
+    #-----------------------------------------------------------------------------
+
+    def test_gather_limit(self):
+        testname = "gather_limit"
+        logger.info(f"[TEST {testname}]")
+
+        try:
+            running = 0
+            max_running = 0
+
+            async def task(n):
+                nonlocal running, max_running
+                running += 1
+                max_running = max(max_running, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                return n
+
+            results = asyncio.run(ara.gather(*[task(n) for n in range(50)], limit=7))
+
+            self.assertEqual(results, list(range(50)))
+            self.assertEqual(max_running, 7)
+
+        except AssertionError as err:
+            logger.error(f"[FAIL {testname}]")
+            logger.info(err)
+            raise err
+        logger.info(f"[PASS {testname}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_stale_session(self):
+        testname = "stale_session"
+        logger.info(f"[TEST {testname}]")
+
+        def start_session():
+            # like ara.start_session, without needing a certificate
+            ara.session = aiohttp.ClientSession()
+            ara._session_loop = asyncio.get_running_loop()
+            return ara.session
+
+        async def get_session():
+            return await ara._get_session()
+
+        try:
+            with mock.patch.object(ara, "start_session", start_session):
+                # the first loop ends without calling close_session()
+                stale = asyncio.run(get_session())
+                self.assertFalse(stale.closed)
+
+                async def next_session():
+                    try:
+                        return await get_session()
+                    finally:
+                        await ara.close_session()
+
+                fresh = asyncio.run(next_session())
+
+            self.assertIsNot(fresh, stale)
+            self.assertTrue(stale.closed)
+            self.assertTrue(fresh.closed)
+            self.assertIsNone(ara.session)
+
+        except AssertionError as err:
+            logger.error(f"[FAIL {testname}]")
+            logger.info(err)
+            raise err
+        logger.info(f"[PASS {testname}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_get_countries(self):
+        testname = "get_countries (async)"
+        logger.info(f"[TEST {testname}]")
+
+        try:
+            file_path = os.path.join(os.path.dirname(__file__),
+                    'ExpectedResponses', 'misc', 'countries.json')
+            with open(file_path, 'r') as file:
+                expected_resp = json.load(file)
+
+            async def fetch():
+                try:
+                    return await ara.gather(*[ara.get_countries() for _ in range(5)])
+                finally:
+                    await ara.close_session()
+
+            resps = asyncio.run(fetch())
+
+            for resp in resps:
+                self.assertEqual(resp["status"], "OK")
+                self.assertDictEqual(resp, expected_resp)
+
+        except AssertionError as err:
+            logger.error(f"[FAIL {testname}]")
+            logger.info(err)
+            raise err
+        logger.info(f"[PASS {testname}]")
+
+if __name__ == "__main__":
+    unittest.main()
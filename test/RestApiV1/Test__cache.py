@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__cache.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.ResponseCache
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import os
+import time
+import tempfile
+
+import Sisyphus.RestApiV1 as ra
+from Sisyphus.RestApiV1 import ResponseCache
+
+class Test__response_cache(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ra.set_response_cache(None)
+        self.tempdir.cleanup()
+
+    #-----------------------------------------------------------------------------
+
+    def test_store_and_lookup(self):
+        cache = ResponseCache(self.tempdir.name, profile="p", rest_api="host")
+        url = "https://host/api/v1/institutions"
+        resp = {"data": [{"id": 1}], "status": "OK"}
+
+        self.assertIsNone(cache.lookup(url))
+        cache.store("institutions", url, None, resp, etag='"abc"')
+
+        # a new cache object has to read it from disk
+        cache = ResponseCache(self.tempdir.name, profile="p", rest_api="host")
+        entry = cache.lookup(url)
+        self.assertTrue(cache.is_fresh(entry))
+        self.assertEqual(cache.response(entry), resp)
+        self.assertEqual(cache.validators(entry), {"If-None-Match": '"abc"'})
+
+        # the key includes the profile, host, and parameters
+        other = ResponseCache(self.tempdir.name, profile="q", rest_api="host")
+        self.assertIsNone(other.lookup(url))
+        self.assertIsNone(cache.lookup(url, [("page", 2)]))
+
+        # refresh ignores existing entries, but only until they're fetched again
+        refresh = ResponseCache(self.tempdir.name, profile="p", rest_api="host", refresh=True)
+        self.assertIsNone(refresh.lookup(url))
+        new_resp = {"data": [{"id": 2}], "status": "OK"}
+        refresh.store("institutions", url, None, new_resp)
+        self.assertEqual(refresh.response(refresh.lookup(url)), new_resp)
+        self.assertIsNone(refresh.lookup(url, [("page", 2)]))
+
+    #-----------------------------------------------------------------------------
+
+    def test_expiry(self):
+        cache = ResponseCache(self.tempdir.name, ttls={"countries": 0.1})
+        url = "https://host/api/v1/countries"
+        entry = cache.store("countries", url, None, {"status": "OK"})
+        self.assertTrue(cache.is_fresh(entry))
+        time.sleep(0.2)
+        entry = cache.lookup(url)
+        self.assertFalse(cache.is_fresh(entry))
+        entry = cache.renew("countries", url, None, entry)
+        self.assertTrue(cache.is_fresh(cache.lookup(url)))
+
+    #-----------------------------------------------------------------------------
+
+    def test_eviction(self):
+        cache = ResponseCache(self.tempdir.name, max_bytes=2000)
+        payload = {"data": "x" * 500, "status": "OK"}
+        for n in range(10):
+            cache.store("roles", f"https://host/{n}", None, payload)
+            # make sure the mtimes differ
+            os.utime(cache._path(cache._key(f"https://host/{n}", None)), (n, n))
+
+        total = sum(os.path.getsize(os.path.join(self.tempdir.name, f))
+                        for f in os.listdir(self.tempdir.name))
+        self.assertLessEqual(total, 2000)
+        self.assertIsNotNone(cache.lookup("https://host/9"))
+        cache._memory.clear()
+        self.assertIsNone(cache.lookup("https://host/0"))
+
+    #-----------------------------------------------------------------------------
+
+    def test_get_uses_cache(self):
+        cache = ResponseCache(self.tempdir.name, profile=config.profile_name,
+                              rest_api=config.rest_api)
+        ra.set_response_cache(cache)
+
+        url = f"https://{config.rest_api}/api/v1/manufacturers"
+        expected = {"data": [{"id": 7, "name": "Hajime Inc"}], "status": "OK"}
+        cache.store("manufacturers", url, None, expected)
+
+        # this must not touch the network
+        resp = ra.get_manufacturers()
+        self.assertEqual(resp, expected)
+
+        # callers get their own copy
+        resp["data"].clear()
+        self.assertEqual(ra.get_manufacturers(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__client.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.Client, using the local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import os
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import Sisyphus.RestApiV1 as ra
+from Sisyphus.RestApiV1 import Client
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+
+# Used by the forked workers in test_fork
+client = None
+
+def count_countries(_):
+    resp = client.get_countries()
+    return os.getpid(), resp["status"], len(resp.get("data", []))
+
+class Test__client(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.client = Client(rest_api=self.server.rest_api,
+                             certificate=self.server.certificate,
+                             pool_size=4,
+                             timeout=10,
+                             response_cache=None,
+                             session_kwargs={"verify": self.server.certificate})
+
+    def tearDown(self):
+        self.client.close()
+
+    #-----------------------------------------------------------------------------
+
+    def test_endpoints(self):
+        resp = self.client.get_component_type("Z00100300001")
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["part_type_id"], "Z00100300001")
+
+        part_ids = [item["part_id"] for item in
+                        self.client.iter_hwitems("D00501300001", size=2)]
+        self.assertEqual(len(part_ids), len(set(part_ids)))
+
+        # the module functions have the same methods behind them
+        for name in ("get_hwitem", "post_bulk_hwitems", "get_test_types", "whoami"):
+            self.assertTrue(callable(getattr(self.client, name)))
+            self.assertTrue(callable(getattr(ra, name)))
+
+    #-----------------------------------------------------------------------------
+
+    def test_threads(self):
+        url = f"https://{self.server.rest_api}/api/v1/countries"
+
+        def work(_):
+            session = self.client.session
+            self.assertEqual(self.client.get_countries()["status"], "OK")
+            return id(session), id(session.get_adapter(url))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            sessions, adapters = zip(*executor.map(work, range(16)))
+        # every thread had its own session...
+        self.assertGreater(len(set(sessions)), 1)
+        self.assertLessEqual(len(set(sessions)), 4)
+        # ...but they all use the same connections
+        self.assertEqual(len(set(adapters)), 1)
+
+    #-----------------------------------------------------------------------------
+
+    def test_restart(self):
+        session = self.client.session
+        self.client.start()
+        self.assertIsNot(self.client.session, session)
+        self.assertEqual(self.client.get_projects()["status"], "OK")
+
+        self.client.close()
+        self.assertEqual(self.client.get_projects()["status"], "OK")
+
+    #-----------------------------------------------------------------------------
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(),
+                         "fork is not available")
+    def test_fork(self):
+        global client
+        client = self.client
+        self.assertEqual(client.get_countries()["status"], "OK")
+        parent_session = client.session
+
+        with multiprocessing.get_context("fork").Pool(2) as pool:
+            results = pool.map(count_countries, range(4))
+
+        for pid, status, count in results:
+            self.assertNotEqual(pid, os.getpid())
+            self.assertEqual(status, "OK")
+            self.assertGreater(count, 0)
+
+        # the parent's connections weren't disturbed
+        self.assertIs(client.session, parent_session)
+        self.assertEqual(client.get_countries()["status"], "OK")
+
+if __name__ == "__main__":
+    unittest.main()
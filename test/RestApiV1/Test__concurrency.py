@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__concurrency.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.Utils.Concurrency.AdaptiveLimit, alone and in a Client
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import time
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from Sisyphus.RestApiV1 import Client
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.Utils.Concurrency import AdaptiveLimit, limited
+import Sisyphus.Utils.Concurrency as Concurrency
+from Sisyphus.Utils.Metrics import metrics
+
+URL = "https://localhost/api/v1/countries"
+
+class Test__concurrency(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    def round_trip(self, limit, status=200):
+        # fill the limit, and let every request finish with 'status'
+        slots = [limit.acquire() for _ in range(limit.limit)]
+        for slot in slots:
+            slot.finish(status)
+            slot.release()
+
+    #-----------------------------------------------------------------------------
+
+    def test_increase(self):
+        limit = AdaptiveLimit(2, maximum=5)
+        limits = []
+        for _ in range(6):
+            self.round_trip(limit)
+            limits.append(limit.limit)
+        # one more for each full limit's worth of successes
+        self.assertEqual(limits, [3, 4, 5, 5, 5, 5])
+
+        # it doesn't grow if nobody is using it
+        limit = AdaptiveLimit(4)
+        for _ in range(20):
+            with limited(limit, "GET", URL) as slot:
+                slot.finish(200)
+        self.assertEqual(limit.limit, 4)
+
+    #-----------------------------------------------------------------------------
+
+    def test_backoff(self):
+        limit = AdaptiveLimit(8, minimum=3)
+        early = limit.acquire()
+        slot = limit.acquire()
+        slot.finish(503)
+        slot.release()
+        self.assertEqual(limit.limit, 4)
+
+        # a failure from before the back-off doesn't count again
+        early.release(overloaded=True)
+        self.assertEqual(limit.limit, 4)
+
+        with self.assertRaises(TimeoutError):
+            with limited(limit, "GET", URL):
+                raise TimeoutError()
+        self.assertEqual(limit.limit, 3)
+        self.assertEqual((limit.decreases, limit.in_flight), (2, 0))
+
+        # client errors aren't the server's fault, so they count as successes
+        self.round_trip(limit, 404)
+        self.assertEqual(limit.limit, 4)
+
+    #-----------------------------------------------------------------------------
+
+    def test_latency_spike(self):
+        limit = AdaptiveLimit(8)
+        for _ in range(Concurrency.MIN_SAMPLES):
+            with limited(limit, "GET", URL) as slot:
+                time.sleep(0.01)
+                slot.finish(200)
+        self.assertEqual(limit.limit, 8)
+
+        # a slow response from another endpoint is its usual speed
+        with limited(limit, "GET", URL + "/US") as slot:
+            time.sleep(0.2)
+            slot.finish(200)
+        self.assertEqual(limit.limit, 8)
+
+        with limited(limit, "GET", URL) as slot:
+            time.sleep(0.2)
+            slot.finish(200)
+        self.assertEqual(limit.limit, 4)
+
+    #-----------------------------------------------------------------------------
+
+    def test_latency_shift(self):
+        # a server that stays slower soon stops counting as spikes
+        limit = AdaptiveLimit(10)
+        key = ("GET", "/api/v1/countries")
+        def round_trip(elapsed):
+            slots = [limit.acquire() for _ in range(limit.limit)]
+            for slot in slots:
+                limit._release(slot, key, elapsed, False)
+
+        for _ in range(2):
+            round_trip(0.0005)
+        before = limit.limit
+        for _ in range(20):
+            round_trip(0.005)
+        self.assertEqual(limit.decreases, 1)
+        self.assertGreater(limit.limit, before)
+
+    #-----------------------------------------------------------------------------
+
+    def test_fork(self):
+        # a child forked while the limit is full isn't waiting for the
+        # parent's requests
+        limit = AdaptiveLimit(2)
+        slots = [limit.acquire() for _ in range(2)]
+        pid = os.fork()
+        if pid == 0:
+            signal.alarm(5)
+            with limited(limit, "GET", URL) as slot:
+                slot.finish(200)
+            os._exit(0 if limit.in_flight == 0 else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+        for slot in slots:
+            slot.release()
+        self.assertEqual(limit.in_flight, 0)
+
+    #-----------------------------------------------------------------------------
+
+    def test_blocks(self):
+        limit = AdaptiveLimit(3, maximum=3)
+        def work(_):
+            with limited(limit, "GET", URL) as slot:
+                time.sleep(0.01)
+                slot.finish(200)
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(work, range(30)))
+        self.assertEqual(limit.max_in_flight, 3)
+        self.assertEqual(limit.in_flight, 0)
+
+    #-----------------------------------------------------------------------------
+
+    def test_client(self):
+        limit = AdaptiveLimit(8)
+        with LocalServer(seed=1, error_rate=1.0, error_status=503) as server:
+            client = Client(rest_api=server.rest_api,
+                            certificate=server.certificate,
+                            retry_policy=None,
+                            response_cache=None,
+                            single_flight=None,
+                            concurrency=limit,
+                            session_kwargs={"verify": server.certificate})
+            with client:
+                client.get_countries()
+                self.assertEqual(limit.limit, 4)
+
+                server.error_rate = 0.0
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(lambda _: client.get_countries(), range(40)))
+                self.assertGreater(limit.limit, 4)
+                self.assertLessEqual(limit.max_in_flight, 8)
+
+        # the shared limit is reported with the metrics
+        old_limit = Concurrency.get_shared_limit()
+        Concurrency.set_shared_limit(limit)
+        try:
+            self.assertEqual(metrics.gauges()["concurrency_limit"], limit.limit)
+            self.assertIn("sisyphus_rest_concurrency_limit ", metrics.to_prometheus())
+            Concurrency.set_shared_limit(None)
+            self.assertNotIn("concurrency_limit", metrics.gauges())
+        finally:
+            Concurrency.set_shared_limit(old_limit)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__download.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Streaming, resumable downloads with RestApiV1.get_image, using the
+    local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import os
+import hashlib
+import tempfile
+
+import Sisyphus.RestApiV1 as ra
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+from Sisyphus.Utils.Download import partial_filename
+
+class Test__download(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+        cls.content = os.urandom(3 * 1024 * 1024)
+        cls.sha256 = hashlib.sha256(cls.content).hexdigest()
+        cls.image_id = cls.server.store.add_image(cls.content, "scan.png",
+                                                  part_type_id="Z00100300001")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, "scan.png")
+        self.server.reset_log()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    #-----------------------------------------------------------------------------
+
+    def test_download(self):
+        resp = ra.get_image(self.image_id, self.filename, checksum=f"sha256:{self.sha256}")
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["bytes"], len(self.content))
+        self.assertEqual(resp["data"]["bytes_received"], len(self.content))
+        self.assertEqual(resp["data"]["resumed_from"], 0)
+        self.assertEqual(resp["data"]["checksum"], f"sha256:{self.sha256}")
+        self.assertEqual(self.read(), self.content)
+        self.assertFalse(os.path.exists(partial_filename(self.filename)))
+
+    #-----------------------------------------------------------------------------
+
+    def test_checksum_mismatch(self):
+        resp = ra.get_image(self.image_id, self.filename, checksum="0" * 64)
+        self.assertEqual(resp["status"], "ERROR")
+        self.assertEqual(resp["addl_info"]["actual"], self.sha256)
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertFalse(os.path.exists(partial_filename(self.filename)))
+
+    #-----------------------------------------------------------------------------
+
+    def test_resume(self):
+        offset = 1000000
+        with open(partial_filename(self.filename), "wb") as f:
+            f.write(self.content[:offset])
+
+        resp = ra.get_image(self.image_id, self.filename, checksum=self.sha256)
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["resumed_from"], offset)
+        self.assertEqual(resp["data"]["bytes_received"], len(self.content) - offset)
+        self.assertEqual(self.read(), self.content)
+
+        # a partial file that's already too long can't be resumed
+        with open(partial_filename(self.filename), "wb") as f:
+            f.write(self.content + b"extra")
+        resp = ra.get_image(self.image_id, self.filename)
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["resumed_from"], 0)
+        self.assertEqual(self.read(), self.content)
+
+    #-----------------------------------------------------------------------------
+
+    def test_no_resume(self):
+        with open(partial_filename(self.filename), "wb") as f:
+            f.write(b"garbage")
+        resp = ra.get_image(self.image_id, self.filename, resume=False)
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["resumed_from"], 0)
+        self.assertEqual(self.read(), self.content)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__import_time.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Importing Sisyphus modules is cheap: the configuration, the session,
+    and heavy dependencies are only loaded when they're used
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import os
+import sys
+import json
+import subprocess
+
+# Time allowed for importing a module, in seconds. Most of what's left
+# is the standard library (logging, json, etc.), so this is generous.
+IMPORT_BUDGET = 0.150
+
+# Modules that must not be imported just because Sisyphus was
+HEAVY_MODULES = ["requests", "urllib3", "OpenSSL", "cryptography", "pandas", "numpy"]
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+from Sisyphus.Configuration import config
+print(json.dumps({{
+    "elapsed": elapsed,
+    "config_loaded": config.loaded,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+'''
+
+def probe(module):
+    lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../lib"))
+    env = {**os.environ, "PYTHONPATH": lib_path}
+    # best of three, to smooth out a busy machine
+    results = []
+    for _ in range(3):
+        output = subprocess.run(
+                    [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                    env=env, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda r: r["elapsed"])
+
+class Test__import_time(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def check(self, module):
+        result = probe(module)
+        logger.info(f"importing {module} took {result['elapsed']*1000:0.1f} ms")
+        self.assertFalse(result["config_loaded"])
+        self.assertEqual(result["heavy"], [])
+        self.assertLess(result["elapsed"], IMPORT_BUDGET)
+
+    def test_configuration(self):
+        self.check("Sisyphus.Configuration")
+
+    def test_rest_api_v1(self):
+        self.check("Sisyphus.RestApiV1")
+
+    def test_rest_api(self):
+        self.check("Sisyphus.RestApi")
+
+    def test_hwdb_uploader(self):
+        self.check("Sisyphus.HWDBUploader")
+
+    #-----------------------------------------------------------------------------
+
+    def test_config_loads_on_use(self):
+        code = ("from Sisyphus.Configuration import config\n"
+                "logger = config.getLogger()\n"
+                "assert not config.loaded\n"
+                "config.rest_api\n"
+                "assert config.loaded\n"
+                "assert config.getLogger() is logger\n")
+        lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../lib"))
+        subprocess.run([sys.executable, "-c", code],
+                       env={**os.environ, "PYTHONPATH": lib_path}, check=True)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__iter_pages.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Python: iter_hwitems, iter_component_types
+    REST API: /api/v1/component-types/{part_type_id}/components
+              /api/v1/component-types/{proj}/{sys}/{subsys}
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import time
+import threading
+
+from Sisyphus.RestApiV1 import iter_hwitems, iter_component_types
+from Sisyphus.RestApiV1._RestApiV1 import _iter_pages
+
+def fake_endpoint(num_pages, page_size, latency):
+    calls = []
+    lock = threading.Lock()
+    def fetch_page(page):
+        with lock:
+            calls.append(page)
+        time.sleep(latency)
+        return {
+            "data": [(page, n) for n in range(page_size)],
+            "pagination": {"page": page, "pages": num_pages},
+            "status": "OK",
+        }
+    return fetch_page, calls
+
+class Test__iter_pages(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_order_and_overlap(self):
+        fetch_page, calls = fake_endpoint(num_pages=8, page_size=3, latency=0.1)
+
+        start = time.time()
+        items = list(_iter_pages(fetch_page, prefetch=8))
+        elapsed = time.time() - start
+
+        self.assertEqual(items, [(p, n) for p in range(1, 9) for n in range(3)])
+        # page 1, then the other 7 at the same time
+        self.assertLess(elapsed, 0.5)
+
+    #-----------------------------------------------------------------------------
+
+    def test_early_exit(self):
+        fetch_page, calls = fake_endpoint(num_pages=100, page_size=10, latency=0.01)
+
+        for item in _iter_pages(fetch_page, prefetch=2):
+            if item == (3, 0):
+                break
+        time.sleep(0.1)
+        self.assertLessEqual(max(calls), 5)
+
+    #-----------------------------------------------------------------------------
+
+    def test_error(self):
+        def fetch_page(page):
+            if page == 3:
+                return {"status": "ERROR", "data": "oops"}
+            return {"data": [page], "pagination": {"pages": 4}, "status": "OK"}
+
+        with self.assertRaises(RuntimeError):
+            list(_iter_pages(fetch_page))
+
+    #-----------------------------------------------------------------------------
+
+    def test_iter_hwitems(self):
+        part_type_id = 'D00501341001'
+        part_ids = [item["part_id"] for item in iter_hwitems(part_type_id, size=5)]
+        self.assertGreater(len(part_ids), 0)
+        self.assertEqual(len(part_ids), len(set(part_ids)))
+
+    #-----------------------------------------------------------------------------
+
+    def test_iter_component_types(self):
+        items = list(iter_component_types("D", 1, 1, size=1))
+        self.assertIn("D00100100001", [item["part_type_id"] for item in items])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__local_server.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.LocalServer, and the RestApiV1 functions running
+    against it
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import time
+import tempfile
+
+import Sisyphus.RestApiV1 as ra
+from Sisyphus.RestApiV1 import RetryPolicy, ResponseCache
+from Sisyphus.RestApiV1 import Utilities as ut
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+
+def new_item(part_type_id, serial_number, **specs):
+    return {
+        "comments": "Here are some comments",
+        "component_type": {"part_type_id": part_type_id},
+        "country_code": "US",
+        "institution": {"id": 186},
+        "manufacturer": {"id": 7},
+        "serial_number": serial_number,
+        "specifications": {"Widget ID": serial_number, **specs},
+        "subcomponents": {},
+    }
+
+class Test__local_server(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.server.error_rate = 0.0
+        self.server.latency = 0.0
+
+    def tearDown(self):
+        ra.set_retry_policy(RetryPolicy())
+        ra.set_response_cache(None)
+
+    #-----------------------------------------------------------------------------
+
+    def test_post_patch_get(self):
+        part_type_id = "Z00100300001"
+
+        resp = ra.post_hwitem(part_type_id, new_item(part_type_id, "LS001", Color="red"))
+        self.assertEqual(resp["status"], "OK")
+        part_id = resp["part_id"]
+
+        data = {
+            "part_id": part_id,
+            "serial_number": "LS002",
+            "specifications": {"Widget ID": "LS002", "Color": "green"},
+        }
+        resp = ra.patch_hwitem(part_id, data)
+        self.assertEqual(resp["status"], "OK")
+
+        resp = ra.get_hwitem(part_id)
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual(resp["data"]["serial_number"], "LS002")
+        self.assertEqual(resp["data"]["enabled"], False)
+        self.assertDictEqual(resp["data"]["specifications"][0], data["specifications"])
+
+        ut.enable_hwitem(part_id)
+        self.assertEqual(ra.get_hwitem(part_id)["data"]["enabled"], True)
+
+        # a serial number can only be used once per type
+        resp = ra.post_hwitem(part_type_id, new_item(part_type_id, "LS002"))
+        self.assertEqual(resp["status"], "ERROR")
+
+        resp = ra.get_hwitem(f"{part_type_id}-99999")
+        self.assertEqual(resp["status"], "ERROR")
+
+    #-----------------------------------------------------------------------------
+
+    def test_bulk_add_and_subcomponents(self):
+        planes = ut.bulk_add_hwitems("D00501300001", 5, institution_id=186)
+        self.assertEqual(len(planes), 5)
+
+        assembly = ut.bulk_add_hwitems("D00501341001", 1, institution_id=186)[0]
+        ut.set_subcomponents(assembly, {"CPA Plane PID": planes[0]})
+
+        resp = ra.get_subcomponents(assembly)
+        self.assertEqual(resp["status"], "OK")
+        self.assertEqual([(node["functional_position"], node["part_id"]) for node in resp["data"]],
+                         [("CPA Plane PID", planes[0])])
+
+        part_ids = [item["part_id"] for item in ra.iter_hwitems("D00501300001", size=2)]
+        self.assertEqual(sorted(part_ids), sorted(set(part_ids)))
+        self.assertTrue(set(planes) <= set(part_ids))
+
+        resp = ra.get_hwitems("D00501300001", size=2, page=1)
+        self.assertEqual(resp["pagination"]["page"], 1)
+        self.assertEqual(resp["pagination"]["pages"], (len(part_ids) + 1) // 2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_type_lookups(self):
+        full_name, part_type_id = ut.lookup_part_type_id_by_fullname(
+                                    "D.FD1-HD HVS.TPC HV Assembly.CPA/FC Assembly US")
+        self.assertEqual(part_type_id, "D00501341001")
+
+        type_info = ut.lookup_component_type_defs(part_type_id)
+        self.assertIn("CPA Plane PID", type_info["subcomponents"])
+        self.assertEqual(len(type_info["tests"]), 1)
+
+        self.assertEqual(ra.whoami()["status"], "OK")
+        self.assertIn(186, [inst["id"] for inst in ra.get_institutions()["data"]])
+
+    #-----------------------------------------------------------------------------
+
+    def test_injected_errors(self):
+        ra.set_retry_policy(None)
+        self.server.error_rate = 1.0
+        resp = ra.get_countries()
+        self.assertEqual(resp["status"], "Server Error")
+        self.assertEqual(resp["addl_info"]["http_response_code"], 503)
+
+        # with retries, an unreliable server still gets there
+        ra.set_retry_policy(RetryPolicy(max_retries=20, backoff_base=0.001))
+        self.server.error_rate = 0.5
+        for _ in range(10):
+            self.assertEqual(ra.get_countries()["status"], "OK")
+
+    #-----------------------------------------------------------------------------
+
+    def test_latency(self):
+        self.server.latency = 0.2
+        start = time.time()
+        ra.get_projects()
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_revalidation(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ResponseCache(tempdir, rest_api=self.server.rest_api,
+                                  ttls={"manufacturers": 0})
+            ra.set_response_cache(cache)
+
+            expected = ra.get_manufacturers()
+            self.server.reset_log()
+            self.assertEqual(ra.get_manufacturers(), expected)
+            # the server was asked, but the cached copy was still good
+            self.assertEqual(len(self.server.request_log), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__metrics.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.Utils.Metrics
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+
+from Sisyphus.Utils.Metrics import Metrics, endpoint_template
+
+class Test__metrics(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_endpoint_template(self):
+        cases = {
+            "https://host/cdb/api/v1/components/D00599800007-00075":
+                    "/api/v1/components/{part_id}",
+            "https://host/cdb/api/v1/component-types/D00599800007/components?page=2":
+                    "/api/v1/component-types/{part_type_id}/components",
+            "https://host/cdb/api/v1/component-types/D/1/2":
+                    "/api/v1/component-types/{project_id}/{id}/{id}",
+            "https://host/cdb/api/v1/components/D00599800007-00075/tests/Test Type 001":
+                    "/api/v1/components/{part_id}/tests/{name}",
+            "https://host/cdb/api/v1/img/3fa85f64-5717-4562-b3fc-2c963f66afa6":
+                    "/api/v1/img/{image_id}",
+            "https://host/cdb/api/v1/countries":
+                    "/api/v1/countries",
+        }
+        for url, expected in cases.items():
+            self.assertEqual(endpoint_template(url), expected)
+
+    #-----------------------------------------------------------------------------
+
+    def test_track(self):
+        metrics = Metrics()
+        url = "https://host/cdb/api/v1/components/D00599800007-0007{}"
+
+        for n in range(3):
+            with metrics.track("get", url.format(n)) as tracked:
+                tracked.finish(200, response_bytes=100, request_bytes=0)
+        with metrics.track("GET", url.format(9)) as tracked:
+            tracked.finish(404, response_bytes=10)
+        with self.assertRaises(ConnectionError):
+            with metrics.track("GET", url.format(9)) as tracked:
+                raise ConnectionError()
+        metrics.record_retry("GET", url.format(9))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(len(snapshot), 1)
+        stats = snapshot[0]
+        self.assertEqual(stats["method"], "GET")
+        self.assertEqual(stats["endpoint"], "/api/v1/components/{part_id}")
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["statuses"], {"200": 3, "404": 1, "exception": 1})
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["response_bytes"], 310)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(sum(stats["latency"]["buckets"].values()), 5)
+
+    #-----------------------------------------------------------------------------
+
+    def test_max_in_flight(self):
+        metrics = Metrics()
+        barrier = threading.Barrier(4)
+
+        def worker():
+            with metrics.track("GET", "https://host/api/v1/roles") as tracked:
+                barrier.wait()
+                time.sleep(0.05)
+                tracked.finish(200)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = metrics.snapshot()[0]
+        self.assertEqual(stats["max_in_flight"], 4)
+        self.assertEqual(stats["in_flight"], 0)
+
+    #-----------------------------------------------------------------------------
+
+    def test_write(self):
+        metrics = Metrics()
+        with metrics.track("POST", "https://host/api/v1/components/D00599800007") as tracked:
+            tracked.finish(200, response_bytes=20, request_bytes=30)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            json_file = os.path.join(tempdir, "metrics.json")
+            metrics.write(json_file)
+            with open(json_file) as f:
+                contents = json.load(f)
+            self.assertEqual(contents["endpoints"][0]["request_bytes"], 30)
+
+            prom_file = os.path.join(tempdir, "metrics.prom")
+            metrics.write(prom_file)
+            with open(prom_file) as f:
+                contents = f.read()
+            self.assertIn('sisyphus_rest_requests_total{method="POST",'
+                    'endpoint="/api/v1/components/{part_type_id}",status="200"} 1', contents)
+            self.assertIn('le="+Inf"} 1', contents)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__multi_v1.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.Multi.ItemList, using the local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+
+from Sisyphus.RestApiV1 import Client
+from Sisyphus.RestApiV1.Multi import ItemList
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+
+PART_TYPE_ID = "Z00100300001"
+NUM_ITEMS = 45
+
+class Test__multi_v1(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.client = Client(rest_api=cls.server.rest_api,
+                            certificate=cls.server.certificate,
+                            retry_policy=None,
+                            response_cache=None,
+                            concurrency=None,
+                            session_kwargs={"verify": cls.server.certificate})
+        store = cls.server.store
+        test_type_id = next(test_type["id"] for test_type in store.test_types.values()
+                                if test_type["part_type_id"] == PART_TYPE_ID)
+        cls.part_ids = {}
+        for n in range(NUM_ITEMS):
+            serial_number = f"MSN-{n:04d}"
+            item = store.add_hwitem(PART_TYPE_ID, {
+                "institution": {"id": 186},
+                "country_code": "US",
+                "serial_number": serial_number,
+            })
+            cls.part_ids[serial_number] = item["part_id"]
+            if n % 3 == 0:
+                store.add_test(item["part_id"], test_type_id, {"Result": "old"})
+                store.add_test(item["part_id"], test_type_id, {"Result": f"R{n}"})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        self.server.reset_log()
+
+    def requests(self, kind):
+        return [path for method, path in self.server.request_log
+                    if method == "GET" and kind in path]
+
+    #-----------------------------------------------------------------------------
+
+    def test_all_items(self):
+        calls = []
+        item_list = ItemList(PART_TYPE_ID, num_threads=4, page_size=10, client=self.client,
+                             status_callback=lambda L: calls.append(L.num_results))
+        self.assertEqual({item["serial_number"]: item["part_id"] for item in item_list.results},
+                         self.part_ids)
+        self.assertEqual(item_list.num_items, NUM_ITEMS)
+        self.assertEqual(len(calls), NUM_ITEMS)
+        # the details came from the server
+        self.assertTrue(all("institution" in item for item in item_list.results))
+        self.assertEqual(len(self.requests("/components?")), 5)
+        self.assertEqual(len(self.requests("/components/")), NUM_ITEMS)
+
+    #-----------------------------------------------------------------------------
+
+    def test_fields(self):
+        # the listing has these, so nothing is fetched item by item
+        item_list = ItemList(PART_TYPE_ID, num_threads=4, client=self.client,
+                             fields=["part_id", "serial_number"])
+        self.assertEqual({item["serial_number"]: item["part_id"] for item in item_list.results},
+                         self.part_ids)
+        self.assertEqual(item_list.num_detail_fetches, 0)
+        self.assertEqual(self.requests("/components/"), [])
+
+        # ... and only the ones that are wanted are, when looking for serial numbers
+        wanted = ["MSN-0003", "MSN-0020"]
+        item_list = ItemList(PART_TYPE_ID, num_threads=4, client=self.client,
+                             serial_numbers=wanted)
+        self.assertEqual(sorted(item["part_id"] for item in item_list.results),
+                         sorted(self.part_ids[sn] for sn in wanted))
+        self.assertEqual(item_list.num_detail_fetches, 2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_subcomponents_and_tests(self):
+        item_list = ItemList(PART_TYPE_ID, num_threads=4, client=self.client,
+                             fields=["part_id", "serial_number"],
+                             subcomponents=True, tests=True, stream=True)
+        results = list(item_list)
+        self.assertEqual(len(results), NUM_ITEMS)
+        for item in results:
+            n = int(item["serial_number"][4:])
+            self.assertEqual(item["subcomponents"], [])
+            # only the latest result of each test type
+            self.assertEqual([test["test_data"] for test in item["tests"]],
+                             [{"Result": f"R{n}"}] if n % 3 == 0 else [])
+        # the listing was enough for everything else
+        self.assertEqual(item_list.num_detail_fetches, 0)
+        self.assertEqual(len(self.requests("/subcomponents")), NUM_ITEMS)
+        self.assertEqual(len(self.requests("/tests")), NUM_ITEMS)
+
+    #-----------------------------------------------------------------------------
+
+    def test_abandon(self):
+        self.server.error_rate = 1.0
+        try:
+            with self.assertRaises(ItemList.Abandon):
+                ItemList(PART_TYPE_ID, num_threads=2, retries=2, client=self.client)
+        finally:
+            self.server.error_rate = 0.0
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__resolve_serial_numbers.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.Utilities.resolve_serial_numbers, using the local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+
+import Sisyphus.RestApiV1.Utilities as ut
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+
+PART_TYPE_ID = "Z00100300001"
+
+class Test__resolve_serial_numbers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(seed=1).start()
+        cls.server.connect()
+        cls.part_ids = {}
+        for n in range(250):
+            serial_number = f"RSN-{n:04d}"
+            item = cls.server.store.add_hwitem(PART_TYPE_ID, {
+                "institution": {"id": 186},
+                "country_code": "US",
+                "serial_number": serial_number,
+            })
+            cls.part_ids[serial_number] = item["part_id"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.disconnect()
+        cls.server.stop()
+
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+        ut.clear_serial_number_cache()
+        self.server.reset_log()
+
+    def requests(self):
+        return [path for method, path in self.server.request_log if method == "GET"]
+
+    #-----------------------------------------------------------------------------
+
+    def test_query(self):
+        serial_numbers = ["RSN-0001", "RSN-0010", "RSN-0100", "NOT-THERE"]
+        result = ut.resolve_serial_numbers(PART_TYPE_ID, serial_numbers)
+        self.assertEqual(result, {
+            "RSN-0001": self.part_ids["RSN-0001"],
+            "RSN-0010": self.part_ids["RSN-0010"],
+            "RSN-0100": self.part_ids["RSN-0100"],
+            "NOT-THERE": None,
+        })
+        # one query for each, even though "RSN-0001" might match others as a pattern
+        self.assertEqual(len(self.requests()), 4)
+
+        # the second time comes from the cache
+        self.server.reset_log()
+        self.assertEqual(ut.resolve_serial_numbers(PART_TYPE_ID, serial_numbers), result)
+        self.assertEqual(self.requests(), [])
+
+    #-----------------------------------------------------------------------------
+
+    def test_scan(self):
+        # 200 serial numbers from 3 pages is cheaper to scan
+        serial_numbers = [f"RSN-{n:04d}" for n in range(200)]
+        result = ut.resolve_serial_numbers(PART_TYPE_ID, serial_numbers)
+        self.assertEqual(result, {sn: self.part_ids[sn] for sn in serial_numbers})
+        self.assertEqual(len(self.requests()), 3)
+
+        # everything else the scan saw was cached too
+        self.server.reset_log()
+        result = ut.resolve_serial_numbers(PART_TYPE_ID, ["RSN-0249"])
+        self.assertEqual(result, {"RSN-0249": self.part_ids["RSN-0249"]})
+        self.assertEqual(self.requests(), [])
+
+    #-----------------------------------------------------------------------------
+
+    def test_choose_query(self):
+        # with small pages, a scan would take more requests than querying
+        # for 12 serial numbers
+        page_size, ut.RESOLVE_PAGE_SIZE = ut.RESOLVE_PAGE_SIZE, 10
+        try:
+            serial_numbers = [f"RSN-{n:04d}" for n in range(0, 240, 20)]
+            result = ut.resolve_serial_numbers(PART_TYPE_ID, serial_numbers, max_workers=4)
+        finally:
+            ut.RESOLVE_PAGE_SIZE = page_size
+        self.assertEqual(result, {sn: self.part_ids[sn] for sn in serial_numbers})
+        # the first page, then a query for each one that wasn't on it
+        self.assertLessEqual(len(self.requests()), 1 + 12)
+        self.assertGreater(len(self.requests()), 1)
+
+    #-----------------------------------------------------------------------------
+
+    def test_numeric(self):
+        # sheets give numeric serial numbers as numbers, but the server's
+        # are strings
+        item = self.server.store.add_hwitem(PART_TYPE_ID, {
+            "institution": {"id": 186},
+            "country_code": "US",
+            "serial_number": "123",
+        })
+        for strategy in ("query", "scan"):
+            ut.clear_serial_number_cache()
+            result = ut.resolve_serial_numbers(PART_TYPE_ID, [123, "124"], strategy=strategy)
+            self.assertEqual(result, {123: item["part_id"], "124": None})
+
+        # the cache is shared by both forms
+        self.server.reset_log()
+        self.assertEqual(ut.resolve_serial_numbers(PART_TYPE_ID, ["123"]),
+                         {"123": item["part_id"]})
+        self.assertEqual(self.requests(), [])
+
+    #-----------------------------------------------------------------------------
+
+    def test_forget(self):
+        ut.resolve_serial_numbers(PART_TYPE_ID, ["NEW-0001"])
+        self.server.store.add_hwitem(PART_TYPE_ID, {
+            "institution": {"id": 186},
+            "country_code": "US",
+            "serial_number": "NEW-0001",
+        })
+        self.assertIsNone(ut.resolve_serial_numbers(PART_TYPE_ID, ["NEW-0001"])["NEW-0001"])
+        ut.forget_serial_number(PART_TYPE_ID, "NEW-0001")
+        self.assertIsNotNone(ut.resolve_serial_numbers(PART_TYPE_ID, ["NEW-0001"])["NEW-0001"])
+
+if __name__ == "__main__":
+    unittest.main()
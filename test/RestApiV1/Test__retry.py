@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__retry.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.RetryPolicy
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import requests.exceptions
+import urllib3.exceptions
+
+from Sisyphus.RestApiV1 import RetryPolicy
+
+class Test__retry_policy(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5, jitter=False)
+        self.assertEqual([policy.backoff(n) for n in range(5)], [1, 2, 4, 5, 5])
+
+        policy = RetryPolicy(backoff_base=1, backoff_max=5, jitter=True)
+        for n in range(10):
+            self.assertTrue(0 <= policy.backoff(n) <= min(5, 2**n))
+
+    #-----------------------------------------------------------------------------
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff_base=0.1, jitter=False, max_retry_after=60)
+        self.assertEqual(policy.delay(0, "7"), 7)
+        self.assertEqual(policy.delay(0, "600"), 60)
+        self.assertEqual(policy.delay(0, "garbage"), 0.1)
+
+        when = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.assertAlmostEqual(policy.delay(0, format_datetime(when, usegmt=True)), 30, delta=2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_statuses(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry_status("GET", 502, 0))
+        self.assertTrue(policy.should_retry_status("PATCH", 500, 1))
+        self.assertFalse(policy.should_retry_status("GET", 502, 2))
+        self.assertFalse(policy.should_retry_status("GET", 404, 0))
+
+        # POST is only retried when the server refused to act on it
+        self.assertFalse(policy.should_retry_status("POST", 500, 0))
+        self.assertFalse(policy.should_retry_status("POST", 502, 0))
+        self.assertTrue(policy.should_retry_status("POST", 503, 0))
+        self.assertTrue(policy.should_retry_status("POST", 429, 0))
+
+    #-----------------------------------------------------------------------------
+
+    def test_exceptions(self):
+        policy = RetryPolicy(max_retries=1)
+
+        not_sent = requests.exceptions.ConnectionError(
+                urllib3.exceptions.MaxRetryError(None, "/",
+                    urllib3.exceptions.NewConnectionError(None, "refused")))
+        maybe_sent = requests.exceptions.ConnectionError("Connection reset by peer")
+        read_timeout = requests.exceptions.ReadTimeout()
+
+        self.assertTrue(policy.should_retry_exception("GET", maybe_sent, 0))
+        self.assertTrue(policy.should_retry_exception("GET", read_timeout, 0))
+        self.assertFalse(policy.should_retry_exception("GET", read_timeout, 1))
+        self.assertFalse(policy.should_retry_exception("GET", ValueError(), 0))
+
+        self.assertTrue(policy.should_retry_exception("POST", not_sent, 0))
+        self.assertFalse(policy.should_retry_exception("POST", maybe_sent, 0))
+        self.assertFalse(policy.should_retry_exception("POST", read_timeout, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test/RestApiV1/Test__single_flight.py
+Copyright (c) 2023 Regents of the University of Minnesota
+Author: Alex Wagner <wagn0033@umn.edu>, Dept. of Physics and Astronomy
+
+Tests:
+    Sisyphus.RestApiV1.SingleFlight, and sharing GET requests against
+    the local server
+"""
+
+from Sisyphus.Configuration import config
+logger = config.getLogger()
+
+import unittest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Sisyphus.RestApiV1 as ra
+from Sisyphus.RestApiV1 import SingleFlight
+from Sisyphus.RestApiV1.LocalServer import LocalServer
+
+class Test__single_flight(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = 0x10000
+        logger.info(f"[TEST {self.id()}]")
+
+    #-----------------------------------------------------------------------------
+
+    def test_shared_result(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait()
+            return {"status": "OK", "data": [1, 2, 3]}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(flight.do, "key", fetch) for _ in range(5)]
+            while flight.requests + flight.coalesced < 5:
+                time.sleep(0.001)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 4)
+        self.assertTrue(all(r == results[0] for r in results))
+        # each caller has its own copy
+        results[0]["data"].append(4)
+        self.assertEqual(results[1]["data"], [1, 2, 3])
+
+        # a new call after the first one finished goes to the server again
+        flight.do("key", fetch)
+        self.assertEqual(len(calls), 2)
+
+    #-----------------------------------------------------------------------------
+
+    def test_shared_exception(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fetch():
+            release.wait()
+            raise RuntimeError("the server is down")
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(flight.do, "key", fetch) for _ in range(3)]
+            while flight.requests + flight.coalesced < 3:
+                time.sleep(0.001)
+            release.set()
+            for f in futures:
+                with self.assertRaises(RuntimeError):
+                    f.result()
+
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+    #-----------------------------------------------------------------------------
+
+    def test_local_server(self):
+        with LocalServer(latency=0.2) as server:
+            server.connect()
+            try:
+                server.reset_log()
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    results = list(executor.map(
+                            lambda _: ra.get_component_type("Z00100300001"), range(8)))
+                self.assertTrue(all(r["status"] == "OK" for r in results))
+                self.assertEqual(len(server.request_log), 1)
+
+                # different requests aren't shared
+                server.reset_log()
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(ra.get_component_type, ["Z00100300001", "D00501341001"]))
+                self.assertEqual(len(server.request_log), 2)
+
+                # and with single-flight turned off, every thread asks
+                ra.set_single_flight(None)
+                server.reset_log()
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    list(executor.map(
+                            lambda _: ra.get_component_type("Z00100300001"), range(4)))
+                self.assertEqual(len(server.request_log), 4)
+            finally:
+                ra.set_single_flight(SingleFlight())
+                server.disconnect()
+
+if __name__ == "__main__":
+    unittest.main()